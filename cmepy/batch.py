@@ -0,0 +1,225 @@
+"""
+Runs ensembles of independent CME solves in parallel, using a process pool.
+
+Each solve is described by a set of parameters, which are passed either to a
+model factory, or as the reaction coefficients of a parameter sweep (see
+``cmepy.sweep``). Read-only arrays common to all solves, such as the domain
+states or the matrix structure of a sweep, are placed in shared memory
+before the worker processes are started, so they are neither pickled nor
+copied for each solve. Results are yielded as each solve completes.
+"""
+
+import copy
+import ctypes
+import multiprocessing
+
+import numpy
+
+import cmepy.recorder
+import cmepy.solver
+from cmepy.statistics import Distribution
+
+# state of the current worker process, set by _initialise_worker. Solves
+# run within the calling process are passed their own settings instead.
+_worker = {}
+
+def shared_array(array):
+    """
+    shared_array(array) -> shared_copy
+
+    Returns a copy of the array, backed by shared memory that is inherited,
+    without copying, by subsequently started worker processes.
+    """
+    array = numpy.ascontiguousarray(array)
+    raw = multiprocessing.RawArray(ctypes.c_char, max(array.nbytes, 1))
+    shared = numpy.frombuffer(raw, dtype=array.dtype, count=array.size)
+    shared = numpy.reshape(shared, array.shape)
+    shared[...] = array
+    return shared
+
+def run(model_factory,
+        parameters,
+        time_steps,
+        sink=False,
+        domain_states=None,
+        targets=None,
+        statistics=('expectation', ),
+        processes=None,
+        **solver_args):
+    """
+    Solves the CME of the model returned by model_factory for each set of
+    parameters, using a pool of worker processes.
+
+    Returns an iterator yielding pairs (index, result) as each solve
+    completes, where index is the position of the parameters in the sequence
+    parameters, and result is a mapping, described below.
+
+    Arguments:
+
+     * ``model_factory`` : function returning a model for a set of
+       parameters. Parameters given as a mapping are passed as keyword
+       arguments, parameters given as a tuple are passed as positional
+       arguments, while any other parameters are passed as a single argument.
+     * ``parameters`` : sequence of sets of parameters
+     * ``time_steps`` : sequence of times at which results are recorded
+     * ``sink`` : see ``cmepy.solver.create``
+     * ``domain_states`` : (optional) array of states in the domain, shared
+       by all solves. See ``cmepy.solver.create``.
+     * ``targets`` : (optional) sequence of recorder targets, each of the
+       form (variables [, transforms]), see ``cmepy.recorder.create``.
+     * ``statistics`` : sequence of names of the statistics to record,
+       defaults to ('expectation', ).
+     * ``processes`` : (optional) number of worker processes, defaults to
+       the number of cpus. If processes is 1, solves are run sequentially
+       within the calling process.
+
+    Any remaining keyword arguments are passed to ``cmepy.solver.create``.
+
+    Each result maps 't' to the array of recorded times, and 'p_sink' to the
+    array of sink probabilities, if sink is True. If targets are given, each
+    pair (variable, statistic) is mapped to the array of values of the
+    statistic of that variable over time, otherwise each statistic is mapped
+    to the list of its values for the full distribution over time.
+    """
+    if domain_states is not None:
+        domain_states = shared_array(domain_states)
+    settings = {
+        'model_factory' : model_factory,
+        'domain_states' : domain_states,
+        'sink' : sink,
+        'solver_args' : solver_args,
+    }
+    return _run(settings, parameters, time_steps, targets, statistics,
+                processes)
+
+def run_sweep(sweep,
+              coefficient_sets,
+              time_steps,
+              targets=None,
+              statistics=('expectation', ),
+              processes=None,
+              **solver_args):
+    """
+    Solves the CME of the ParameterSweep sweep for each sequence of
+    coefficients in coefficient_sets, using a pool of worker processes.
+
+    The matrix structure of the sweep is placed in shared memory, and is
+    shared by all worker processes. Any remaining keyword arguments, such as
+    p_0, are passed to ``ParameterSweep.solver``. See ``run`` for details of
+    the remaining arguments and of the results.
+    """
+    shared_sweep = copy.copy(sweep)
+    shared_sweep.indptr = shared_array(sweep.indptr)
+    shared_sweep.indices = shared_array(sweep.indices)
+    shared_sweep.data = shared_array(sweep.data)
+    settings = {
+        'sweep' : shared_sweep,
+        'sink' : sweep.sink,
+        'solver_args' : solver_args,
+    }
+    return _run(settings, coefficient_sets, time_steps, targets, statistics,
+                processes)
+
+def _run(settings, parameters, time_steps, targets, statistics, processes):
+    """
+    Returns iterator over (index, result) pairs of the solves
+    """
+    settings = dict(settings)
+    settings['time_steps'] = list(time_steps)
+    settings['targets'] = targets
+    settings['statistics'] = tuple(statistics)
+    tasks = list(enumerate(parameters))
+
+    if processes == 1:
+        return (_solve(task, settings) for task in tasks)
+    return _imap_unordered(settings, tasks, processes)
+
+def _imap_unordered(settings, tasks, processes):
+    """
+    Yields the results of the solves from a process pool as they complete
+    """
+    pool = multiprocessing.Pool(processes,
+                                initializer = _initialise_worker,
+                                initargs = (settings, ))
+    try:
+        for result in pool.imap_unordered(_solve, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _initialise_worker(settings):
+    """
+    Stores the settings shared by all solves of the worker process
+    """
+    _worker.clear()
+    _worker.update(settings)
+
+def _call(function, parameters):
+    """
+    Calls function with the given parameters, see run
+    """
+    if isinstance(parameters, dict):
+        return function(**parameters)
+    if isinstance(parameters, tuple):
+        return function(*parameters)
+    return function(parameters)
+
+def _create_solver(parameters, settings):
+    """
+    Returns a solver for the given parameters, using the given settings
+    """
+    solver_args = settings['solver_args']
+    if 'sweep' in settings:
+        return settings['sweep'].solver(parameters, **solver_args)
+    model = _call(settings['model_factory'], parameters)
+    if settings['domain_states'] is not None:
+        solver_args = dict(solver_args)
+        solver_args['domain_states'] = settings['domain_states']
+    return cmepy.solver.create(model, settings['sink'], **solver_args)
+
+def _solve(task, settings=None):
+    """
+    Solves the CME for a single task, returning (index, result), using the
+    given settings, or the settings of the worker process by default
+    """
+    if settings is None:
+        settings = _worker
+    index, parameters = task
+    sink = settings['sink']
+    targets = settings['targets']
+    statistics = settings['statistics']
+
+    solver = _create_solver(parameters, settings)
+    if targets is not None:
+        recorder = cmepy.recorder.create(*targets)
+    result = {'t' : numpy.array(settings['time_steps'])}
+    values = dict((statistic, []) for statistic in statistics)
+    p_sinks = []
+    for t in settings['time_steps']:
+        solver.step(t)
+        if sink:
+            p, p_sink = solver.y
+            p_sinks.append(p_sink)
+        else:
+            p = solver.y
+        if targets is not None:
+            recorder.write(t, p)
+        else:
+            p = Distribution(p)
+            for statistic in statistics:
+                values[statistic].append(p.statistics[statistic]())
+
+    if sink:
+        result['p_sink'] = numpy.array(p_sinks)
+    if targets is not None:
+        for target in targets:
+            for variable in target[0]:
+                measurement = recorder[variable]
+                for statistic in statistics:
+                    result[(variable, statistic)] = \
+                        measurement.get_statistic(statistic)
+    else:
+        result.update(values)
+    return index, result
@@ -0,0 +1,93 @@
+"""
+Reads and writes solver checkpoints as numpy .npz archives.
+"""
+
+import struct
+import zipfile
+import numpy
+import numpy.lib.format
+
+def write(filename, arrays, compressed=True):
+    """
+    write(filename, arrays [, compressed])
+
+    Writes the arrays stored in the mapping ``arrays`` to the .npz archive
+    ``filename``, keyed by their names in the mapping.
+
+    If ``compressed`` is set to False, the archive is not compressed, which
+    allows its arrays to be memory-mapped when they are read.
+    """
+    arrays = dict((str(k), numpy.asarray(v)) for (k, v) in arrays.iteritems())
+    if compressed:
+        numpy.savez_compressed(filename, **arrays)
+    else:
+        numpy.savez(filename, **arrays)
+
+def read(filename, mmap_mode=None):
+    """
+    read(filename [, mmap_mode]) -> arrays
+
+    Returns a dictionary of the arrays stored in the .npz archive
+    ``filename``, keyed by name.
+
+    If ``mmap_mode`` is given, arrays stored without compression are
+    memory-mapped using the given mode (see ``numpy.memmap``), instead of
+    being read into memory. Compressed arrays are always read into memory.
+    """
+    arrays = {}
+    archive = numpy.load(filename)
+    try:
+        members = dict((name[:-len('.npy')], name)
+                       for name in archive.zip.namelist()
+                       if name.endswith('.npy'))
+        for key, member in members.iteritems():
+            info = archive.zip.getinfo(member)
+            if (mmap_mode is not None) and \
+               (info.compress_type == zipfile.ZIP_STORED):
+                arrays[key] = _memmap_member(filename, info, mmap_mode)
+            else:
+                arrays[key] = archive[key]
+    finally:
+        archive.close()
+    return arrays
+
+def _memmap_member(filename, info, mmap_mode):
+    """
+    _memmap_member(filename, info, mmap_mode) -> memmap
+
+    Returns memory-map of the uncompressed .npy archive member described by
+    the zipfile.ZipInfo instance ``info``.
+    """
+    f = open(filename, 'rb')
+    try:
+        # skip the zip local file header, which has a fixed length part of
+        # 30 bytes followed by the variable length name and extra fields
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = numpy.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            header = numpy.lib.format.read_array_header_2_0(f)
+        else:
+            # format 3.0 (utf8 encoded) headers have no public reader, and
+            # are only written for structured dtypes with unicode names
+            lament = 'unsupported .npy format version %d.%d'
+            raise ValueError(lament % version)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    finally:
+        f.close()
+    if dtype.hasobject:
+        raise ValueError('cannot memory-map arrays of objects')
+    if numpy.multiply.reduce(shape) == 0:
+        return numpy.zeros(shape, dtype=dtype)
+    order = 'F' if fortran_order else 'C'
+    return numpy.memmap(filename,
+                        dtype=dtype,
+                        mode=mmap_mode,
+                        offset=offset,
+                        shape=shape,
+                        order=order)
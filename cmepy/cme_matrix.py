@@ -7,6 +7,7 @@ import itertools
 import numpy
 import scipy.sparse
 from cmepy import model as mdl
+from cmepy import lexarrayset, state_enum
 
 def compute_propensity(prop, states):
     """
@@ -14,6 +15,98 @@ def compute_propensity(prop, states):
     """
     return prop(*states)
 
+def compute_propensities(props, states):
+    """
+    Returns array of the propensities ``props`` evaluated over ``states``,
+    where the r-th row holds the values of the r-th propensity.
+    
+    If the propensities are the reactions of a single batch of mass-action
+    propensities, they are evaluated together in one vectorised operation.
+    """
+    tables = set(getattr(prop, 'table', None) for prop in props)
+    if len(tables) == 1 and (None not in tables):
+        table = tables.pop()
+        indices = [prop.index for prop in props]
+        return table(*states)[indices]
+    values = numpy.zeros((len(props), numpy.size(states, 1)))
+    for (r, prop) in enumerate(props):
+        values[r] = compute_propensity(prop, states)
+    return values
+
+def create_propensity_cache(model):
+    """
+    create_propensity_cache(model) -> PropensityCache instance
+    
+    Returns an empty cache of the propensities of the given model.
+    """
+    return PropensityCache(model.propensities)
+
+class PropensityCache(object):
+    """
+    Cache of propensity values, keyed by state and reaction index.
+    
+    The cache maintains an enumeration of the states it has seen, with the
+    values of all propensities at the state with index i stored in the i-th
+    column of the array ``values``. Evaluating the propensities over a set of
+    states only calls the propensity functions for states not yet cached.
+    """
+    def __init__(self, propensities):
+        """
+        Creates an empty cache for the given sequence of propensities
+        """
+        self.propensities = propensities
+        self.states_enum = None
+        self.values = None
+    
+    @property
+    def size(self):
+        """
+        *Read only* property returning the number of cached states
+        """
+        if self.states_enum is None:
+            return 0
+        return self.states_enum.size
+    
+    def evaluate(self, states):
+        """
+        evaluate(states) -> values
+        
+        Returns array of the propensities evaluated over the states in the
+        array states, where the r-th row holds the values of the r-th
+        propensity, as for compute_propensities.
+        """
+        states = numpy.asarray(states)
+        if self.states_enum is None:
+            self.states_enum = state_enum.create(states)
+            self.values = compute_propensities(
+                self.propensities,
+                self.states_enum.unordered_states
+            )
+        else:
+            new_states = states[:, numpy.logical_not(
+                self.states_enum.contains(states)
+            )]
+            if numpy.size(new_states) > 0:
+                new_states = lexarrayset.unique(new_states)
+                self.states_enum.extend(new_states)
+                self.values = numpy.hstack((
+                    self.values,
+                    compute_propensities(self.propensities, new_states)
+                ))
+        return self.values[:, self.states_enum.indices(states)]
+    
+    def retain(self, states):
+        """
+        Discards cached values of all states not in the array states.
+        """
+        if self.states_enum is None:
+            return
+        cached_states = self.states_enum.unordered_states
+        keep = lexarrayset.nonunique_member(cached_states,
+                                            numpy.asarray(states))
+        self.states_enum = state_enum.create_ordered(cached_states[:, keep])
+        self.values = self.values[:, keep]
+
 def optimise_csr_matrix(csr_matrix):
     """    
     Performs **in place** operations to optimise csr matrix data. Returns None.
@@ -36,7 +129,8 @@ def gen_reaction_matrices(model,
                           domain_enum,
                           sink,
                           validity_test,
-                          outflow=False):
+                          outflow=False,
+                          propensity_cache=None):
     """
     Returns generator yielding the sparse matrices for each reaction term.
     
@@ -60,6 +154,9 @@ def gen_reaction_matrices(model,
        ``state_array`` that are valid.
         
        See: non_neg_states(state_array)
+     * ``propensity_cache`` : (optional) :class:`PropensityCache` instance
+       for the propensities of the model. If given, propensities are only
+       evaluated for domain states not already present in the cache.
     
     """
     
@@ -76,12 +173,20 @@ def gen_reaction_matrices(model,
     
     propensities = model.propensities
     transitions = model.transitions
-    reactions = itertools.izip(propensities, transitions)
     
     src_states = numpy.array(domain_enum.ordered_states)
     src_indices = domain_enum.indices(src_states)
     
-    for (propensity, transition) in reactions:
+    # evaluate the propensities of all reactions over the domain at once
+    if propensity_cache is None:
+        src_coefficients = compute_propensities(propensities, src_states)
+    else:
+        if len(propensity_cache.propensities) != len(propensities):
+            raise ValueError('propensity_cache does not match the model')
+        src_coefficients = propensity_cache.evaluate(src_states)
+    reactions = itertools.izip(src_coefficients, transitions)
+    
+    for (coefficients, transition) in reactions:
         
         # compute destination states for this transition
         transition = numpy.asarray(transition)[:, numpy.newaxis]
@@ -109,12 +214,10 @@ def gen_reaction_matrices(model,
         # interior states of the truncated domain
         
         if num_int_states > 0:
-            int_src_states = numpy.array(src_states[:, interior])
             int_src_indices = numpy.array(src_indices[interior])
             int_dst_states = numpy.array(dst_states[:, interior])
             int_dst_indices = domain_enum.indices(int_dst_states)
-            int_coefficients = compute_propensity(propensity,
-                                                  int_src_states)            
+            int_coefficients = coefficients[interior]
             
             # flux out
             data.append(-int_coefficients)
@@ -131,9 +234,7 @@ def gen_reaction_matrices(model,
             
             if num_valid_states > 0:
                 ext_src_indices = numpy.array(src_indices[exterior][valid])
-                ext_src_states = numpy.array(src_states[:, exterior][:, valid])
-                ext_coefficients = compute_propensity(propensity,
-                                                      ext_src_states)
+                ext_coefficients = coefficients[exterior][valid]
                 
                 # these terms account for the flux out of the truncated domain
                 data.append(-ext_coefficients)
@@ -149,9 +250,7 @@ def gen_reaction_matrices(model,
             
             if num_valid_states > 0:
                 ext_src_indices = numpy.array(src_indices[exterior][valid])
-                ext_src_states = numpy.array(src_states[:, exterior][:, valid])
-                ext_coefficients = compute_propensity(propensity,
-                                                      ext_src_states)
+                ext_coefficients = coefficients[exterior][valid]
                 
                 shape = numpy.shape(ext_src_indices)
                 ext_dst_indices = sink_index * numpy.ones(shape,
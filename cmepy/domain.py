@@ -4,6 +4,7 @@ Utility functions for generating arrays of states in domains
 
 import numpy
 import cmepy.util
+import cmepy.lexarrayset
 
 def from_rect(shape, slices=None, origin=None):
     """
@@ -21,6 +22,76 @@ def from_rect(shape, slices=None, origin=None):
     flat_coord_arrays_shape = (len(indices), -1)
     return numpy.reshape(indices, flat_coord_arrays_shape)
 
+def from_reachable(model, max_states=None, bounds=None):
+    """
+    from_reachable(model [, max_states [, bounds]]) -> array
+    
+    Returns array of the states reachable from the initial state of 'model'.
+    
+    The states are found by a breadth-first exploration along the model's
+    transitions, starting from 'model.initial_state'. A transition is only
+    followed from a state if the propensity of the corresponding reaction
+    is positive at that state, so states that can never be reached are
+    excluded, for instance, those violating a conservation law.
+    
+    Only states with non-negative coordinates that lie within the
+    rectangle 'bounds' are explored. If 'bounds' is not given, the 'shape'
+    entry of the model is used, if present. If 'max_states' is given,
+    exploration stops once 'max_states' states have been found, keeping
+    only part of the final breadth-first level as required.
+    
+    A ValueError is raised if both 'bounds' and 'max_states' are unspecified
+    and the model has no 'shape' entry, as the reachable states may then be
+    unbounded.
+    """
+    
+    if bounds is None:
+        bounds = model.get('shape', None)
+    if (bounds is None) and (max_states is None):
+        lament = 'reachable states unbounded: specify bounds or max_states'
+        raise ValueError(lament)
+    if (max_states is not None) and (max_states < 1):
+        raise ValueError('max_states must be positive')
+    
+    def valid(states):
+        """
+        returns flags for states that are non-negative and within bounds
+        """
+        flags = numpy.logical_and.reduce(states >= 0, axis=0)
+        if bounds is not None:
+            upper = numpy.asarray(bounds)[:, numpy.newaxis]
+            flags = numpy.logical_and(
+                flags,
+                numpy.logical_and.reduce(states < upper, axis=0)
+            )
+        return flags
+    
+    initial_states = numpy.asarray(model.initial_state)[:, numpy.newaxis]
+    if not valid(initial_states)[0]:
+        raise ValueError('initial state lies outside of bounds')
+    reactions = zip(model.propensities, model.transitions)
+    
+    reached = initial_states
+    frontier = initial_states
+    while numpy.size(frontier, 1) > 0:
+        successors = [numpy.zeros((numpy.size(frontier, 0), 0),
+                                  dtype=frontier.dtype)]
+        for (propensity, transition) in reactions:
+            active = propensity(*frontier) > 0.0
+            dst_states = cmepy.lexarrayset.shift(frontier[:, active],
+                                                 transition)
+            successors.append(dst_states[:, valid(dst_states)])
+        frontier = cmepy.lexarrayset.difference(
+            cmepy.lexarrayset.unique(numpy.hstack(successors)),
+            reached
+        )
+        if max_states is not None:
+            room = max_states - numpy.size(reached, 1)
+            if numpy.size(frontier, 1) >= room:
+                return cmepy.lexarrayset.union(reached, frontier[:, :room])
+        reached = cmepy.lexarrayset.union(reached, frontier)
+    return reached
+
 def from_iter(state_iter):
     """
     from_iter(state_iter) -> array
@@ -0,0 +1,150 @@
+"""
+A probability-flux prioritised domain expansion routine for the FSP algorithm.
+"""
+
+import numpy
+import cmepy.domain
+import cmepy.lexarrayset
+from cmepy.cme_matrix import compute_propensity, non_neg_states
+
+class PriorityExpander(object):
+    """
+    An FSP expander that adds the boundary states receiving the most flux.
+
+    Each candidate state outside the domain is ranked by the probability
+    flux it would receive from the current solution, that is, the sum of
+    propensity times source probability over all reactions leading into
+    the candidate. Candidates are added in order of decreasing flux until
+    the captured flux meets the given fraction of the total outflow.
+    """
+    def __init__(self,
+                 model,
+                 fraction,
+                 max_states=None,
+                 time_dependencies=None,
+                 validity_test=None):
+        """
+        An FSP expander that adds the boundary states receiving the most flux.
+
+        Arguments:
+
+         * ``model`` : the CME model, used for its propensities and
+           transitions
+         * ``fraction`` : fraction of the predicted outflow of probability
+           from the domain that the added states must capture, where
+           0.0 < fraction <= 1.0
+         * ``max_states`` : (optional) upper bound on the number of states
+           added by a single expansion
+         * ``time_dependencies`` : (optional) time dependencies of the
+           propensities, in the form accepted by ``cmepy.solver.create``.
+           If given, fluxes are scaled by the coefficients at the time of
+           expansion.
+         * ``validity_test`` : (optional) filter for candidate states.
+           By default, only states without a negative coordinate are valid.
+        """
+        if not (0.0 < fraction <= 1.0):
+            lament = 'fraction must be within range: 0.0 < fraction <= 1.0'
+            raise ValueError(lament)
+        if (max_states is not None) and (max_states < 1):
+            raise ValueError('max_states must be positive')
+        if validity_test is None:
+            validity_test = non_neg_states
+        self.propensities = model.propensities
+        self.transitions = model.transitions
+        self.fraction = fraction
+        self.max_states = max_states
+        self.time_dependencies = time_dependencies
+        self.validity_test = validity_test
+
+    def _coefficients(self, t):
+        """
+        Returns list of time dependent coefficients of each reaction at time t
+        
+        Raises ValueError if t is None, unless there are no time dependencies.
+        """
+        coefficients = [1.0]*len(self.propensities)
+        if self.time_dependencies:
+            if t is None:
+                lament = 't must be given if there are time dependencies'
+                raise ValueError(lament)
+            for reaction_subset, phi in self.time_dependencies.iteritems():
+                phi_t = phi(t)
+                for i in reaction_subset:
+                    coefficients[i] = phi_t
+        return coefficients
+
+    def fluxes(self, domain_states, p, t=None):
+        """
+        fluxes(domain_states, p [, t]) -> candidate_states, flux
+
+        Returns the unique candidate states outside of the domain that may be
+        reached in one transition from the support of p, together with the
+        net probability flux each candidate would receive.
+        
+        The time t must be given if the expander has time dependencies.
+        """
+        src_states, src_probability = cmepy.domain.from_mapping(p)
+        support = src_probability > 0.0
+        src_states = src_states[:, support]
+        src_probability = src_probability[support]
+
+        dim = numpy.size(domain_states, 0)
+        candidates = [numpy.zeros((dim, 0), dtype=numpy.int)]
+        candidate_flux = [numpy.zeros((0, ))]
+        if numpy.size(src_probability) > 0:
+            reactions = zip(self.propensities,
+                            self.transitions,
+                            self._coefficients(t))
+            for (propensity, transition, coefficient) in reactions:
+                if coefficient == 0.0:
+                    continue
+                dst_states = cmepy.lexarrayset.shift(src_states, transition)
+                exterior = numpy.logical_and(
+                    self.validity_test(dst_states),
+                    numpy.logical_not(
+                        cmepy.lexarrayset.nonunique_member(dst_states,
+                                                           domain_states)
+                    )
+                )
+                if not numpy.any(exterior):
+                    continue
+                flux = coefficient * src_probability[exterior] * \
+                    compute_propensity(propensity, src_states[:, exterior])
+                candidates.append(dst_states[:, exterior])
+                candidate_flux.append(flux)
+
+        candidates = numpy.hstack(candidates)
+        candidate_flux = numpy.concatenate(candidate_flux)
+        if numpy.size(candidate_flux) == 0:
+            return candidates, candidate_flux
+        unique_candidates, inverse = cmepy.lexarrayset.unique(
+            candidates,
+            return_inverse=True
+        )
+        flux = numpy.bincount(inverse, weights=candidate_flux)
+        positive = flux > 0.0
+        return unique_candidates[:, positive], flux[positive]
+
+    def expand(self, **kwargs):
+        """
+        Returns expanded domain states
+        """
+        domain_states = kwargs['domain_states']
+        candidates, flux = self.fluxes(domain_states,
+                                       kwargs['p'],
+                                       kwargs.get('t', None))
+        if numpy.size(flux) == 0:
+            return domain_states
+
+        # add candidates in order of decreasing flux, until enough
+        # of the total outflow is captured
+        order = numpy.argsort(-flux)
+        captured = numpy.add.accumulate(flux[order])
+        budget = self.fraction * captured[-1]
+        count = numpy.searchsorted(captured, budget) + 1
+        count = min(count, numpy.size(order))
+        if self.max_states is not None:
+            count = min(count, self.max_states)
+
+        return cmepy.lexarrayset.union(domain_states,
+                                       candidates[:, order[:count]])
@@ -0,0 +1,226 @@
+"""
+A sliding-window variant of FSP, with a bounded number of domain states.
+"""
+
+import numpy
+import cmepy.checkpoint
+import cmepy.restorable_solver
+import cmepy.lexarrayset
+from cmepy.fsp.solver import FspSolver, ExpansionFailureError, \
+     checkpoint_components, default_propensity_cache
+
+def create(model, domain_states, domain_expander, max_states, **kwargs):
+    """
+    Returns a sliding-window FSP based CME solver.
+
+    This behaves like the solver returned by ``cmepy.fsp.solver.create``,
+    except the domain never contains more than ``max_states`` states.
+    Whenever an expansion of the domain would exceed this bound, the
+    trailing states of the domain, that is, the states with the least
+    probability, are pruned to make room for the newly added states. The
+    probability of the pruned states is moved into the sink, so the sink
+    probability of the solver continues to bound the total error of the
+    solution.
+
+    See the documentation of ``cmepy.fsp.solver.create`` for details of the
+    remaining arguments, and of the propensity cache created by default.
+    """
+
+    kwargs['domain_states'] = domain_states
+    default_propensity_cache(model, kwargs)
+
+    return SlidingWindowFspSolver(
+        cmepy.restorable_solver.create(
+            model,
+            sink = True,
+            **kwargs
+        ),
+        domain_states,
+        domain_expander,
+        max_states
+    )
+
+def load(filename, model, domain_expander=None, mmap_mode=None, **kwargs):
+    """
+    Returns a sliding-window FSP solver restored from the checkpoint
+    ``filename`` written by ``SlidingWindowFspSolver.save``.
+    
+    See the documentation of ``cmepy.fsp.solver.load`` for details of the
+    arguments.
+    """
+    arrays = cmepy.checkpoint.read(filename, mmap_mode)
+    restorable_solver, domain_states, domain_expander = checkpoint_components(
+        arrays,
+        model,
+        domain_expander,
+        **kwargs
+    )
+    fsp_solver = SlidingWindowFspSolver(
+        restorable_solver,
+        domain_states,
+        domain_expander,
+        int(arrays['max_states'])
+    )
+    fsp_solver.pruned_error = float(arrays['pruned_error'])
+    return fsp_solver
+
+class SlidingWindowFspSolver(FspSolver):
+    """
+    FSP solver that prunes trailing states to bound the size of the domain.
+    """
+    def __init__(self,
+                 restorable_solver,
+                 initial_domain,
+                 domain_expander,
+                 max_states):
+        """
+        Creates a SlidingWindowFspSolver for given solver, domain,
+        domain_expander and maximum number of domain states.
+        """
+        if numpy.size(initial_domain, 1) > max_states:
+            raise ValueError('initial domain has more than max_states states')
+        FspSolver.__init__(self,
+                           restorable_solver,
+                           initial_domain,
+                           domain_expander)
+        self.max_states = max_states
+        self.pruned_error = 0.0
+
+    def trailing_states(self, expanded_states):
+        """
+        Returns the array of the states to prune from expanded_states, so it
+        has at most max_states states, or None if no states must be pruned.
+
+        Only states of the current domain are pruned, in order of increasing
+        probability, where the probability of a state is taken to be the larger
+        of its probability at the restore point and its probability in the
+        current solution. The solver is not modified.
+        """
+        excess = numpy.size(expanded_states, 1) - self.max_states
+        if excess <= 0:
+            return None
+
+        if excess > numpy.size(self.domain_states, 1):
+            lament = 'expansion added more than max_states new states'
+            raise ExpansionFailureError(lament)
+
+        probability = numpy.maximum(
+            self.solver.restore_point_probability(self.domain_states),
+            self.solver.probability(self.domain_states)
+        )
+        trailing = numpy.argsort(probability, kind='mergesort')[:excess]
+        return self.domain_states[:, trailing]
+
+    def prune(self, expanded_states, pruned_states=None):
+        """
+        Returns expanded_states pruned to at most max_states states.
+
+        The pruned states are the given array pruned_states, which defaults
+        to the trailing states, see trailing_states. The probability of the
+        pruned states at the restore point is discarded into the sink.
+        """
+        if pruned_states is None:
+            pruned_states = self.trailing_states(expanded_states)
+            if pruned_states is None:
+                return expanded_states
+
+        self.pruned_error += self.solver.discard(pruned_states)
+        pruned_domain = cmepy.lexarrayset.difference(expanded_states,
+                                                     pruned_states)
+        # keep the propensity cache from growing with every state visited
+        propensity_cache = self.solver.propensity_cache
+        if propensity_cache is not None:
+            propensity_cache.retain(pruned_domain)
+        return pruned_domain
+
+    def step(self, t, epsilon):
+        """
+        Advance solution to time ``t`` at the cost of at most ``epsilon`` error.
+
+        The error introduced by pruning is accumulated separately, and is
+        available via the ``pruned_error`` attribute.
+        
+        If the domain revisits a previously tried domain while advancing the
+        solution, max_states is too small for the requested epsilon, and an
+        ExpansionFailureError is raised. The solver is then restored to its
+        last restore point, over the domain it had before the step.
+        """
+        
+        # the state at the last restore point, to roll back to if the
+        # expansion fails, as pruning modifies the restore point
+        restore_args = dict(self.solver.restore_args)
+        domain_states = self.domain_states
+        pruned_error = self.pruned_error
+        
+        tried_domains = set()
+        try:
+            while True:
+                step_epsilon = self.solver.restore_point_error + epsilon
+                self.solver.step(t)
+                p_sink = self.solver.error
+                
+                if p_sink > step_epsilon:
+                    # expand domain states
+                    p, _ = self.solver.y
+                    expanded_states = self.domain_expander.expand(
+                        domain_states = self.domain_states,
+                        p = p,
+                        p_sink = p_sink,
+                        t = t
+                    )
+                    # check that expansion did in fact add some extra states
+                    number_of_states = numpy.size(self.domain_states, 1)
+                    if numpy.size(expanded_states, 1) <= number_of_states:
+                        lament = 'expansion did not increase size of domain'
+                        raise ExpansionFailureError(lament)
+                    # detect cycles before pruning modifies the restore point
+                    pruned_states = self.trailing_states(expanded_states)
+                    if pruned_states is None:
+                        pruned_domain = expanded_states
+                    else:
+                        pruned_domain = cmepy.lexarrayset.difference(
+                            expanded_states,
+                            pruned_states
+                        )
+                    domain_key = cmepy.lexarrayset.unique(
+                        pruned_domain
+                    ).tostring()
+                    if domain_key in tried_domains:
+                        lament = ('domain cycled, max_states too small for '
+                                  'epsilon')
+                        raise ExpansionFailureError(lament)
+                    tried_domains.add(domain_key)
+                    if pruned_states is not None:
+                        self.domain_states = self.prune(expanded_states,
+                                                        pruned_states)
+                    else:
+                        self.domain_states = expanded_states
+                    # restore solver to previous state, but use new domain
+                    self.solver.restore(domain_states = self.domain_states)
+                else:
+                    self.solver.set_restore_point()
+                    break
+        except ExpansionFailureError:
+            self.solver.restore_args = restore_args
+            self.domain_states = domain_states
+            self.pruned_error = pruned_error
+            self.solver.restore(domain_states = domain_states)
+            raise
+
+    def checkpoint_arrays(self):
+        """
+        Returns a mapping of the arrays used to checkpoint the current state.
+        """
+        arrays = FspSolver.checkpoint_arrays(self)
+        arrays['max_states'] = self.max_states
+        arrays['pruned_error'] = self.pruned_error
+        return arrays
+    
+    @property
+    def error(self):
+        """
+        Read-only property, returning the accumulated error of the solution.
+
+        This is the sum of the truncation error and the pruned error.
+        """
+        return self.solver.restore_point_error
@@ -3,9 +3,27 @@ An implementation of FSP with compression.
 """
 
 import numpy
+import cmepy.checkpoint
+import cmepy.cme_matrix
 import cmepy.restorable_solver
 import cmepy.domain
+import cmepy.fsp.simple_expander
+import cmepy.fsp.support_expander
 import exceptions
+
+# expanders that may be recreated from a checkpoint, with the number of
+# dimensions of each of their stored attributes
+EXPANDER_ATTRIBUTES = {
+    cmepy.fsp.simple_expander.SimpleExpander : {
+        'transitions' : 2,
+        'depth' : 0,
+    },
+    cmepy.fsp.support_expander.SupportExpander : {
+        'transitions' : 2,
+        'depth' : 0,
+        'epsilon' : 0,
+    },
+}
         
 def create(model, domain_states, domain_expander, **kwargs):
     """
@@ -38,9 +56,15 @@ def create(model, domain_states, domain_expander, **kwargs):
     treated in the same way as keyword arguments passed to the
     ``cmepy.solver.create`` function. Please refer to the documentation for
     the ``cmepy.solver.create`` function for additional details.
+    
+    Since the solver is restored onto each expanded domain, a propensity
+    cache is created for the model by default, see
+    ``default_propensity_cache``, so that only the propensities of the new
+    states are evaluated on each expansion.
     """
     
     kwargs['domain_states'] = domain_states
+    default_propensity_cache(model, kwargs)
     
     return FspSolver(
         cmepy.restorable_solver.create(
@@ -52,6 +76,130 @@ def create(model, domain_states, domain_expander, **kwargs):
         domain_expander
     )
 
+def load(filename, model, domain_expander=None, mmap_mode=None, **kwargs):
+    """
+    Returns a FSP based CME solver restored from the checkpoint ``filename``
+    written by ``FspSolver.save``.
+    
+    The solution, time, truncation error and domain states are read from the
+    checkpoint. If ``domain_expander`` is not given, the expander is recreated
+    from the configuration stored in the checkpoint. This is only possible for
+    the expanders of ``cmepy.fsp`` listed in ``EXPANDER_ATTRIBUTES``, if all
+    their attributes could be stored, otherwise a ValueError is raised and the
+    ``domain_expander`` argument must be supplied.
+    
+    Any additional keyword arguments that cannot be stored in the checkpoint,
+    such as ``time_dependencies``, must be supplied again, as for ``create``.
+    
+    If ``mmap_mode`` is given, arrays stored in an uncompressed checkpoint
+    are memory-mapped using that mode while loading.
+    """
+    arrays = cmepy.checkpoint.read(filename, mmap_mode)
+    return FspSolver(
+        *checkpoint_components(arrays, model, domain_expander, **kwargs)
+    )
+
+def default_propensity_cache(model, kwargs):
+    """
+    default_propensity_cache(model, kwargs) -> None
+    
+    Adds a new propensity cache for the model to the solver arguments kwargs,
+    unless a ``propensity_cache`` argument is already given, or the solver
+    arguments do not support caching propensities, as for ``reduced``
+    solvers. Pass ``propensity_cache = None`` to disable the cache.
+    """
+    if kwargs.get('reduced', False) or kwargs.get('tensor_train', False):
+        return
+    kwargs.setdefault('propensity_cache',
+                      cmepy.cme_matrix.create_propensity_cache(model))
+
+def checkpoint_components(arrays, model, domain_expander=None, **kwargs):
+    """
+    checkpoint_components(arrays, model [, domain_expander])
+        -> restorable_solver, domain_states, domain_expander
+    
+    Returns the components of a FSP solver stored in the checkpoint arrays.
+    """
+    if domain_expander is None:
+        domain_expander = create_expander(arrays)
+    kwargs.update(cmepy.restorable_solver.checkpoint_solver_args(arrays))
+    default_propensity_cache(model, kwargs)
+    restorable_solver = cmepy.restorable_solver.create(
+        model,
+        sink = True,
+        **kwargs
+    )
+    return restorable_solver, kwargs['domain_states'], domain_expander
+
+def expander_arrays(domain_expander):
+    """
+    expander_arrays(domain_expander) -> arrays
+    
+    Returns mapping of arrays storing the configuration of the expander.
+    
+    The class of the expander is stored under the key 'expander', while each
+    attribute of the expander that can be stored as a numeric array is stored
+    under the key 'expander.' + attribute name. The names of the remaining
+    attributes are stored under the key 'expander_unsaved'.
+    """
+    expander_class = type(domain_expander)
+    arrays = {
+        'expander' : '%s.%s' % (expander_class.__module__,
+                                expander_class.__name__),
+    }
+    unsaved = []
+    for name, value in vars(domain_expander).iteritems():
+        value = numpy.asarray(value)
+        if value.dtype.hasobject:
+            unsaved.append(name)
+        else:
+            arrays['expander.' + name] = value
+    arrays['expander_unsaved'] = numpy.array(sorted(unsaved), dtype=str)
+    return arrays
+
+def create_expander(arrays):
+    """
+    create_expander(arrays) -> domain_expander
+    
+    Returns expander created from the configuration stored in the arrays,
+    see ``expander_arrays``.
+    
+    Only the expander classes in ``EXPANDER_ATTRIBUTES`` are created, from
+    numeric attributes of the expected dimensions, otherwise a ValueError is
+    raised.
+    """
+    unsaved = list(arrays['expander_unsaved'])
+    if unsaved:
+        lament = 'expander attributes not stored in checkpoint: %s'
+        raise ValueError(lament % ', '.join(unsaved))
+    expander_name = str(arrays['expander'])
+    for expander_class, dimensions in EXPANDER_ATTRIBUTES.iteritems():
+        if expander_name == '%s.%s' % (expander_class.__module__,
+                                       expander_class.__name__):
+            break
+    else:
+        lament = 'cannot recreate expander %s from checkpoint'
+        raise ValueError(lament % expander_name)
+    prefix = 'expander.'
+    attributes = dict((key[len(prefix):], value)
+                      for key, value in arrays.iteritems()
+                      if key.startswith(prefix))
+    if set(attributes) != set(dimensions):
+        lament = 'checkpoint stores attributes %s, expected %s for %s'
+        raise ValueError(lament % (', '.join(sorted(attributes)),
+                                   ', '.join(sorted(dimensions)),
+                                   expander_name))
+    for name, value in attributes.items():
+        if numpy.asarray(value).dtype.kind not in 'biuf' or \
+           numpy.ndim(value) != dimensions[name]:
+            lament = 'invalid expander attribute %s in checkpoint'
+            raise ValueError(lament % name)
+        if numpy.ndim(value) == 0:
+            attributes[name] = value.item()
+        else:
+            attributes[name] = numpy.array(value)
+    return expander_class(**attributes)
+
 class ExpansionFailureError(exceptions.StandardError):
     """
     Exception raised if a failure occurs while expanding the domain states.
@@ -87,10 +235,11 @@ class FspSolver(object):
         
         while True:
             self.solver.step(t)
-            p, p_sink = self.solver.y
+            p_sink = self.solver.error
             
             if p_sink > step_epsilon:
                 # expand domain states
+                p, _ = self.solver.y
                 self.domain_states = self.domain_expander.expand(
                     domain_states = self.domain_states,
                     p = p,
@@ -107,6 +256,26 @@ class FspSolver(object):
                 self.solver.set_restore_point()
                 break
     
+    def checkpoint_arrays(self):
+        """
+        Returns a mapping of the arrays used to checkpoint the current state.
+        """
+        arrays = self.solver.checkpoint_arrays()
+        arrays.update(expander_arrays(self.domain_expander))
+        return arrays
+    
+    def save(self, filename, compressed=True):
+        """
+        Saves the current state of the solver to the checkpoint ``filename``.
+        
+        The checkpoint stores the current solution, time, truncation error,
+        domain states and expander configuration, and may be loaded using
+        ``cmepy.fsp.solver.load``. If ``compressed`` is set to False, the
+        checkpoint is not compressed, which allows it to be memory-mapped
+        while loading.
+        """
+        cmepy.checkpoint.write(filename, self.checkpoint_arrays(), compressed)
+    
     @property
     def y(self):
         """
@@ -5,6 +5,7 @@ A solution-support based domain expansion routine for the FSP algorithm.
 import cmepy.domain
 import cmepy.fsp.util
 import cmepy.lexarrayset
+import cmepy.statistics
 
 class SupportExpander(object):
     """
@@ -31,9 +32,14 @@ class SupportExpander(object):
     def expand(self, **kwargs):
         """
         Returns expanded domain states
+        
+        The solution p may be given either as a mapping, or as a pair of
+        arrays (states, values).
         """
         p = kwargs['p']
-        support = cmepy.domain.from_iter(p.compress(self.epsilon))
+        if type(p) is not tuple:
+            p = cmepy.domain.from_mapping(p)
+        support, _ = cmepy.statistics.compress(p, self.epsilon)
         expanded_support = cmepy.fsp.util.grow_domain(
             support,
             self.transitions,
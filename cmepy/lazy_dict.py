@@ -42,37 +42,129 @@ class LazyDict(dict):
     Observe how the value stored in the :class:`LazyDict` under the key ``k``
     is first updated, using the provided function,
     with the updated value then being the one returned.
+    
+    The optional ``update_values`` argument is a function of the form:
+    
+        update_values(items) -> updated_values
+    
+    where ``items`` is a list of ``(k, existing_value)`` pairs of keys stored
+    in the :class:`LazyDict`, and ``updated_values`` is the list of their
+    updated values, in the same order. If specified, it is used to update
+    all the values at once whenever they are all read, for instance by
+    ``values`` or ``iteritems``, or by ``update_all``.
+    
+    If the optional ``track_dirty`` argument is True, only values that are
+    marked as dirty are updated when read. Values are marked as dirty when
+    they are stored by assignment, or by ``mark_dirty``, and are marked as
+    clean once they are updated.
     """
-    def __init__(self, update_value, items = None):
+    def __init__(self,
+                 update_value,
+                 items = None,
+                 update_values = None,
+                 track_dirty = False):
         """
         Returns a LazyDict using the specified ``update_value`` function
         and optional initial dictionary arguments.
         """
         self.update_value = update_value
+        self.update_values = update_values
+        self.track_dirty = track_dirty
         if items is None:
             dict.__init__(self)
         else:
-            dict.__init__(items)
-        
+            dict.__init__(self, items)
+        self._dirty = set(dict.iterkeys(self))
+    
     def __getitem__(self, key):
         member = dict.__contains__(self, key)
         if member:
             existing_value = dict.__getitem__(self, key)
+            if self.track_dirty and key not in self._dirty:
+                return existing_value
         else:
             existing_value = None
         # ensure measurement is up to date
         updated_value = self.update_value(key, existing_value, member)
-        self[key] = updated_value
+        dict.__setitem__(self, key, updated_value)
+        self._dirty.discard(key)
         return updated_value
     
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._dirty.add(key)
+    
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._dirty.discard(key)
+    
+    def clear(self):
+        dict.clear(self)
+        self._dirty.clear()
+    
+    def update(self, *args, **kwargs):
+        for (key, value) in dict(*args, **kwargs).iteritems():
+            self[key] = value
+    
+    def mark_dirty(self, *keys):
+        """
+        Marks the values stored under the given keys as dirty, or all the
+        values if no keys are given.
+        """
+        if not keys:
+            keys = dict.iterkeys(self)
+        self._dirty.update(key for key in keys
+                           if dict.__contains__(self, key))
+    
+    def mark_clean(self, *keys):
+        """
+        Marks the values stored under the given keys as clean, or all the
+        values if no keys are given.
+        """
+        if keys:
+            self._dirty.difference_update(keys)
+        else:
+            self._dirty.clear()
+    
+    def is_dirty(self, key):
+        """
+        Returns True if the value stored under key would be updated if read.
+        """
+        return (not self.track_dirty) or (key in self._dirty)
+    
+    def update_all(self):
+        """
+        Updates all the values that would be updated if read, using the
+        ``update_values`` function if specified.
+        """
+        keys = [k for k in dict.iterkeys(self) if self.is_dirty(k)]
+        if not keys:
+            return
+        if self.update_values is None:
+            for key in keys:
+                self.__getitem__(key)
+            return
+        items = [(k, dict.__getitem__(self, k)) for k in keys]
+        updated_values = self.update_values(items)
+        for (key, updated_value) in itertools.izip(keys, updated_values):
+            dict.__setitem__(self, key, updated_value)
+        self._dirty.difference_update(keys)
+    
     def copy(self):
-        return LazyDict(self.update_value, dict.copy(self))
+        result = LazyDict(self.update_value,
+                          dict.copy(self),
+                          self.update_values,
+                          self.track_dirty)
+        result._dirty = set(self._dirty)
+        return result
     
     def itervalues(self):
-        return itertools.imap((lambda k : self[k]), dict.iterkeys(self))
+        self.update_all()
+        return dict.itervalues(self)
     
     def iteritems(self):
-        return itertools.imap((lambda k : (k, self[k])), dict.iterkeys(self))
+        self.update_all()
+        return dict.iteritems(self)
     
     def pop(self, *args):
         n_args = len(args)
@@ -93,11 +185,10 @@ class LazyDict(dict):
                 raise KeyError(str(k))
     
     def popitem(self):
-        key, value = dict.popitem(self)
-        self[key] = value
-        updated_value = self[key]
-        del self[key]
-        return key, updated_value
+        if not dict.__len__(self):
+            raise KeyError('popitem(): dictionary is empty')
+        key = iter(dict.iterkeys(self)).next()
+        return key, self.pop(key)
     
     def setdefault(self, k, x=None):
         if k in self:
@@ -2,6 +2,67 @@
 stores marginal distributions for random variables
 """
 
+import itertools
+
+import numpy
+
+from cmepy import domain
+from cmepy.statistics import Distribution, Moments, map_arrays
+
+# names of the statistics stored by measurements, mapped to their columns
+STATISTIC_COLUMNS = {
+    'expectation' : 'expectation',
+    'expected_value' : 'expectation',
+    'variance' : 'variance',
+    'standard_deviation' : 'standard_deviation',
+    'covariance' : 'covariance',
+    'covariance_matrix' : 'covariance_matrix',
+    'correlation_matrix' : 'correlation_matrix',
+    'skewness' : 'skewness',
+    'kurtosis' : 'kurtosis',
+    'quantiles' : 'quantiles',
+}
+
+class Column(object):
+    """
+    Growable array of values of the same shape, supporting appends in
+    amortised constant time.
+    """
+    def __init__(self, shape = (), dtype = numpy.float, capacity = 16):
+        """
+        Creates an empty column of values with the given shape and dtype.
+        """
+        object.__init__(self)
+        self.shape = tuple(shape)
+        self._data = numpy.empty((capacity, ) + self.shape, dtype = dtype)
+        self._size = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def append(self, value):
+        """
+        Appends the value to the column.
+        """
+        if self._size == len(self._data):
+            data = numpy.empty((2*len(self._data) + 1, ) + self.shape,
+                               dtype = self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size] = value
+        self._size += 1
+    
+    @property
+    def array(self):
+        """
+        *Read only* property returning a read only view of the values of the
+        column, without copying. Values appended later may not be visible
+        through the view.
+        """
+        view = self._data[:self._size]
+        view.flags.writeable = False
+        return view
+
 class Measurement(object):
     """
     Stores the marginal distributions for a random variable.
@@ -11,13 +72,32 @@ class Measurement(object):
     The random variable is specified by its name and transform when
     instantiating a Measurement object.
     
-    Statistics, computed from the marginal distributions, may be accessed
-    as attributes (this access is read only and not cached, it is computed
-    each time it is accessed).
+    Statistics of the marginal distributions are computed once, as each
+    marginal distribution is written, and stored in columns, see Column.
+    Statistics may be accessed as attributes, returning arrays whose first
+    axis is time. Statistics that are not defined for the dimension of the
+    random variable, such as the variance of a random vector, are not stored.
+    The rows of the statistics of empty marginal distributions are NaN.
+    
+    The marginal distributions are stored as arrays of states and values,
+    and are only converted to Distribution instances when the
+    ``distributions`` attribute is accessed.
     """
-    def __init__(self, name = None, transform = None):
+    def __init__(self, name = None, transform = None, order = 2,
+                 quantiles = None):
         """
         Creates a measurement for the specified random variable.
+        
+        If the transform is a projection or an integer linear transform,
+        see ``cmepy.statistics.projection``, the marginal distributions are
+        computed directly from the state arrays, without evaluating the
+        transform for each state.
+        
+        The skewness and kurtosis of each coordinate of the random variable
+        are stored if order is at least 3 and 4, respectively. If a sequence
+        of probabilities is given as quantiles, the corresponding quantiles
+        of each coordinate are also stored, see
+        ``cmepy.statistics.Moments.quantiles``.
         """
         object.__init__(self)
         self.name = name
@@ -25,41 +105,157 @@ class Measurement(object):
             self.transform = lambda x : x
         else:
             self.transform = transform
-        self.times = []
-        self.distributions = []
+        self.order = max(order, 2)
+        if quantiles is not None:
+            quantiles = tuple(quantiles)
+        self.quantile_probabilities = quantiles
+        self._times = Column()
+        self.columns = None
+        self._marginals = []
     
     def __len__(self):
-        return len(self.times)
+        return len(self._times)
+    
+    @property
+    def times(self):
+        """
+        *Read only* property returning the array of the times written
+        """
+        return self._times.array
+    
+    @property
+    def distributions(self):
+        """
+        *Read only* property returning the list of the marginal distributions
+        written, as Distribution instances.
+        """
+        for (i, marginal) in enumerate(self._marginals):
+            if type(marginal) is tuple:
+                states, values = marginal
+                self._marginals[i] = Distribution(
+                    itertools.izip(domain.to_iter(states), values)
+                )
+        return self._marginals
     
     def write(self, t, p):
         """
         Writes the time t and marginal distribution derived from p.
         """
-        self.times.append(t)
-        self.distributions.append(p.map(self.transform))
+        if len(p) == 0:
+            self._append(t, None, None)
+        else:
+            states, values = domain.from_mapping(p)
+            self.write_arrays(t, states, values)
+    
+    def write_arrays(self, t, states, values):
+        """
+        Writes the time t and marginal distribution derived from the
+        distribution given by the array of states and the array of
+        corresponding values.
+        """
+        image_states, image_values = map_arrays(self.transform,
+                                                states,
+                                                values)
+        self._append(t, image_states, image_values)
+    
+    def _append(self, t, states, values):
+        """
+        Appends the time t, and the marginal distribution given by the arrays
+        states and values together with its statistics. The marginal
+        distribution is empty if states is None.
+        """
+        if (states is not None) and (numpy.size(values) > 0):
+            if self.columns is None:
+                self.columns = self._create_columns(numpy.size(states, 0))
+            row = _statistics(states, values, self.order,
+                              self.quantile_probabilities)
+        else:
+            row = {}
+        if self.columns is not None:
+            for (stat_name, column) in self.columns.iteritems():
+                column.append(row.get(stat_name, numpy.nan))
+        self._times.append(t)
+        if states is None:
+            self._marginals.append(Distribution())
+        else:
+            self._marginals.append((states, values))
+    
+    def _create_columns(self, dimension):
+        """
+        Returns the statistic columns for random variables of the given
+        dimension, with NaN rows for the times already written.
+        """
+        columns = {'expectation' : Column((dimension, ))}
+        if dimension == 1:
+            columns['variance'] = Column()
+            columns['standard_deviation'] = Column()
+        elif dimension == 2:
+            columns['covariance'] = Column()
+        if dimension >= 2:
+            columns['covariance_matrix'] = Column((dimension, dimension))
+            columns['correlation_matrix'] = Column((dimension, dimension))
+        if self.order >= 3:
+            columns['skewness'] = Column((dimension, ))
+        if self.order >= 4:
+            columns['kurtosis'] = Column((dimension, ))
+        if self.quantile_probabilities is not None:
+            columns['quantiles'] = Column(
+                (dimension, len(self.quantile_probabilities))
+            )
+        for column in columns.itervalues():
+            for _ in xrange(len(self)):
+                column.append(numpy.nan)
+        return columns
     
     def get_statistic(self, stat_name):
         """
-        Returns list of statistic values over time.
+        Returns array of statistic values over time.
         
         Alternatively, statistics may be obtained directly as attributes
         of the Measurement instance m, that is,
         
         m.get_statistic(stat_name) <=> m.stat_name
         """
-        statistic = []
-        for d in self.distributions:
-            if stat_name in d.statistics:
-                statistic.append(d.statistics[stat_name]())
-            else:
-                raise KeyError(str(stat_name))
-        return statistic
+        column_name = STATISTIC_COLUMNS.get(stat_name)
+        if column_name is None:
+            raise KeyError(str(stat_name))
+        if self.columns is None:
+            return numpy.zeros((0, ))
+        if column_name not in self.columns:
+            raise KeyError(str(stat_name))
+        return self.columns[column_name].array
     
-    def __getattribute__(self, attrname):
+    def __getattr__(self, attrname):
         """
         Allows statistics to be accessed as if they were attributes
         """
+        if attrname.startswith('_') or attrname == 'columns':
+            raise AttributeError(attrname)
         try:
-            return object.__getattribute__(self, attrname)
-        except AttributeError:
             return self.get_statistic(attrname)
+        except KeyError:
+            raise AttributeError(attrname)
+
+def _statistics(states, values, order = 2, quantiles = None):
+    """
+    Returns mapping of the statistics of the distribution given by the array
+    of states and the array of corresponding probabilities, computed from
+    its moments up to the given order, and the optional quantiles.
+    """
+    moments = Moments(states, values, order)
+    row = {'expectation' : moments.mean}
+    if moments.dimension == 1:
+        row['variance'] = moments.variance[0]
+        row['standard_deviation'] = moments.standard_deviation[0]
+    elif moments.dimension == 2:
+        row['covariance'] = moments.covariance[0, 1]
+    if moments.dimension >= 2:
+        row['covariance_matrix'] = moments.covariance
+        row['correlation_matrix'] = moments.correlation
+    if order >= 3:
+        row['skewness'] = moments.skewness
+    if order >= 4:
+        row['kurtosis'] = moments.kurtosis
+    if quantiles is not None:
+        row['quantiles'] = moments.quantiles(quantiles)
+    return row
@@ -2,6 +2,8 @@
 Model definition constants and validation functions
 """
 
+import numpy
+from cmepy import propensity
 from cmepy.util import shape_invariant
 
 PROPENSITIES = 'propensities'
@@ -32,15 +34,30 @@ class Model(dict):
         self.validate()
         
         # pre-process propensity and species count functions
+        self._compile_propensities()
         self._ensure_shape_invariance(PROPENSITIES)
         if SPECIES_COUNTS in self:
             self._ensure_shape_invariance(SPECIES_COUNTS)
     
+    def _compile_propensities(self):
+        """
+        Compiles propensities given as expression strings
+        """
+        self[PROPENSITIES] = [
+            propensity.create(f) if isinstance(f, basestring) else f
+            for f in self[PROPENSITIES]
+        ]
+    
     def _ensure_shape_invariance(self, x):
         """
         Applies shape invariance decorator to all functions stored under x
+        
+        Compiled propensities already have matching output shapes, so are
+        left as they are.
         """
-        self[x] = [shape_invariant(f) for f in self[x]]
+        compiled = (propensity.Propensity, propensity.MassActionPropensity)
+        self[x] = [f if isinstance(f, compiled)
+                   else shape_invariant(f) for f in self[x]]
     
     def __getattribute__(self, attrname):
         """
@@ -66,12 +83,272 @@ def create(**entries):
     Returns a model instance, using the specified entries.
     
     Entries should be model parameters as keyword arguments.
+    
+    Propensities may be given as expression strings instead of functions,
+    which are compiled using ``cmepy.propensity.create``.
     """
     
     m = Model(**entries)
     m.validate()
     return m
 
+def parse_reaction(reaction, species):
+    """
+    parse_reaction(reaction, species) -> reactant_orders, transition
+    
+    Parses a reaction string of the form 'A+B->C', where each side is a sum
+    of species names, optionally preceded by integer stoichiometric
+    coefficients, as in '2X->Y'. Either side may be given as '*' or left
+    empty, to denote no species, as in 'X->*' or '->X'.
+    
+    Returns the tuple of the number of molecules of each species consumed by
+    the reaction, and the transition of the reaction, with respect to the
+    ordering of the sequence of species names.
+    """
+    if reaction.count('->') != 1:
+        raise ValueError('reaction \'%s\' must contain one \'->\'' % reaction)
+    sides = reaction.split('->')
+    counts = []
+    for side in sides:
+        count = [0]*len(species)
+        side = side.strip()
+        if side not in ('', '*'):
+            for term in side.split('+'):
+                term = term.strip()
+                digits = len(term) - len(term.lstrip('0123456789'))
+                coefficient = int(term[:digits]) if digits else 1
+                name = term[digits:].strip()
+                if name not in species:
+                    lament = 'unknown species \'%s\' in reaction \'%s\''
+                    raise ValueError(lament % (name, reaction))
+                count[list(species).index(name)] += coefficient
+        counts.append(count)
+    reactants, products = counts
+    transition = tuple(p - r for (p, r) in zip(products, reactants))
+    return tuple(reactants), transition
+
+def mass_action(reactions,
+                rates,
+                species,
+                initial_state=None,
+                shape=None,
+                name=None):
+    """
+    mass_action(reactions, rates, species [, initial_state [, shape [, name]]])
+    -> Model instance
+    
+    Returns a model with mass-action kinetics, for the given sequences of
+    reaction strings, rate constants and species names. The state
+    coordinates are the copy counts of the species, in order. See
+    parse_reaction for the format of the reaction strings.
+    
+    The propensity of each reaction is its rate constant, multiplied by the
+    number of distinct combinations of its reactant molecules. The
+    propensities of all reactions are evaluated together, see
+    cmepy.propensity.MassAction.
+    """
+    if len(reactions) != len(rates):
+        raise ValueError('mismatched lengths of reactions and rates')
+    parsed = [parse_reaction(reaction, species) for reaction in reactions]
+    orders = [reactant_orders for (reactant_orders, _) in parsed]
+    table = propensity.mass_action_table(rates, orders)
+    entries = {
+        PROPENSITIES : table.propensities,
+        TRANSITIONS : [transition for (_, transition) in parsed],
+        SPECIES_NAMES : tuple(species),
+        SPECIES_COUNTS : [propensity.create('x%d' % i)
+                          for i in xrange(len(species))],
+        REACTION_NAMES : tuple(reactions),
+    }
+    if initial_state is not None:
+        entries[INITIAL_STATE] = tuple(initial_state)
+    if shape is not None:
+        entries[SHAPE] = tuple(shape)
+    if name is not None:
+        entries[NAME] = name
+    return create(**entries)
+
+def _row_echelon(a, tolerance=1.0e-9):
+    """
+    _row_echelon(a [, tolerance]) -> r, pivots
+    
+    Returns the reduced row echelon form r of the 2d array a, with the
+    zero rows removed, together with the list of pivot column indices.
+    """
+    r = numpy.array(a, dtype=numpy.float)
+    rows, cols = numpy.shape(r)
+    pivots = []
+    row = 0
+    for col in xrange(cols):
+        if row == rows:
+            break
+        pivot = row + numpy.argmax(numpy.abs(r[row:, col]))
+        if abs(r[pivot, col]) <= tolerance:
+            continue
+        r[[row, pivot]] = r[[pivot, row]]
+        r[row] /= r[row, col]
+        others = numpy.arange(rows) != row
+        r[others] -= numpy.outer(r[others, col], r[row])
+        pivots.append(col)
+        row += 1
+    return r[:row], pivots
+
+def _conservation_basis(transitions):
+    """
+    _conservation_basis(transitions) -> independent, dependent, coefficients
+    
+    Returns the indices of the independent and dependent coordinates, and a
+    basis of conservation law coefficients, with one row per dependent
+    coordinate, where the coefficients of the dependent coordinates form an
+    identity matrix.
+    """
+    transitions = numpy.asarray(transitions)
+    dim = numpy.size(transitions, 1)
+    r, independent = _row_echelon(transitions)
+    dependent = [i for i in xrange(dim) if i not in independent]
+    coefficients = numpy.zeros((len(dependent), dim))
+    for (j, i) in enumerate(dependent):
+        coefficients[j, i] = 1.0
+        coefficients[j, independent] = -r[:, i]
+    return independent, dependent, coefficients
+
+def conservation_laws(m):
+    """
+    conservation_laws(m) -> coefficients
+    
+    Returns a 2d array, where each row holds the coefficients of a linear
+    conservation law of the model m, that is, a weighted sum of the state
+    coordinates that is left unchanged by every transition of the model.
+    
+    The rows form a basis of the left null space of the stoichiometry
+    matrix of the model, the matrix with the transitions as columns. If the
+    model has no conservation laws, the returned array has no rows.
+    """
+    validate_model(m)
+    _, _, coefficients = _conservation_basis(m[TRANSITIONS])
+    return coefficients
+
+def reduction(m, state=None):
+    """
+    reduction(m [, state]) -> Reduction instance
+    
+    Returns the reduction of the model m to the coordinates that are not
+    determined by its conservation laws, for the conserved quantities of
+    the given state. The state defaults to the initial state of the model.
+    """
+    validate_model(m)
+    if state is None:
+        if INITIAL_STATE not in m:
+            lament = 'if no state given, model must contain key \'%s\''
+            raise ValueError(lament % INITIAL_STATE)
+        state = m[INITIAL_STATE]
+    return Reduction(m, state)
+
+class Reduction(object):
+    """
+    Reduction of a model with linear conservation laws.
+    
+    The state coordinates of the model are split into independent and
+    dependent coordinates, where the dependent coordinates are determined
+    by the independent coordinates and the conserved quantities. The reduced
+    model acts on the independent coordinates only.
+    """
+    def __init__(self, m, state):
+        """
+        Creates the reduction of model m, for the conserved quantities of the
+        given state.
+        """
+        independent, dependent, coefficients = _conservation_basis(
+            m[TRANSITIONS]
+        )
+        self.full_model = m
+        self.independent = independent
+        self.dependent = dependent
+        self.coefficients = coefficients
+        self.totals = numpy.dot(coefficients, state)
+        self.model = self._reduce_model()
+    
+    def _reduce_model(self):
+        """
+        Returns the model acting on the independent coordinates
+        """
+        m = self.full_model
+        
+        def reduce_function(f):
+            """
+            Returns function of reduced coordinates equivalent to f
+            """
+            return lambda *x : f(*self.expand_states(numpy.asarray(x)))
+        
+        entries = {
+            PROPENSITIES : [reduce_function(f) for f in m[PROPENSITIES]],
+            TRANSITIONS : [tuple(numpy.asarray(t)[self.independent])
+                           for t in m[TRANSITIONS]],
+        }
+        if SPECIES_COUNTS in m:
+            entries[SPECIES_COUNTS] = [reduce_function(f)
+                                       for f in m[SPECIES_COUNTS]]
+        for entry in (NAME, SPECIES_NAMES, REACTION_NAMES):
+            if entry in m:
+                entries[entry] = m[entry]
+        for entry in (INITIAL_STATE, SHAPE):
+            if entry in m:
+                entries[entry] = tuple(self.reduce_states(m[entry]))
+        return create(**entries)
+    
+    def conserved(self, states):
+        """
+        Returns boolean array of flags for the states in the array states
+        (in full coordinates) that have the conserved quantities of this
+        reduction.
+        """
+        states = numpy.asarray(states)
+        quantities = numpy.dot(self.coefficients, states)
+        deviation = numpy.abs(quantities - self.totals[:, numpy.newaxis])
+        return numpy.logical_and.reduce(deviation < 0.5, axis=0)
+    
+    def reduce_states(self, states):
+        """
+        Returns the array states (in full coordinates) in reduced coordinates
+        """
+        return numpy.asarray(states)[self.independent]
+    
+    def expand_states(self, states):
+        """
+        Returns the array states (in reduced coordinates) in full coordinates
+        """
+        states = numpy.asarray(states)
+        dim = len(self.independent) + len(self.dependent)
+        full_states = numpy.zeros((dim, ) + numpy.shape(states)[1:],
+                                  dtype=numpy.int)
+        full_states[self.independent] = states
+        dependent = numpy.tensordot(
+            -self.coefficients[:, self.independent],
+            states,
+            axes=1
+        )
+        totals = numpy.reshape(self.totals,
+                               numpy.shape(self.totals) +
+                               (1, )*(numpy.ndim(states) - 1))
+        full_states[self.dependent] = numpy.rint(dependent + totals)
+        return full_states
+    
+    def valid_states(self, states):
+        """
+        Returns boolean array of flags for the states in the array states
+        (in reduced coordinates) whose full coordinates are non-negative, and
+        within the shape of the full model, if specified.
+        """
+        full_states = self.expand_states(states)
+        flags = numpy.logical_and.reduce(full_states >= 0, axis=0)
+        if SHAPE in self.full_model:
+            shape = numpy.asarray(self.full_model[SHAPE])[:, numpy.newaxis]
+            flags = numpy.logical_and(
+                flags,
+                numpy.logical_and.reduce(full_states < shape, axis=0)
+            )
+        return flags
+
 def raise_error(error_type, descr, value, message):
     """
     raise_error(error_type, descr, value, message) -> raise error_type(...)
@@ -179,7 +456,8 @@ def validate_propensities(value):
     """
     must_have_length(value, 'propensity sequence', min_len=1)
     for prop in value:
-        must_be_callable(prop, 'propensity function')
+        if not isinstance(prop, basestring):
+            must_be_callable(prop, 'propensity function')
 
 def validate_species_names(value):
     """
@@ -0,0 +1,357 @@
+"""
+Multilevel solution of the CME, by aggregation of the domain states.
+
+Neighbouring lattice states of the domain are aggregated into coarse cells,
+and the CME matrix is restricted to a coarse matrix over the cells. Solving
+the small coarse system approximates the smooth part of the solution of the
+large fine system, which is used to precondition and correct the iterative
+solution of the fine system. This is used both by the implicit Euler time
+stepping solver ImplicitEulerSolver, and by the 'aggregation' method of
+``cmepy.steady_state.solve``.
+"""
+
+import math
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+from cmepy import lexarrayset
+from cmepy.ode_solver import Solver
+
+DEFAULT_CELL_SIZE = 4
+
+def aggregate(states, cell_shape=None):
+    """
+    aggregate(states [, cell_shape]) -> Aggregation instance
+
+    Returns the aggregation of the d by n array of states into the cells of
+    the lattice of boxes with shape cell_shape. Each box is the set of states
+    x with x // cell_shape equal to some coarse state. The cell shape may be
+    given as a single integer, which is used for all dimensions, and defaults
+    to DEFAULT_CELL_SIZE.
+
+    The i-th fine state of the aggregation is the i-th column of states, that
+    is, states must be given in enumeration order, for instance, by the
+    ``unordered_states`` attribute of a state enumeration.
+    """
+    states = numpy.asarray(states)
+    dim = numpy.size(states, 0)
+    if cell_shape is None:
+        cell_shape = DEFAULT_CELL_SIZE
+    cell_shape = numpy.asarray(cell_shape, dtype=numpy.int)
+    if numpy.ndim(cell_shape) == 0:
+        cell_shape = cell_shape*numpy.ones((dim, ), dtype=numpy.int)
+    if numpy.shape(cell_shape) != (dim, ):
+        raise ValueError('cell_shape must have one entry per dimension')
+    if numpy.any(cell_shape < 1):
+        raise ValueError('cell_shape entries must be positive')
+    cells = states // cell_shape[:, numpy.newaxis]
+    coarse_states, labels = lexarrayset.unique(cells, return_inverse=True)
+    return Aggregation(labels, coarse_states)
+
+class Aggregation(object):
+    """
+    Aggregation of fine states into coarse cells.
+    """
+    def __init__(self, labels, coarse_states=None):
+        """
+        Creates the aggregation mapping the i-th fine state to the coarse cell
+        labels[i], where the cells are labelled 0, 1, ..., size - 1. See
+        cmepy.multilevel.aggregate
+        """
+        self.labels = numpy.asarray(labels, dtype=numpy.int)
+        self.coarse_states = coarse_states
+        if numpy.size(self.labels) == 0:
+            self.size = 0
+        else:
+            self.size = int(numpy.max(self.labels)) + 1
+        self.fine_size = numpy.size(self.labels)
+        self.counts = numpy.bincount(self.labels, minlength=self.size)
+        self.restriction = scipy.sparse.csr_matrix(
+            (numpy.ones((self.fine_size, )),
+             (self.labels, numpy.arange(self.fine_size))),
+            shape = (self.size, self.fine_size)
+        )
+
+    def with_sink(self):
+        """
+        Returns the aggregation extended by a sink state, following the
+        fine states, which forms a coarse cell of its own.
+        """
+        return Aggregation(numpy.concatenate((self.labels, [self.size])))
+
+    def restrict(self, p):
+        """
+        Returns the total of the dense array p over each coarse cell
+        """
+        return numpy.bincount(self.labels, p, minlength=self.size)
+
+    def prolongation(self, weights=None):
+        """
+        prolongation(weights) -> matrix
+
+        Returns the sparse matrix distributing the value of each coarse cell
+        over its fine states, in proportion to the given non-negative
+        weights. The value of a cell is spread uniformly over its states if
+        the weights are not given, or are zero over the cell.
+
+        The restriction matrix multiplied by the prolongation matrix is the
+        identity on the coarse cells.
+        """
+        uniform = 1.0 / self.counts[self.labels]
+        if weights is None:
+            values = uniform
+        else:
+            weights = numpy.maximum(weights, 0.0)
+            totals = self.restrict(weights)[self.labels]
+            nonzero = totals > 0.0
+            values = numpy.where(nonzero,
+                                 weights / numpy.where(nonzero, totals, 1.0),
+                                 uniform)
+        return scipy.sparse.csr_matrix(
+            (values, (numpy.arange(self.fine_size), self.labels)),
+            shape = (self.fine_size, self.size)
+        )
+
+    def coarse_matrix(self, matrix, weights=None):
+        """
+        Returns the coarse matrix restriction * matrix * prolongation(weights).
+
+        If the columns of matrix sum to zero, as for a CME generator, so do
+        the columns of the coarse matrix, which is then the generator of the
+        aggregated process. If weights is the exact solution, the coarse
+        system is exact for the totals over each cell.
+        """
+        prolongation = self.prolongation(weights)
+        return (self.restriction * (matrix * prolongation)).tocsc()
+
+class TwoLevelPreconditioner(object):
+    """
+    Two-level preconditioner, combining Jacobi smoothing on the fine states
+    with a coarse correction over the cells of an aggregation.
+    """
+    def __init__(self, matrix, aggregation, weights=None):
+        """
+        Creates the preconditioner of the non-singular sparse matrix, using
+        the coarse matrix of the aggregation with the given weights.
+        """
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+        self.aggregation = aggregation
+        diagonal = self.matrix.diagonal()
+        self.inverse_diagonal = numpy.where(
+            diagonal != 0.0,
+            1.0 / numpy.where(diagonal != 0.0, diagonal, 1.0),
+            1.0
+        )
+        self.prolongation = aggregation.prolongation(weights)
+        coarse = aggregation.restriction * (self.matrix * self.prolongation)
+        self.coarse_lu = scipy.sparse.linalg.splu(coarse.tocsc())
+        size = numpy.size(diagonal)
+        self.operator = scipy.sparse.linalg.LinearOperator(
+            (size, size),
+            matvec = self.solve
+        )
+
+    def coarse_solve(self, r):
+        """
+        Returns the coarse approximation to the solution x of matrix*x = r
+        """
+        r_coarse = self.aggregation.restriction * numpy.ravel(r)
+        return self.prolongation * self.coarse_lu.solve(r_coarse)
+
+    def solve(self, r):
+        """
+        Returns the approximate solution x of matrix*x = r, computed by
+        a Jacobi smoothing step, followed by a coarse correction and
+        a further Jacobi smoothing step.
+        """
+        r = numpy.ravel(r)
+        x = self.inverse_diagonal * r
+        x += self.coarse_solve(r - self.matrix * x)
+        x += self.inverse_diagonal * (r - self.matrix * x)
+        return x
+
+class _Solution(object):
+    """
+    Holds the packed solution y, in place of a scipy ode instance
+    """
+    def __init__(self, y):
+        self.y = y
+
+class ImplicitEulerSolver(Solver):
+    """
+    Implicit Euler solver, using preconditioned GMRES with a two-level
+    aggregation preconditioner to solve the linear system of each step.
+
+    The solver is created by ``cmepy.solver.create`` when passed as the
+    'solver' argument, for instance ::
+
+        cmepy.solver.create(model, sink, solver = ImplicitEulerSolver,
+                            cell_shape = (4, 4), max_step = 0.1)
+
+    so the cells of the aggregation are formed over the domain enumeration
+    of the created solver.
+    """
+    def __init__(self,
+                 dy_dt,
+                 y_0,
+                 t_0 = 0.0,
+                 ode_config_callback = None,
+                 reaction_matrices = None,
+                 time_dependencies = None,
+                 cell_shape = None,
+                 max_step = None,
+                 tolerance = 1.0e-10,
+                 multilevel = True):
+        """
+        Initialise the solver, see Solver.
+
+        Additional arguments:
+
+         * ``reaction_matrices`` : the reaction matrices of the CME, passed
+           by ``cmepy.solver.create``
+         * ``time_dependencies`` : time dependencies of the reaction
+           matrices, passed by ``cmepy.solver.create``
+         * ``cell_shape`` : shape of the cells of the aggregation, see
+           ``aggregate``
+         * ``max_step`` : largest time step. This must be given, as the
+           implicit Euler steps are only first order accurate, without
+           error control, so a ValueError is raised if it is None.
+         * ``tolerance`` : relative tolerance of GMRES
+         * ``multilevel`` : if False, GMRES is preconditioned by the
+           diagonal only, without the coarse correction
+        """
+        if reaction_matrices is None:
+            raise ValueError('reaction_matrices must be given')
+        if max_step is None or not max_step > 0.0:
+            raise ValueError('max_step must be given, and positive')
+        Solver.__init__(self, dy_dt, y_0, t_0, ode_config_callback)
+        if time_dependencies is None:
+            time_dependencies = {}
+        const_reactions = set(xrange(len(reaction_matrices)))
+        self._terms = []
+        for (reaction_subset, phi) in time_dependencies.iteritems():
+            const_reactions.difference_update(reaction_subset)
+            self._terms.append((sum(reaction_matrices[i]
+                                    for i in reaction_subset), phi))
+        if const_reactions:
+            self._terms.append((sum(reaction_matrices[i]
+                                    for i in const_reactions), None))
+        self.cell_shape = cell_shape
+        self.max_step = max_step
+        self.tolerance = tolerance
+        self.multilevel = multilevel
+        self.aggregation = None
+        self.iterations = 0
+        self._preconditioner = None
+        self._preconditioner_key = None
+
+    def _initialise_ode(self):
+        """
+        Packs the initial value, in place of initialising a scipy ode
+        """
+        if self._custom_packing:
+            packed_y_0 = self._pack(self._y_0)
+        else:
+            packed_y_0 = self._y_0
+        self._ode = _Solution(numpy.array(packed_y_0, dtype=numpy.float))
+        self._y_0 = None
+
+    def _create_aggregation(self, size):
+        """
+        Returns the aggregation of the domain states, extended with the sink
+        state if present
+        """
+        states = self.domain_enum.unordered_states
+        aggregation = aggregate(states, self.cell_shape)
+        if size == aggregation.fine_size + 1:
+            aggregation = aggregation.with_sink()
+        return aggregation
+
+    def matrix(self, t):
+        """
+        Returns the CME matrix at time t
+        """
+        return sum(matrix*phi(t) if phi is not None else matrix
+                   for (matrix, phi) in self._terms)
+
+    def _get_preconditioner(self, t, h):
+        """
+        Returns the step matrix (I - h*A(t)) and its preconditioner, which are
+        reused for subsequent steps if the matrix is time independent
+        """
+        time_dependent = any(phi is not None for (_, phi) in self._terms)
+        key = (h, t if time_dependent else None)
+        if key != self._preconditioner_key:
+            a = self.matrix(t)
+            size = a.shape[0]
+            step_matrix = (scipy.sparse.identity(size) - h*a).tocsr()
+            if self.multilevel:
+                if self.aggregation is None:
+                    self.aggregation = self._create_aggregation(size)
+                preconditioner = TwoLevelPreconditioner(step_matrix,
+                                                        self.aggregation)
+            else:
+                preconditioner = None
+            self._preconditioner = (step_matrix, preconditioner)
+            self._preconditioner_key = key
+        return self._preconditioner
+
+    def _euler_step(self, t, h, x):
+        """
+        Returns the solution of the implicit Euler step (I - h*A(t)) y = x
+        """
+        step_matrix, preconditioner = self._get_preconditioner(t, h)
+        if preconditioner is not None:
+            guess = preconditioner.coarse_solve(x)
+            operator = preconditioner.operator
+        else:
+            guess = x
+            inverse_diagonal = 1.0 / step_matrix.diagonal()
+            operator = scipy.sparse.linalg.LinearOperator(
+                step_matrix.shape,
+                matvec = lambda r : inverse_diagonal * numpy.ravel(r)
+            )
+        iterations = [0]
+        def count(residual):
+            iterations[0] += 1
+        y, info = scipy.sparse.linalg.gmres(step_matrix,
+                                            x,
+                                            x0 = guess,
+                                            tol = self.tolerance,
+                                            M = operator,
+                                            callback = count)
+        if info != 0:
+            raise RuntimeError('gmres failed to converge (%d)' % info)
+        self.iterations += iterations[0]
+        return y
+
+    def step(self, t):
+        """
+        Advances the current solution to the time t, using implicit Euler
+        steps no larger than max_step.
+
+        Values of t less that the current solution time are illegal and will
+        raise a ValueError.
+        """
+        if self._ode is None:
+            self._initialise_ode()
+        if t < self._t:
+            lament = 'Cannot step backwards to a time t (%f) earlier than current solution time (%f)' % (t, self._t)
+            raise ValueError(lament)
+        if t == self._t:
+            return
+
+        # round the number and size of the steps, so steps over intervals of
+        # the same length that differ only by rounding reuse the same step
+        # matrix
+        steps = float('%.12g' % ((t - self._t) / self.max_step))
+        steps = max(1, int(math.ceil(steps)))
+        h = float('%.12g' % ((t - self._t) / steps))
+        x = self._ode.y
+        for k in xrange(1, steps + 1):
+            x = self._euler_step(self._t + k*h, h, x)
+        self._ode.y = x
+        self._t = t
+        self._y = None
@@ -115,6 +115,17 @@ class Solver(object):
                 self._y = self._unpack(self._y)
         return self._y
     
+    @property
+    def x(self):
+        """
+        Read-only property, returning a *copy* of the current packed solution x.
+        
+        If no packing is set, x is the same as the solution y. See set_packing.
+        """
+        if self._ode is None:
+            self._initialise_ode()
+        return numpy.array(self._ode.y)
+    
     def step(self, t):
         """
         Advances the current solution to the time t.
@@ -0,0 +1,221 @@
+"""
+Compiles propensity functions from expression strings.
+
+Expressions are written in terms of the state coordinates, named either
+``x0``, ``x1``, ... or ``x[0]``, ``x[1]``, ..., and may use the arithmetic
+operators, comparisons, and the elementary functions listed in FUNCTIONS.
+Each expression is compiled once, and evaluated over all states of the
+domain in a single pass. If the optional NumExpr package is installed, it is
+used to evaluate the expression as a single fused kernel, otherwise the
+expression is evaluated using numpy.
+"""
+
+import __future__
+import re
+import numpy
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+FUNCTIONS = (
+    'sin',
+    'cos',
+    'tan',
+    'arcsin',
+    'arccos',
+    'arctan',
+    'sinh',
+    'cosh',
+    'tanh',
+    'exp',
+    'log',
+    'log10',
+    'sqrt',
+    'abs',
+    'where',
+)
+
+_INDEXED_COORDINATE = re.compile(r'\bx\s*\[\s*(\d+)\s*\]')
+_COORDINATE = re.compile(r'\bx(\d+)\b')
+
+def create(expression, constants=None, use_numexpr=None):
+    """
+    create(expression [, constants [, use_numexpr]]) -> Propensity instance
+
+    Returns a propensity function compiled from the string expression.
+
+    The optional mapping constants defines values for any additional names
+    used in the expression, for instance, rate constants. By default, the
+    expression is evaluated using NumExpr if it is installed. This may be
+    overridden by setting use_numexpr to True or False, where a ValueError is
+    raised if use_numexpr is True but NumExpr is not installed.
+    """
+    if use_numexpr is None:
+        use_numexpr = numexpr is not None
+    elif use_numexpr and (numexpr is None):
+        raise ValueError('use_numexpr is True but numexpr is not installed')
+    return Propensity(expression, constants, use_numexpr)
+
+def mass_action(rate, orders):
+    """
+    mass_action(rate, orders) -> expression
+
+    Returns the expression string for the mass-action propensity with the
+    given rate constant, where orders[i] is the number of molecules of the
+    species with coordinate i consumed by the reaction. The propensity is the
+    rate constant multiplied by the number of distinct combinations of
+    reactant molecules, that is, binomial(x_i, orders[i]) for each species.
+    """
+    factors = [repr(float(rate))]
+    for (i, order) in enumerate(orders):
+        for j in xrange(order):
+            if j == 0:
+                factors.append('x%d' % i)
+            else:
+                factors.append('(x%d - %d)/%d.0' % (i, j, j + 1))
+    return '*'.join(factors)
+
+def mass_action_table(rates, orders):
+    """
+    mass_action_table(rates, orders) -> MassAction instance
+
+    Returns batched mass-action propensities, for the sequence of rate
+    constants and the table of reactant orders, where orders[r][i] is the
+    number of molecules of the species with coordinate i consumed by the
+    reaction r.
+    """
+    return MassAction(rates, orders)
+
+class MassAction(object):
+    """
+    Mass-action propensities of several reactions, evaluated together.
+    """
+    def __init__(self, rates, orders):
+        """
+        Creates batched mass-action propensities, see
+        cmepy.propensity.mass_action_table
+        """
+        self.rates = numpy.array(rates, dtype=numpy.float)
+        self.orders = numpy.array(orders, dtype=numpy.int)
+        if (numpy.ndim(self.orders) != 2) or \
+           (numpy.size(self.orders, 0) != numpy.size(self.rates)):
+            raise ValueError('mismatched numbers of rates and orders')
+        if numpy.any(self.orders < 0):
+            raise ValueError('reactant orders must be non-negative')
+        self.propensities = [MassActionPropensity(self, r)
+                             for r in xrange(numpy.size(self.rates))]
+
+    def __call__(self, *x):
+        """
+        Returns array of the propensities of all reactions evaluated over the
+        coordinate arrays x, where the r-th row holds the propensity of
+        reaction r.
+        """
+        shape = numpy.shape(x[0])
+        values = numpy.multiply.outer(self.rates, numpy.ones(shape))
+        for (i, orders) in enumerate(numpy.transpose(self.orders)):
+            max_order = numpy.max(orders)
+            if max_order == 0:
+                continue
+            # binomial coefficients of x_i over each order up to the maximum
+            x_i = numpy.asarray(x[i], dtype=numpy.float)
+            binomials = numpy.ones((max_order + 1, ) + shape)
+            for k in xrange(1, max_order + 1):
+                binomials[k] = binomials[k - 1] * (x_i - (k - 1)) / k
+            values *= binomials[orders]
+        return values
+
+class MassActionPropensity(object):
+    """
+    Propensity of a single reaction of batched mass-action propensities.
+    """
+    def __init__(self, table, index):
+        """
+        Creates the propensity of reaction 'index' of the MassAction table
+        """
+        self.table = table
+        self.index = index
+
+    def __call__(self, *x):
+        """
+        Returns the propensity evaluated over the coordinate arrays x
+        """
+        shape = numpy.shape(x[0])
+        values = numpy.ones(shape) * self.table.rates[self.index]
+        for (i, order) in enumerate(self.table.orders[self.index]):
+            x_i = numpy.asarray(x[i], dtype=numpy.float)
+            for k in xrange(order):
+                values *= (x_i - k) / (k + 1)
+        return values
+
+    def __repr__(self):
+        return 'MassActionPropensity(%r, %r)' % (
+            self.table.rates[self.index],
+            tuple(self.table.orders[self.index])
+        )
+
+class Propensity(object):
+    """
+    Propensity function compiled from an expression string.
+    """
+    def __init__(self, expression, constants=None, use_numexpr=False):
+        """
+        Compiles the expression string, see cmepy.propensity.create
+        """
+        self.expression = expression
+        self.constants = dict(constants or {})
+        self.use_numexpr = use_numexpr
+
+        # rewrite indexed coordinates x[i] as xi, as numexpr does not support
+        # indexing
+        source = _INDEXED_COORDINATE.sub(r'x\1', expression)
+        self.coordinates = sorted(set(int(i)
+                                      for i in _COORDINATE.findall(source)))
+        self.source = source
+        # compiling raises SyntaxError for invalid expressions up front, even
+        # though numexpr compiles (and caches) its own kernel when evaluating.
+        # Division is always true division, so integer literals and
+        # constants such as 1/2 do not truncate
+        self.code = compile(source,
+                            '<propensity>',
+                            'eval',
+                            __future__.division.compiler_flag,
+                            True)
+        self.namespace = dict((f, getattr(numpy, f)) for f in FUNCTIONS)
+        self.namespace['__builtins__'] = {}
+        self.namespace.update(self.constants)
+
+    def __call__(self, *x):
+        """
+        Returns the propensity evaluated over the coordinate arrays x
+        """
+        shape = numpy.shape(x[0])
+        values = {}
+        for i in self.coordinates:
+            values['x%d' % i] = numpy.asarray(x[i], dtype=numpy.float)
+        if self.use_numexpr:
+            values.update(self.constants)
+            result = numexpr.evaluate(self.source,
+                                      local_dict=values,
+                                      truediv=True)
+        else:
+            result = eval(self.code, self.namespace, values)
+        if numpy.shape(result) != shape:
+            result = result + numpy.zeros(shape)
+        return result
+
+    def __getstate__(self):
+        # code objects cannot be pickled, so recompile the expression instead
+        return (self.expression, self.constants, self.use_numexpr)
+
+    def __setstate__(self, state):
+        expression, constants, use_numexpr = state
+        # the unpickling process may not have numexpr installed
+        self.__init__(expression,
+                      constants,
+                      use_numexpr and (numexpr is not None))
+
+    def __repr__(self):
+        return 'Propensity(%r)' % self.expression
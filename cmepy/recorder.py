@@ -3,33 +3,92 @@ CmeRecorder is a utility class for computation of measurements.
 """
 
 import itertools
-from cmepy.statistics import Distribution
+from cmepy import domain
+from cmepy.statistics import Distribution, Projection, projection
 from cmepy.measurement import Measurement
 from cmepy.lazy_dict import LazyDict
 
-def create(*targets):
+def create(*targets, **options):
     """
     Returns a recorder for the random variable groups defined by targets.
+    
+    See CmeRecorder for the keyword options.
     """
-    return CmeRecorder(*targets)
+    return CmeRecorder(*targets, **options)
 
 class CmeRecorder(object):
     """
     CmeRecorder is a utility class to compute common measurements,
     such as marginals, expected values, and standard deviations, from
     a given distribution p. 
+    
+    By default, the recorder stores each distribution written to it, and
+    measurements are computed from the stored distributions when they are
+    first accessed. In streaming mode, the measurements of all variables
+    are instead computed as each distribution is written, and only the
+    marginal distributions of the measurements are retained, unless
+    storing the distributions is explicitly requested.
+    
+    Given a solution store (see ``cmepy.store``), distributions written to
+    the recorder are written to the store instead of being kept in memory,
+    and measurements are computed by streaming them back from the store.
+    
+    The covariance and correlation matrices of several variables are
+    recorded by the measurement of the tuple of the variables, for instance
+    rec[('A', 'B', 'C')].covariance_matrix is the array of the 3 by 3
+    covariance matrices over time.
     """
     
-    def __init__(self, *targets):
+    def __init__(self, *targets, **options):
         """
         Initialise CmeRecorder, optionally using the given sequence of targets.
+        
+        Keyword options:
+        
+            streaming : if True, measurements are computed as each
+                distribution is written. Defaults to False.
+            keep_distributions : if True, distributions written to the
+                recorder are stored in memory. Defaults to False in
+                streaming mode or if a store is given, and must be True
+                otherwise.
+            store : (optional) solution store that distributions written
+                to the recorder are written to, see ``cmepy.store``.
+            order : highest order of the moments whose statistics are
+                recorded, so skewness is recorded if order is at least 3,
+                and kurtosis if order is at least 4. Defaults to 2.
+            quantiles : (optional) sequence of probabilities, whose
+                quantiles are recorded for each variable.
+        
+        In streaming mode without keep_distributions, measurements of
+        product variables, that is, tuples of variables, must be accessed
+        before the first distribution is written, so they are computed from
+        then on.
         """
         object.__init__(self)
         
+        self.streaming = options.pop('streaming', False)
+        self.store = options.pop('store', None)
+        self.order = options.pop('order', 2)
+        self.quantile_probabilities = options.pop('quantiles', None)
+        self.keep_distributions = options.pop(
+            'keep_distributions',
+            not self.streaming and self.store is None
+        )
+        if options:
+            lament = 'unexpected keyword arguments: %s'
+            raise TypeError(lament % ', '.join(sorted(options)))
+        if not (self.streaming or self.keep_distributions or
+                self.store is not None):
+            lament = ('keep_distributions may only be False if streaming, '
+                      'or if a store is given')
+            raise ValueError(lament)
+        
         self.times = []
         self.distributions = []
         self.transforms = {}
-        self.measurements = LazyDict(self._update_measurement)
+        self.measurements = LazyDict(self._update_measurement,
+                                     update_values = self._update_measurements,
+                                     track_dirty = True)
         
         for target in targets:
             self.add_target(*target)
@@ -52,12 +111,9 @@ class CmeRecorder(object):
         variables = args[0]
         
         if n_args == 1:
-            def f(dim):
-                """
-                default transform function, generated by recorder
-                """
-                return lambda state : (state[dim], )
-            transforms = tuple(f(i) for i in xrange(len(variables)))
+            # default transforms project the state onto a coordinate
+            transforms = tuple(projection((i, ))
+                               for i in xrange(len(variables)))
         else:
             def pre_star(f):
                 """
@@ -80,24 +136,113 @@ class CmeRecorder(object):
         """
         
         if not member:
-            if var in self.transforms:
-                transform = self.transforms[var]
-            else:
-                # attempt to parse var as a tuple of vars
-                # and construct derived product transform if
-                # successful
-                product_t = [self.transforms[v] for v in var]
-                def transform(state):
-                    """
-                    product transform function, generated by recorder
-                    """
-                    return sum((t(state) for t in product_t), ())
-            measurement = Measurement(var, transform)
-        start = len(measurement)
-        end = len(self.times)
-        for i in xrange(start, end):
-            measurement.write(self.times[i], self.distributions[i])
+            if self.times and not self._replayable():
+                lament = ('%s: measurement not recorded, and the streaming '
+                          'recorder does not keep distributions')
+                raise KeyError(lament % str(var))
+            measurement = self._create_measurement(var)
+        if self._replayable():
+            self._catch_up({var : measurement})
         return measurement
+    
+    def _update_measurements(self, items):
+        """
+        Returns the list of updated measurements of the given (var,
+        measurement) pairs, which are all brought up to date together.
+        
+        This is used to update :class:`LazyDict` instances.
+        """
+        if self._replayable():
+            self._catch_up(dict(items))
+        return [measurement for (_, measurement) in items]
+    
+    def _replayable(self):
+        """
+        Returns True if the distributions written to the recorder may be
+        read again, from memory or from the store.
+        """
+        return self.keep_distributions or self.store is not None
+    
+    def _catch_up(self, extra_measurements=None):
+        """
+        Writes the stored distributions to all measurements that are behind,
+        converting each distribution to arrays at most once, or reading it
+        from the store at most once.
+        """
+        self._add_target_measurements()
+        measurements = dict(dict.iteritems(self.measurements))
+        if extra_measurements is not None:
+            measurements.update(extra_measurements)
+        end = len(self.times)
+        pending = [m for m in measurements.itervalues() if len(m) < end]
+        if pending:
+            start = min(len(m) for m in pending)
+            if self.store is not None:
+                arrays = self.store.iter_arrays(start)
+                for (i, (t, states, values)) in enumerate(arrays, start):
+                    for measurement in pending:
+                        if len(measurement) == i:
+                            measurement.write_arrays(t, states, values)
+            else:
+                for i in xrange(start, end):
+                    behind = [m for m in pending if len(m) == i]
+                    self._write_all(behind,
+                                    self.times[i],
+                                    self.distributions[i])
+        # every stored measurement is now up to date
+        self.measurements.mark_clean()
+    
+    def _add_target_measurements(self):
+        """
+        Adds measurements for the variables of all targets, so they are
+        computed together.
+        """
+        for var in self.transforms:
+            if not dict.__contains__(self.measurements, var):
+                dict.__setitem__(self.measurements,
+                                 var,
+                                 self._create_measurement(var))
+    
+    def _write_all(self, measurements, t, p):
+        """
+        Writes time t and distribution p to each of the measurements,
+        sharing the array representation of p between them.
+        """
+        if not measurements:
+            return
+        if len(p) == 0:
+            for measurement in measurements:
+                measurement.write(t, p)
+            return
+        states, values = domain.from_mapping(p)
+        for measurement in measurements:
+            measurement.write_arrays(t, states, values)
+    
+    def _create_measurement(self, var):
+        """
+        Returns a new measurement of the variable var.
+        """
+        if var in self.transforms:
+            transform = self.transforms[var]
+        else:
+            # attempt to parse var as a tuple of vars
+            # and construct derived product transform if
+            # successful
+            product_t = [self.transforms[v] for v in var]
+            if all(isinstance(t, Projection) for t in product_t):
+                return Measurement(var,
+                                   sum(product_t[1:], product_t[0]),
+                                   self.order,
+                                   self.quantile_probabilities)
+            def transform(state):
+                """
+                product transform function, generated by recorder
+                """
+                return sum((t(state) for t in product_t), ())
+        return Measurement(var,
+                           transform,
+                           self.order,
+                           self.quantile_probabilities)
         
     def write(self, t, p):
         """
@@ -108,7 +253,18 @@ class CmeRecorder(object):
             p = Distribution(p)
         
         self.times.append(t)
-        self.distributions.append(p)
+        if self.keep_distributions:
+            self.distributions.append(p)
+        if self.store is not None:
+            self.store.write(t, p)
+        if self.streaming:
+            if self._replayable():
+                self._catch_up()
+            else:
+                self._add_target_measurements()
+                self._write_all(dict.values(self.measurements), t, p)
+        else:
+            self.measurements.mark_dirty()
     
     def __getitem__(self, item):
         return self.measurements[item]
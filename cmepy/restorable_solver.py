@@ -2,16 +2,115 @@
 Creates restorable solvers for the Chemical Master Equation (CME).
 """
 
+import numpy
 import cmepy.solver
+from cmepy import checkpoint, domain, lexarrayset, state_enum
 
 def create(model, sink, **solver_args):
     """
     Returns a restorable solver for the CME of the given model.
     
-    The arguments are the same as for ``cmepy.solver.create``.
+    The arguments are the same as for ``cmepy.solver.create``. If a
+    ``propensity_cache`` is given, created by
+    ``cmepy.cme_matrix.create_propensity_cache``, it is shared by every
+    solver the restorable solver creates, so that restoring the solver onto
+    an expanded domain only evaluates propensities for the new states. The
+    cache retains the propensities of every state it has evaluated, so it is
+    not created by default here, but the FSP solvers of ``cmepy.fsp``, which
+    are restored onto each expanded domain, create one by default.
     """
     return RestorableSolver(model, sink, **solver_args)
 
+def load(filename, model, mmap_mode=None, **solver_args):
+    """
+    Returns a restorable solver for the CME of the given model, restored
+    from the checkpoint file ``filename`` written by ``RestorableSolver.save``.
+    
+    The solution, time, sink probability and domain states are read from the
+    checkpoint. Any remaining arguments that cannot be stored in the
+    checkpoint, such as ``time_dependencies``, must be supplied again as
+    keyword arguments, in the same way as for ``cmepy.solver.create``.
+    
+    If ``mmap_mode`` is given, arrays stored in an uncompressed checkpoint
+    are memory-mapped using that mode while loading.
+    """
+    arrays = checkpoint.read(filename, mmap_mode)
+    sink = bool(arrays['sink'])
+    solver_args.update(checkpoint_solver_args(arrays))
+    return RestorableSolver(model, sink, **solver_args)
+
+def checkpoint_solver_args(arrays):
+    """
+    checkpoint_solver_args(arrays) -> solver_args
+    
+    Returns solver arguments for the state stored in the checkpoint arrays.
+    """
+    solver_args = {'t_0' : float(arrays['t'])}
+    if bool(arrays['sink']):
+        solver_args['sink_0'] = float(arrays['p_sink'])
+    if 'domain_states' in arrays:
+        states = arrays['domain_states']
+        solver_args['domain_states'] = states
+    else:
+        states = arrays['p_states']
+    solver_args['p_0'] = (states, arrays['p'])
+    return solver_args
+
+def packed_solution(solver, sink):
+    """
+    packed_solution(solver, sink) -> p_states, p_values, p_sink
+    
+    Returns the current solution of a solver created by cmepy.solver.create
+    as arrays of the states of the solver's domain enumeration and their
+    probabilities, in enumeration order, together with the sink probability,
+    which is zero if sink is False.
+    """
+    x = solver.x
+    domain_enum = solver.domain_enum
+    p_values = x[:domain_enum.size]
+    if sink:
+        p_sink = x[domain_enum.size]
+    else:
+        p_sink = 0.0
+    return domain_enum.unordered_states, p_values, p_sink
+
+def _arrays(p):
+    """
+    _arrays(p) -> (p_states, p_values)
+    
+    Returns array representation of the distribution p, where p is either
+    a mapping or already a pair of arrays.
+    """
+    if type(p) is tuple:
+        return p
+    if len(p) == 0:
+        return numpy.zeros((0, 0), dtype=numpy.int), numpy.zeros((0, ))
+    return domain.from_mapping(p)
+
+def _values(p, states):
+    """
+    _values(p, states) -> value_array
+    
+    Returns array of the values of the distribution p for the unique states
+    in the array states, where states absent from p have zero value.
+    
+    The distribution p is either a mapping or a pair of arrays.
+    """
+    p_states, p_values = _arrays(p)
+    values = numpy.zeros((numpy.size(states, 1), ))
+    if numpy.size(p_values) == 0:
+        return values
+    if numpy.shape(p_states) == numpy.shape(states) and \
+       numpy.array_equal(p_states, states):
+        values[:] = p_values
+        return values
+    states_enum = state_enum.create(states)
+    member = states_enum.contains(p_states)
+    dense = numpy.zeros((states_enum.size, ))
+    dense[states_enum.indices(p_states[:, member])] = p_values[member]
+    values[:] = dense[states_enum.indices(states)]
+    return values
+
 class RestorableSolver(object):
     """
     CME solver with support for setting and restoring state.
@@ -22,9 +121,11 @@ class RestorableSolver(object):
         Create a RestorableSolver object. 
         """
         self.solver = None
+        self.domain_states = None
         self.model = model
         self.sink = sink
         self.restore_args = dict(solver_args)
+        self.propensity_cache = self.restore_args.get('propensity_cache')
         self.restore()
         self.set_restore_point()
     
@@ -36,19 +137,27 @@ class RestorableSolver(object):
         point using the current state of that solver. This consists
         of the solver's current solution, time, and sink probability,
         if available.
+        
+        Restore points of solvers created by ``cmepy.solver.create`` are
+        stored as the packed solution array, together with the states of
+        the solver's domain enumeration, so setting and restoring from
+        them does not require conversion to and from a mapping.
         """
         
-        if solver is None:
-            solver = self
+        if (solver is None) or (solver is self):
+            solver = self.solver
         
         self.restore_args['t_0'] = solver.t
-        if self.sink:
+        if hasattr(solver, 'domain_enum'):
+            p_states, p_values, p_sink = packed_solution(solver, self.sink)
+            p = (p_states, p_values)
+        elif self.sink:
             p, p_sink = solver.y
-            self.restore_args['sink_0'] = p_sink
-            self.restore_args['p_0'] = p
         else:
-            self.restore_args['p_0'] = solver.y
-        
+            p = solver.y
+        if self.sink:
+            self.restore_args['sink_0'] = p_sink
+        self.restore_args['p_0'] = p
     
     def restore(self, **solver_args):
         """
@@ -64,12 +173,90 @@ class RestorableSolver(object):
         restore_args = dict(self.restore_args)
         restore_args.update(solver_args)
         
+        self.domain_states = restore_args.get('domain_states', None)
         self.solver = cmepy.solver.create(
             self.model,
             self.sink,
             **restore_args
         )
     
+    def checkpoint_arrays(self):
+        """
+        Returns a mapping of the arrays used to checkpoint the current state.
+        
+        The current solution is stored as an array of probabilities ``p``,
+        aligned with the array ``domain_states`` if the domain states are
+        known, or otherwise with the array ``p_states`` of the states of the
+        solver's domain enumeration.
+        """
+        p_states, p_values, p_sink = packed_solution(self.solver, self.sink)
+        arrays = {
+            'sink' : self.sink,
+            't' : self.solver.t,
+            'p_sink' : p_sink,
+        }
+        domain_states = self.domain_states
+        if domain_states is None:
+            arrays['p_states'] = p_states
+            arrays['p'] = p_values
+        else:
+            arrays['domain_states'] = domain_states
+            arrays['p'] = _values((p_states, p_values), domain_states)
+        return arrays
+    
+    def save(self, filename, compressed=True):
+        """
+        Saves the current state of the solver to the checkpoint ``filename``.
+        
+        The checkpoint stores the current solution, time, sink probability and
+        domain states, and may be loaded using ``cmepy.restorable_solver.load``.
+        If ``compressed`` is set to False, the checkpoint is not compressed,
+        which allows it to be memory-mapped while loading.
+        """
+        checkpoint.write(filename, self.checkpoint_arrays(), compressed)
+    
+    def probability(self, states):
+        """
+        Returns array of the probabilities of the given states for the
+        current solution.
+        
+        The argument ``states`` must be an array of unique states. States
+        outside of the support of the solution have zero probability.
+        """
+        p_states, p_values, _ = packed_solution(self.solver, self.sink)
+        return _values((p_states, p_values), states)
+    
+    def restore_point_probability(self, states):
+        """
+        Returns array of the probabilities of the given states at the
+        restore point.
+        
+        The argument ``states`` must be an array of unique states. States
+        outside of the support of the restore point have zero probability.
+        """
+        return _values(self.restore_args['p_0'], states)
+    
+    def discard(self, states):
+        """
+        Discards the given states from the restore point.
+        
+        The probability of the discarded states is added to the sink
+        probability of the restore point. Returns the discarded probability.
+        
+        Raises NotImplementedError if ``sink`` flag is not ``True``.
+        """
+        if not self.sink:
+            raise NotImplementedError('only implemented for sink = True')
+        p_states, p_values = _arrays(self.restore_args['p_0'])
+        if numpy.size(p_values) == 0:
+            return 0.0
+        member = lexarrayset.nonunique_member(p_states, numpy.asarray(states))
+        discarded = numpy.add.reduce(p_values[member])
+        keep = numpy.logical_not(member)
+        self.restore_args['p_0'] = (p_states[:, keep], p_values[keep])
+        self.restore_args['sink_0'] += discarded
+        return discarded
+    
     def step(self, t):
         """
         Advances the current solution to the time t.
@@ -93,6 +280,18 @@ class RestorableSolver(object):
             raise NotImplementedError('only implemented for sink = True')
         return self.restore_args['sink_0']
     
+    @property
+    def error(self):
+        """
+        *Read only* property returning error of the current solution, that is,
+        the current sink probability.
+        
+        Raises NotImplementedError if ``sink`` flag is not ``True``.
+        """
+        if not self.sink:
+            raise NotImplementedError('only implemented for sink = True')
+        return packed_solution(self.solver, self.sink)[2]
+    
     @property
     def y(self):
         """
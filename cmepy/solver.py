@@ -3,6 +3,7 @@ Creates solvers for the Chemical Master Equation (CME).
 """
 
 import numpy
+import cmepy.tensor_train
 from cmepy import cme_matrix, domain, ode_solver, other_solver, state_enum
 from cmepy import model as mdl
 
@@ -46,6 +47,135 @@ def create_packing_functions(domain_enum):
     
     return (pack, unpack)
 
+def create_block_packing_functions(domain_enum, sink, block_size):
+    """
+    create_block_packing_functions(domain_enum, sink, block_size)
+    -> (pack, unpack)
+    
+    where
+    
+        pack(block) -> x
+        unpack(x) -> block
+    
+    Here block is a sequence of block_size solutions, each of the form
+    (p, p_sink) if sink is True, or p otherwise, while x is the flattened
+    packed array of shape (n, block_size), where n is the size of the domain
+    enumeration, plus one if sink is True. The k-th column of the packed
+    array is the packed k-th solution.
+    """
+    
+    if sink:
+        pack_column, unpack_column = create_packing_functions(domain_enum)
+    else:
+        pack_column = domain_enum.pack_distribution
+        unpack_column = domain_enum.unpack_distribution
+    size = domain_enum.size + int(bool(sink))
+    
+    def pack(block):
+        """
+        pack(block) -> x
+        """
+        if len(block) != block_size:
+            raise ValueError('block must contain %d solutions' % block_size)
+        x = numpy.zeros((size, block_size))
+        for (k, column) in enumerate(block):
+            x[:, k] = pack_column(column)
+        return numpy.ravel(x)
+    
+    def unpack(x):
+        """
+        unpack(x) -> block
+        """
+        x = numpy.reshape(x, (size, block_size))
+        return [unpack_column(x[:, k]) for k in xrange(block_size)]
+    
+    return (pack, unpack)
+
+def default_p_0(model):
+    """
+    default_p_0(model) -> p_0
+    
+    Returns the distribution with all probability concentrated at the
+    initial state of the model. Raises ValueError if the model has no
+    initial state.
+    """
+    initial_state = model.get(mdl.INITIAL_STATE, None)
+    if initial_state is None:
+        lament = 'if no p_0 given, model must contain key \'%s\''
+        raise ValueError(lament % mdl.INITIAL_STATE)
+    return {initial_state : 1.0}
+
+def create_reaction_matrices(model,
+                             sink,
+                             p_0_states,
+                             domain_states=None,
+                             outflow=False,
+                             reduced=False,
+                             propensity_cache=None):
+    """
+    create_reaction_matrices(model, sink, p_0_states [, ...])
+    -> domain_enum, reaction_matrices
+    
+    Returns the enumeration of the domain, and the list of the matrices of
+    each reaction term of the CME, where p_0_states is the array of states
+    in the support of the initial distribution. Raises ValueError if these
+    states are not contained in the domain.
+    
+    See the documentation of ``create`` for details of the arguments.
+    """
+    
+    # determine the conserved quantities if solving in reduced coordinates
+    if reduced:
+        if propensity_cache is not None:
+            raise ValueError('propensity_cache not supported if reduced')
+        reduction = mdl.reduction(model, p_0_states[:, 0])
+        matrix_model = reduction.model
+        validity_test = reduction.valid_states
+    else:
+        matrix_model = model
+        validity_test = cme_matrix.non_neg_states
+    
+    # determine states in domain, then construct an enumeration of the
+    # domain states
+    if domain_states is None:
+        if mdl.SHAPE not in model:
+            lament = 'if no states given, model must contain key \'%s\''
+            raise KeyError(lament % mdl.SHAPE)
+        elif reduced:
+            domain_states = domain.from_rect(shape = matrix_model.shape)
+            domain_states = domain_states[:, validity_test(domain_states)]
+        else:
+            domain_states = domain.from_rect(shape = model.shape)
+    elif reduced:
+        domain_states = numpy.asarray(domain_states)
+        domain_states = domain_states[:, reduction.conserved(domain_states)]
+        domain_states = reduction.reduce_states(domain_states)
+    
+    domain_enum = state_enum.create(domain_states)
+    matrix_enum = domain_enum
+    if reduced:
+        # enumerate the full states in the order of the reduced states, so
+        # both enumerations index the same packed solution
+        domain_enum = state_enum.create_ordered(
+            reduction.expand_states(matrix_enum.unordered_states)
+        )
+    
+    member_flags = domain_enum.contains(p_0_states)
+    if not numpy.logical_and.reduce(member_flags):
+        raise ValueError('support of p_0 is not a subset of domain_states')
+    
+    # compute reaction matrices
+    gen_matrices = cme_matrix.gen_reaction_matrices(
+        matrix_model,
+        matrix_enum,
+        sink,
+        validity_test,
+        outflow=outflow,
+        propensity_cache=propensity_cache
+    )
+    reaction_matrices = list(gen_matrices)
+    return domain_enum, reaction_matrices
+
 def create(model,
            sink,
            p_0=None,
@@ -55,6 +185,9 @@ def create(model,
            domain_states=None,
            solver=ode_solver.Solver,
            outflow=False,
+           reduced=False,
+           propensity_cache=None,
+           tensor_train=False,
            **solver_args):
     """
     Returns a solver for the Chemical Master Equation of the given model.
@@ -74,7 +207,9 @@ def create(model,
             for the initial probability distribution. If not specified,
             and the initial state of the state space is given by the model,
             defaults to all probability concentrated at the initial state,
-            otherwise, a ValueError will be raised.
+            otherwise, a ValueError will be raised. Alternatively, p_0 may
+            be given as a pair of arrays (p_states, p_values) of states and
+            their probabilities.
         
         t_0 : (optional) initial time, defaults to 0.0
         
@@ -112,6 +247,42 @@ def create(model,
             By default, generate the rectangular lattice of states defined by
             the 'shape' entry of the model. A ValueError is raised if both
             domain_states and 'shape' are unspecified.
+        
+        reduced : (optional) If reduced is True, the CME is solved in the
+            reduced coordinates of the model's linear conservation laws,
+            see ``cmepy.model.reduction``. The conserved quantities are those
+            of the model's initial state, or of the first state of p_0, if
+            given. States of domain_states that do not share these conserved
+            quantities are excluded from the domain, while the default domain
+            only contains the states of the rectangular lattice defined by
+            'shape' that share them. All other arguments and results remain
+            in the full coordinates of the model. Defaults to False.
+        
+        propensity_cache : (optional) cache of propensity values, created
+            by ``cmepy.cme_matrix.create_propensity_cache`` for the model.
+            If given, propensities are only evaluated for domain states
+            not already in the cache, which is updated with them. This
+            speeds up recreating solvers for the same model on overlapping
+            domains. Not supported if reduced is True.
+        
+        solver : (optional) class of the returned solver, defaults to
+            ``cmepy.ode_solver.Solver``. Any additional keyword arguments
+            are passed to the solver class, together with the keyword
+            arguments reaction_matrices and time_dependencies, see for
+            instance ``cmepy.multilevel.ImplicitEulerSolver``.
+        
+        tensor_train : (optional) If tensor_train is True, the solution is
+            stored as a low-rank tensor train over the rectangular domain
+            defined by 'shape', rather than as a dense array over the domain
+            states, see ``cmepy.tensor_train.create``. This requires sink to
+            be False, and the default domain. Additional keyword arguments,
+            such as max_rank and tolerance, are passed to
+            ``cmepy.tensor_train.create``. Defaults to False.
+    
+    The state enumeration of the domain is stored as the ``domain_enum``
+    attribute of the returned solver. The i-th element of the packed
+    solution ``x`` of the solver is the probability of the state with index
+    i in this enumeration, followed by the sink probability, if present.
     """
     
     mdl.validate_model(model)
@@ -119,6 +290,20 @@ def create(model,
     if sink and outflow:
         raise ValueError('sink and outflow cannot be both True')
     
+    if tensor_train:
+        if sink or outflow or reduced or (sink_0 is not None):
+            raise ValueError('tensor_train requires sink to be False')
+        if (domain_states is not None) or (propensity_cache is not None):
+            lament = 'tensor_train requires the default domain of the model'
+            raise ValueError(lament)
+        if solver is not ode_solver.Solver:
+            raise ValueError('solver may not be specified if tensor_train')
+        return cmepy.tensor_train.create(model,
+                                         p_0 = p_0,
+                                         t_0 = t_0,
+                                         time_dependencies = time_dependencies,
+                                         **solver_args)
+    
     if sink_0 is not None:
         if not sink:
             raise ValueError('sink_0 may not be specified if sink is False')
@@ -126,43 +311,28 @@ def create(model,
     else:
         sink_0 = 0.0
     
-    # determine states in domain, then construct an enumeration of the
-    # domain states
-    if domain_states is None:
-        if mdl.SHAPE not in model:
-            lament = 'if no states given, model must contain key \'%s\''
-            raise KeyError(lament % mdl.SHAPE)
-        else:
-            domain_states = domain.from_rect(shape = model.shape)
-    
-    domain_enum = state_enum.create(domain_states)
-    
-    # determine p_0, then construct a dense representation with respect to
-    # the domain enumeration
-    initial_state = model.get(mdl.INITIAL_STATE, None)
+    # determine p_0, then the domain and the reaction matrices
     if p_0 is None:
-        if initial_state is None:
-            lament = 'if no p_0 given, model must contain key \'%s\''
-            raise ValueError(lament % mdl.INITIAL_STATE)
-        else:
-            p_0 = {initial_state : 1.0}
+        p_0 = default_p_0(model)
+    if type(p_0) is tuple:
+        p_0_states = p_0[0]
+    else:
+        p_0_states = domain.from_iter(p_0)
     
     if t_0 is None:
         t_0 = 0.0
     
-    member_flags = domain_enum.contains(domain.from_iter(p_0))
-    if not numpy.logical_and.reduce(member_flags):
-        raise ValueError('support of p_0 is not a subset of domain_states')
-    
-    # compute reaction matrices and use them to define differential equations
-    gen_matrices = cme_matrix.gen_reaction_matrices(
+    domain_enum, reaction_matrices = create_reaction_matrices(
         model,
-        domain_enum,
         sink,
-        cme_matrix.non_neg_states,
-        outflow=outflow
+        p_0_states,
+        domain_states,
+        outflow,
+        reduced,
+        propensity_cache
     )
-    reaction_matrices = list(gen_matrices)
+    
+    # use the reaction matrices to define differential equations
     dy_dt = cme_matrix.create_diff_eqs(
         reaction_matrices,
         phi = time_dependencies
@@ -170,6 +340,7 @@ def create(model,
     
     if solver_args:
         solver_args['reaction_matrices'] = reaction_matrices
+        solver_args['time_dependencies'] = time_dependencies
 
     # construct and initialise solver
     if sink:
@@ -199,4 +370,123 @@ def create(model,
             unpack,
             transform_dy_dt = False
         )
+    cme_solver.domain_enum = domain_enum
+    return cme_solver
+
+def create_block(model,
+                 sink,
+                 p_0_block,
+                 t_0=None,
+                 sink_0=None,
+                 time_dependencies=None,
+                 domain_states=None,
+                 solver=ode_solver.Solver,
+                 **solver_args):
+    """
+    Returns a solver propagating a block of several initial distributions
+    for the Chemical Master Equation of the given model together.
+    
+    The K columns of the block are integrated as a single system, where
+    the derivative of the whole (n, K) block is computed by multiplying the
+    sparse CME matrix with the dense block, rather than with each column
+    separately.
+    
+    arguments:
+    
+        p_0_block : the initial distributions, given either as a sequence of
+            K distributions, each of the form accepted for p_0 by ``create``,
+            or as a pair of arrays (p_states, p_values), where p_values is a
+            2d array whose k-th column holds the probabilities of the states
+            p_states in the k-th initial distribution.
+        
+        sink_0 : (optional) initial sink probability of each column, either
+            a single value shared by all columns, or a sequence of K values.
+            Defaults to 0.0. Only a valid argument if sink is set to True.
+    
+    The remaining arguments are as for ``create``.
+    
+    The solution y of the returned solver is a list of the K solutions of
+    the columns, in order, each of the same form as the solution of the
+    solver returned by ``create``, that is, (p, p_sink) if sink is True, and
+    p otherwise. The packed solution x is the flattened (n, K) block, where
+    n is the size of the domain enumeration ``domain_enum``, plus one for
+    the sink state if sink is True.
+    """
+    
+    mdl.validate_model(model)
+    
+    if type(p_0_block) is tuple:
+        p_0_states, p_0_values = p_0_block
+        p_0_values = numpy.asarray(p_0_values)
+        if numpy.ndim(p_0_values) != 2:
+            raise ValueError('p_0_block values must be a 2d array')
+        p_0_block = [(p_0_states, p_0_values[:, k])
+                     for k in xrange(numpy.size(p_0_values, 1))]
+    else:
+        p_0_block = list(p_0_block)
+    block_size = len(p_0_block)
+    if block_size == 0:
+        raise ValueError('p_0_block must contain at least one distribution')
+    
+    if sink_0 is not None:
+        if not sink:
+            raise ValueError('sink_0 may not be specified if sink is False')
+        sink_0 = numpy.asarray(sink_0, dtype=numpy.float)
+        sink_0 = sink_0 * numpy.ones((block_size, ))
+    else:
+        sink_0 = numpy.zeros((block_size, ))
+    
+    if t_0 is None:
+        t_0 = 0.0
+    
+    p_0_states = []
+    for p_0 in p_0_block:
+        if type(p_0) is tuple:
+            p_0_states.append(numpy.asarray(p_0[0]))
+        elif len(p_0) > 0:
+            p_0_states.append(domain.from_iter(p_0))
+    if sum(numpy.size(states) for states in p_0_states) == 0:
+        lament = 'p_0_block must contain at least one non-empty distribution'
+        raise ValueError(lament)
+    p_0_states = numpy.hstack(p_0_states)
+    
+    domain_enum, reaction_matrices = create_reaction_matrices(
+        model,
+        sink,
+        p_0_states,
+        domain_states
+    )
+    
+    # the sparse matrix terms of diff_eqs multiply the (n, K) block at once
+    diff_eqs = cme_matrix.create_diff_eqs(
+        reaction_matrices,
+        phi = time_dependencies
+    )
+    size = domain_enum.size + int(bool(sink))
+    def dy_dt(t, x):
+        """
+        returns dx / dt for given t and flattened block x
+        """
+        block = numpy.reshape(x, (size, block_size))
+        return numpy.ravel(diff_eqs(t, block))
+    
+    if sink:
+        y_0 = zip(p_0_block, sink_0)
+    else:
+        y_0 = p_0_block
+    cme_solver = solver(
+        dy_dt,
+        y_0 = y_0,
+        t_0 = t_0,
+        **solver_args
+    )
+    pack, unpack = create_block_packing_functions(domain_enum,
+                                                  sink,
+                                                  block_size)
+    cme_solver.set_packing(
+        pack,
+        unpack,
+        transform_dy_dt = False
+    )
+    cme_solver.domain_enum = domain_enum
     return cme_solver
@@ -17,6 +17,20 @@ def create(initial_states):
     """
     return StateEnum(initial_states)
 
+def create_ordered(states):
+    """
+    create_ordered(states) -> StateEnum instance
+    
+    instantiates a StateEnum instance for the unique states in the array
+    'states', where states[:, i] is assigned the index i.
+    """
+    states = numpy.asarray(states)
+    enum = StateEnum(numpy.zeros((numpy.size(states, 0), 0), dtype=numpy.int))
+    enum.unordered_states = states
+    enum.index = numpy.arange(numpy.size(states, 1))
+    enum.update_ordering()
+    return enum
+
 class StateEnum(object):
     """
     Maintains bijection between set of n unique states and range(n)
@@ -60,8 +74,9 @@ class StateEnum(object):
         
         self.unordered_states = numpy.hstack((self.unordered_states,
                                               sigma_unique))
-        index = numpy.arange(self.size, self.size+sigma_unique.shape[1])
-        self.index = numpy.concatenate((self.index, index))
+        # the existing index array is held in lexical order of the states,
+        # so the ordering must be recomputed from the unordered indices
+        self.index = numpy.arange(self.size+sigma_unique.shape[1])
         self.update_ordering()
     
     def reinitialise(self, initial_states):
@@ -76,6 +91,20 @@ class StateEnum(object):
         self.update_ordering()
         self.offset = 0
         
+    def is_ordering(self, states):
+        """
+        is_ordering(states) -> bool
+        
+        returns True if the array 'states' contains exactly the states of this
+        enumeration, in enumeration order, that is, if states[:, i] is the
+        state with index i + offset for each i.
+        """
+        states = numpy.asarray(states)
+        if states is self.unordered_states:
+            return True
+        return numpy.shape(states) == numpy.shape(self.unordered_states) and \
+            numpy.array_equal(states, self.unordered_states)
+    
     def indices(self, states):
         """
         indices(states) -> index_array
@@ -148,11 +177,26 @@ class StateEnum(object):
         """
         convenience routine to translate a distribution from a dictionary to
         a dense array, using this state enumeration 
+        
+        p_sparse may also be given as a pair of arrays (p_states, p_values),
+        where the i-th state in p_states is associated with the i-th value in
+        p_values. If p_states is the array of states of this enumeration,
+        in enumeration order, the values are copied without any lookup.
         """
         
         if p_dense is None:
             p_dense = numpy.zeros((self.size, ), dtype=numpy.float)
         
+        if type(p_sparse) is tuple:
+            p_states, p_values = p_sparse
+            if numpy.size(p_values) == 0:
+                return p_dense
+            if self.is_ordering(p_states):
+                p_dense[:] = p_values
+            else:
+                p_dense[self.indices(p_states)] = p_values
+            return p_dense
+        
         # guard against case where p_sparse is empty
         if len(p_sparse) == 0:
             return p_dense
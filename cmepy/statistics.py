@@ -6,7 +6,7 @@ import itertools
 import operator
 import numpy
 
-from cmepy import domain
+from cmepy import domain, lexarrayset
 
 class Distribution(dict):
     """
@@ -34,6 +34,8 @@ class Distribution(dict):
             'expected_value' : self.expectation,
             'variance' : self.variance,
             'covariance' : self.covariance,
+            'covariance_matrix' : self.covariance_matrix,
+            'correlation_matrix' : self.correlation_matrix,
             'standard_deviation' : self.standard_deviation
         }
     
@@ -70,6 +72,15 @@ class Distribution(dict):
         """
         return Distribution(map_distribution(f, self, g))
     
+    def marginal(self, dims):
+        """
+        d.marginal(dims) -> distribution
+        
+        Returns the marginal distribution of d over the coordinates with
+        the indices given by the sequence dims.
+        """
+        return self.map(projection(dims))
+    
     def expectation(self):
         """
         d.expectation() -> mu
@@ -97,6 +108,26 @@ class Distribution(dict):
         assert self.dimension == 2
         return covariance(self)
     
+    def covariance_matrix(self):
+        """
+        d.covariance_matrix() -> cov
+        
+        Returns covariance matrix of the distribution d, provided
+        dimension > 0.
+        """
+        assert self.dimension > 0
+        return covariance_matrix(self)
+    
+    def correlation_matrix(self):
+        """
+        d.correlation_matrix() -> corr
+        
+        Returns correlation matrix of the distribution d, provided
+        dimension > 0.
+        """
+        assert self.dimension > 0
+        return correlation_matrix(self)
+    
     def standard_deviation(self):
         """
         d.standard_deviation() -> sigma
@@ -105,6 +136,16 @@ class Distribution(dict):
         """
         return numpy.sqrt(self.variance())
     
+    def moments(self, order=2):
+        """
+        d.moments([order]) -> Moments instance
+        
+        Returns the moments of the distribution d of orders up to order,
+        provided dimension > 0.
+        """
+        assert self.dimension > 0
+        return moments(self, order)
+    
     def to_dense(self, shape, origin=None):
         """
         Returns dense version of distribution for given array shape and origin
@@ -221,13 +262,25 @@ class Distribution(dict):
         """
         return lp_norm(self, p)
     
-    def lp_distance(self, other, p=1):
+    def lp_distance(self, other, p=1, state_enum=None):
         """
         Returns Lp distance to the distribution other. Default p = 1.
         """
-        return lp_distance(self, other, p)
+        return lp_distance(self, other, p, state_enum)
+    
+    def hellinger_distance(self, other, state_enum=None):
+        """
+        Returns Hellinger distance to the distribution other.
+        """
+        return hellinger_distance(self, other, state_enum)
+    
+    def total_variation_distance(self, other, state_enum=None):
+        """
+        Returns total variation distance to the distribution other.
+        """
+        return total_variation_distance(self, other, state_enum)
     
-    def kl_divergence(self, other):
+    def kl_divergence(self, other, state_enum=None):
         """
         Returns KL divergence to the distribution other from this distribution.
         
@@ -239,7 +292,118 @@ class Distribution(dict):
            \\sum_{x} p(x) \\log{} \\frac{p(x)}{q(x)}
         
         """
-        return kl_divergence(self, other)
+        return kl_divergence(self, other, state_enum)
+
+def projection(dims):
+    """
+    projection(dims) -> Projection instance
+    
+    Returns the transform projecting states onto the coordinates with the
+    indices given by the sequence dims, in order. Marginal distributions of
+    projections are computed without evaluating the transform for each
+    state, see map_distribution.
+    """
+    return Projection(dims)
+
+def linear(coefficients, offset=None):
+    """
+    linear(coefficients [, offset]) -> LinearTransform instance
+    
+    Returns the linear transform mapping the state x to the state
+    dot(coefficients, x) + offset, where coefficients is a 2d integer array
+    and offset is an optional integer vector. For instance, the total copy
+    count of the first two species of a state is given by the transform
+    linear([[1, 1, 0]]).
+    """
+    return LinearTransform(coefficients, offset)
+
+class Projection(object):
+    """
+    Transform projecting states onto some of their coordinates.
+    """
+    def __init__(self, dims):
+        self.dims = tuple(int(dim) for dim in dims)
+    
+    def apply(self, states):
+        """
+        Returns the array of the images of the d by n array of states
+        """
+        return numpy.asarray(states)[list(self.dims)]
+    
+    def __call__(self, state):
+        return tuple(state[dim] for dim in self.dims)
+    
+    def __add__(self, other):
+        """
+        Returns the projection concatenating the images of both projections
+        """
+        return Projection(self.dims + other.dims)
+    
+    def __repr__(self):
+        return 'Projection(%r)' % (self.dims, )
+
+class LinearTransform(object):
+    """
+    Integer linear transform of states.
+    """
+    def __init__(self, coefficients, offset=None):
+        self.coefficients = numpy.array(coefficients, dtype=numpy.int)
+        if numpy.ndim(self.coefficients) != 2:
+            raise ValueError('coefficients must be a 2d array')
+        if offset is None:
+            offset = numpy.zeros((numpy.size(self.coefficients, 0), ))
+        self.offset = numpy.array(offset, dtype=numpy.int)
+        if numpy.shape(self.offset) != (numpy.size(self.coefficients, 0), ):
+            raise ValueError('offset must have one entry per row')
+    
+    def apply(self, states):
+        """
+        Returns the array of the images of the d by n array of states
+        """
+        return numpy.dot(self.coefficients, states) + \
+               self.offset[:, numpy.newaxis]
+    
+    def __call__(self, state):
+        return tuple(numpy.dot(self.coefficients, state) + self.offset)
+    
+    def __repr__(self):
+        return 'LinearTransform(%r, %r)' % (self.coefficients.tolist(),
+                                            self.offset.tolist())
+
+def dense_marginal(f, p):
+    """
+    dense_marginal(f, p) -> p_dense, origin
+    
+    Returns the marginal distribution of the mapping p under the integer
+    valued transform f as a dense array, indexed by image states relative to
+    the returned origin, the least coordinates of any image state. The
+    distribution p may also be given as a pair of arrays (states, values).
+    The array is accumulated with numpy.bincount over the packed image
+    coordinates. See Distribution.from_dense for the inverse conversion.
+    """
+    if type(p) is tuple:
+        states, values = p
+    elif len(p) == 0:
+        return numpy.zeros((0, )), (0, )
+    else:
+        states, values = domain.from_mapping(p)
+    if isinstance(f, (Projection, LinearTransform)):
+        image = f.apply(states)
+    else:
+        image = numpy.asarray(f(states))
+        if len(image.shape) != 2:
+            image = image*numpy.ones((1, numpy.shape(states)[1]),
+                                     dtype=image.dtype)
+    if not numpy.issubdtype(image.dtype, numpy.integer):
+        raise ValueError('transform must be integer valued')
+    origin = numpy.min(image, axis=1)
+    shape = tuple(numpy.max(image, axis=1) - origin + 1)
+    packed = numpy.ravel_multi_index(tuple(image - origin[:, numpy.newaxis]),
+                                     shape)
+    p_dense = numpy.bincount(packed,
+                             weights=values,
+                             minlength=int(numpy.prod(shape)))
+    return numpy.reshape(p_dense, shape), tuple(origin)
 
 def map_distribution_simple(f, p, g=None):
     """
@@ -277,32 +441,66 @@ def map_distribution(f, p, g=None):
     for example, setting g to a numpy ufunc would be fine.
     """
     
-    # all this nonsense actually does something fairly straight forward
-    # see 'map_distribution_simple' for a reference implementation that
-    # avoids numpy operations
-    
-    num_items = len(p)
-    
-    if num_items == 0:
+    if len(p) == 0:
         return {}
     
-    if g is None:
-        g = numpy.add
-    
     s, v = domain.from_mapping(p)
-    fs = numpy.asarray(f(s))
+    image_states, image_values = map_arrays(f, s, v, g)
+    return dict(itertools.izip(domain.to_iter(image_states), image_values))
+
+def map_arrays(f, states, values, g=None):
+    """
+    map_arrays(f, states, values [, g]) -> image_states, image_values
+    
+    Array version of map_distribution, for the distribution given by the
+    array of states and the array of corresponding values. Returns the
+    array of the unique images of the states under f, in lexical order,
+    and the array of the reduced values of each image state.
+    """
+    if isinstance(f, (Projection, LinearTransform)):
+        # evaluate directly over the state array, without calling f
+        return reduce_arrays(f.apply(states), values, g)
+    fs = numpy.asarray(f(states))
     
     # handle case where f returns scalar arguments, say
     # this might be a touch flakey
     if len(fs.shape) != 2:
-        fs = fs*numpy.ones((1, s.shape[1]))
+        fs = fs*numpy.ones((1, numpy.shape(states)[1]), dtype=fs.dtype)
+    return reduce_arrays(fs, values, g)
+
+# largest number of bins, relative to the number of states, of the lattice
+# spanned by integer image states for reduce_arrays to count them directly
+BINCOUNT_RATIO = 4
+
+def reduce_arrays(image_states, values, g=None):
+    """
+    reduce_arrays(image_states, values [, g]) -> unique_states, reduced_values
+    
+    Returns the array of the unique states of the array image_states, in
+    lexical order, and the array of the values of each unique state reduced
+    by g, which defaults to addition. See map_distribution.
+    
+    Integer image states spanning a small lattice are summed by counting
+    their packed coordinates, without sorting.
+    """
+    image_states = numpy.asarray(image_states)
+    values = numpy.asarray(values)
+    num_items = numpy.size(values)
+    if num_items == 0:
+        return image_states, values
+    
+    if g is None:
+        if numpy.issubdtype(image_states.dtype, numpy.integer):
+            reduced = _bincount_reduce(image_states, values)
+            if reduced is not None:
+                return reduced
+        g = numpy.add
     
     # sort image states using lexical ordering on coords, then
     # apply same ordering to values
-    
-    order = numpy.lexsort(fs)
-    sfs = fs[:, order]
-    sv = v[order]
+    order = numpy.lexsort(image_states)
+    sfs = image_states[:, order]
+    sv = values[order]
     
     # figure out the indices of the first instance of each state
     not_equal_adj = numpy.logical_or.reduce(sfs[:, :-1] != sfs[:, 1:])
@@ -311,23 +509,44 @@ def map_distribution(f, p, g=None):
     # extract the unique image states under f
     usfs = sfs[:, not_equal_adj]
     
-    # convert back from arrya representation to iterator of state tuples
-    unique_image_states = domain.to_iter(usfs)
-    
     # determine start and end indices of each equivalence class of
     # values in the sorted values array, where values are equivalent if
-    # they are associated with states that agree under the transform f
+    # they are associated with states that agree under the transform f,
+    # then reduce the values in each class by g
     class_begin = numpy.nonzero(not_equal_adj)[0]
-    class_end = numpy.concatenate((class_begin[1:], [num_items]))
-    
-    # construct the resulting mapped probability distribution
-    # each image state s maps to the values in its equivalence class,
-    # reduced by g
-    p_mapped = {}
-    for s, i, j in itertools.izip(unique_image_states, class_begin, class_end):
-        p_mapped[s] = g.reduce(sv[i:j])
-    
-    return p_mapped
+    if hasattr(g, 'reduceat'):
+        reduced_values = g.reduceat(sv, class_begin)
+    else:
+        class_end = numpy.concatenate((class_begin[1:], [num_items]))
+        reduced_values = numpy.array([g.reduce(sv[i:j]) for (i, j)
+                                      in itertools.izip(class_begin,
+                                                        class_end)])
+    return usfs, reduced_values
+
+def _bincount_reduce(image_states, values):
+    """
+    Returns unique integer image states and summed values by counting the
+    packed coordinates of the states, or None if the lattice spanned by the
+    states is too large
+    """
+    num_items = numpy.size(values)
+    lower = numpy.min(image_states, axis=1)
+    extents = numpy.max(image_states, axis=1) - lower + 1
+    bins = 1
+    for extent in extents:
+        bins *= int(extent)
+    if bins > BINCOUNT_RATIO*num_items + 1024:
+        return None
+    # pack coordinates with the last coordinate most significant, so the
+    # packed order is the lexical order used by lexsort
+    offsets = image_states - lower[:, numpy.newaxis]
+    packed = numpy.ravel_multi_index(tuple(offsets[::-1]), tuple(extents[::-1]))
+    present = numpy.bincount(packed, minlength=bins) > 0
+    sums = numpy.bincount(packed, weights=values, minlength=bins)
+    keys = numpy.nonzero(present)[0]
+    unique_states = numpy.array(numpy.unravel_index(keys, tuple(extents[::-1])))
+    unique_states = unique_states[::-1] + lower[:, numpy.newaxis]
+    return unique_states.astype(image_states.dtype), sums[keys]
         
         
 def expectation(p):
@@ -385,6 +604,186 @@ def covariance(p):
     """
     return _metavariance(p, exponent=1)
 
+def covariance_matrix(p):
+    """
+    covariance_matrix(p) -> cov
+    
+    Returns the d by d covariance matrix cov, treating the mapping p as a
+    distribution p : states -> probabilities over d dimensional states. The
+    distribution p may also be given as a pair of arrays (states, values).
+    
+    The matrix is computed as a single product of the array of the centred
+    states with the same array weighted by the probabilities.
+    """
+    return moments(p, 2).covariance
+
+def correlation_matrix(p):
+    """
+    correlation_matrix(p) -> corr
+    
+    Returns the d by d correlation matrix corr, treating the mapping p as a
+    distribution p : states -> probabilities over d dimensional states. See
+    covariance_matrix.
+    """
+    return moments(p, 2).correlation
+
+def moments(p, order=2):
+    """
+    moments(p [, order]) -> Moments instance
+    
+    Returns the moments of the distribution p of orders up to order,
+    treating the mapping p as a distribution p : states -> probabilities.
+    The distribution p may also be given as a pair of arrays (states,
+    values). See Moments.
+    """
+    if type(p) is tuple:
+        states, probabilities = p
+    else:
+        states, probabilities = domain.from_mapping(p)
+    return Moments(states, probabilities, order)
+
+class Moments(object):
+    """
+    Raw and central moments of a distribution, up to some order.
+    
+    All moments are computed together from the array representation of the
+    distribution, when the Moments instance is created. Moments of each
+    order are arrays over the coordinates of the states, that is, they are
+    moments of the marginal distributions of each coordinate, while the
+    covariance matrix holds the mixed second order central moments.
+    
+    As for expectation and variance, the moments are not normalised by the
+    total probability of the distribution.
+    """
+    def __init__(self, states, probabilities, order=2):
+        """
+        Computes the moments of the distribution given by the d by n array of
+        states and the array of their probabilities, of orders up to order.
+        """
+        if order < 1:
+            raise ValueError('order must be at least 1')
+        self.order = order
+        self._states = numpy.asarray(states)
+        self._probabilities = numpy.asarray(probabilities, dtype=numpy.float)
+        states = numpy.asarray(states, dtype=numpy.float)
+        probabilities = self._probabilities
+        
+        self.dimension = numpy.size(states, 0)
+        self.total = numpy.add.reduce(probabilities)
+        self.mean = numpy.dot(states, probabilities)
+        diffs = states - self.mean[:, numpy.newaxis]
+        
+        ones = numpy.ones((self.dimension, ))
+        self.raw = [self.total*ones, self.mean]
+        self.central = [self.total*ones, numpy.dot(diffs, probabilities)]
+        weighted_states = states*probabilities
+        weighted_diffs = diffs*probabilities
+        for _ in xrange(2, order + 1):
+            weighted_states *= states
+            weighted_diffs *= diffs
+            self.raw.append(numpy.add.reduce(weighted_states, axis=1))
+            self.central.append(numpy.add.reduce(weighted_diffs, axis=1))
+        
+        if order >= 2:
+            self.covariance = numpy.dot(diffs*probabilities, diffs.T)
+        else:
+            self.covariance = None
+    
+    def _require(self, order):
+        """
+        Raises ValueError if moments of the given order were not computed
+        """
+        if order > self.order:
+            lament = 'moments of order %d not computed, order is %d'
+            raise ValueError(lament % (order, self.order))
+    
+    def raw_moment(self, k):
+        """
+        Returns the array of the k-th raw moments E[X_i**k]
+        """
+        self._require(k)
+        return self.raw[k]
+    
+    def central_moment(self, k):
+        """
+        Returns the array of the k-th central moments E[(X_i - mu_i)**k]
+        """
+        self._require(k)
+        return self.central[k]
+    
+    @property
+    def variance(self):
+        """
+        *Read only* property returning the array of the variances
+        """
+        return self.central_moment(2)
+    
+    @property
+    def standard_deviation(self):
+        """
+        *Read only* property returning the array of the standard deviations
+        """
+        return numpy.sqrt(self.variance)
+    
+    @property
+    def correlation(self):
+        """
+        *Read only* property returning the correlation matrix, that is, the
+        covariance matrix divided by the products of the standard deviations.
+        Correlations of coordinates with zero variance are NaN.
+        """
+        self._require(2)
+        deviations = numpy.sqrt(numpy.diag(self.covariance))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return self.covariance / numpy.outer(deviations, deviations)
+    
+    @property
+    def skewness(self):
+        """
+        *Read only* property returning the array of the skewnesses, that is,
+        the third central moments divided by the cubed standard deviations
+        """
+        self._require(3)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return self.central[3] / self.standard_deviation**3
+    
+    @property
+    def kurtosis(self):
+        """
+        *Read only* property returning the array of the excess kurtoses, that
+        is, the fourth central moments divided by the squared variances,
+        minus 3. These are NaN for coordinates with zero variance.
+        """
+        self._require(4)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return self.central[4] / self.variance**2 - 3.0
+    
+    def quantiles(self, q):
+        """
+        quantiles(q) -> array
+        
+        Returns the q-quantiles of the marginal distribution of each
+        coordinate, where q is a scalar or an array of probabilities between
+        0 and 1. The q-quantile is the least value x of the coordinate such
+        that P(X_i <= x) >= q. The first axis of the returned array indexes
+        the coordinates, any remaining axes index q.
+        """
+        q = numpy.asarray(q, dtype=numpy.float)
+        result = numpy.empty((self.dimension, ) + numpy.shape(q),
+                             dtype=self._states.dtype)
+        for i in xrange(self.dimension):
+            values, marginal = reduce_arrays(self._states[i:i+1],
+                                             self._probabilities)
+            cumulative = numpy.add.accumulate(marginal) / self.total
+            index = numpy.searchsorted(cumulative, q)
+            index = numpy.minimum(index, numpy.size(cumulative) - 1)
+            result[i] = values[0][index]
+        return result
+
+# initial number of the smallest probabilities that compress sorts, which is
+# doubled until the discarded states are found
+COMPRESS_BLOCK_SIZE = 1024
+
 def compress(p, epsilon):
     """
     compress(p, epsilon) -> compressed epsilon-approximation of p
@@ -393,36 +792,69 @@ def compress(p, epsilon):
     p : states -> probabilities. The returned approximation is *compressed*,
     in the sense that it is the approximation with the smallest support, while
     the error between p and the approximation is within epsilon (L1 norm).
+    
+    The distribution p may also be given as a pair of arrays (states, values),
+    in which case the approximation is returned as a pair of arrays, see
+    compress_arrays.
     """
+    if type(p) is tuple:
+        states, probabilities = p
+        return compress_arrays(states, probabilities, epsilon)
     
     if not (0.0 <= epsilon <= 1.0):
         raise ValueError('epsilon must be within range: 0.0 <= epsilon <= 1.0')
+    if len(p) == 0:
+        return {}
+    states, probabilities = domain.from_mapping(p)
+    states, probabilities = compress_arrays(states, probabilities, epsilon)
+    return dict(itertools.izip(domain.to_iter(states), probabilities))
+
+def compress_arrays(states, probabilities, epsilon):
+    """
+    compress_arrays(states, probabilities, epsilon) -> states, probabilities
     
-    p_compressed = {}
+    Array version of compress, for the distribution given by the d by n array
+    of states and the array of their probabilities. Returns the arrays of the
+    states and probabilities of the compressed approximation, in their
+    original order.
     
-    if len(p) > 0:
-        # create array representation of distribution
-        states, probabilities = domain.from_mapping(p)
-        
-        # order entries with respect to increasing probability
-        order = numpy.argsort(probabilities)
-        states = states.transpose()[order]
-        probabilities = probabilities[order]
-        
-        # discard the largest number of states while keeping the
-        # corresponding net probability discarded below epsilon
-        cumulative_probability = numpy.add.accumulate(probabilities)
-        approximation = (cumulative_probability >= epsilon)
-        states = states[approximation]
-        probabilities = probabilities[approximation]
-        
-        assert len(states) == len(probabilities)
-        
-        # convert approximation back to a sparse dictionary format
-        for state, probability in itertools.izip(states, probabilities):
-            p_compressed[tuple(state)] = probability
-        
-    return p_compressed
+    Only states with probability less than epsilon may be discarded, and only
+    the smallest of these are sorted, using numpy.argpartition to select
+    them, so the cost is linear in the number of states when few states are
+    discarded.
+    """
+    if not (0.0 <= epsilon <= 1.0):
+        raise ValueError('epsilon must be within range: 0.0 <= epsilon <= 1.0')
+    states = numpy.asarray(states)
+    probabilities = numpy.asarray(probabilities)
+    
+    candidates = numpy.flatnonzero(probabilities < epsilon)
+    tail = probabilities[candidates]
+    tail_size = numpy.size(tail)
+    if tail_size == 0:
+        return states, probabilities
+    
+    # sort increasing blocks of the smallest candidates, until the net
+    # probability of the block reaches epsilon
+    block_size = min(tail_size, COMPRESS_BLOCK_SIZE)
+    while True:
+        if block_size < tail_size:
+            block = numpy.argpartition(tail, block_size - 1)[:block_size]
+        else:
+            block = numpy.arange(tail_size)
+        block = block[numpy.argsort(tail[block], kind='mergesort')]
+        cumulative_probability = numpy.add.accumulate(tail[block])
+        if (block_size == tail_size) or \
+           (cumulative_probability[-1] >= epsilon):
+            break
+        block_size = min(2*block_size, tail_size)
+    
+    # discard the largest number of states while keeping the
+    # corresponding net probability discarded below epsilon
+    discarded = numpy.searchsorted(cumulative_probability, epsilon)
+    approximation = numpy.ones(numpy.shape(probabilities), dtype=numpy.bool)
+    approximation[candidates[block[:discarded]]] = False
+    return states[:, approximation], probabilities[approximation]
 
 def lp_norm(d, p = 1):
     """
@@ -431,15 +863,104 @@ def lp_norm(d, p = 1):
     x = numpy.array(d.values(), dtype=numpy.float)
     return numpy.linalg.norm(x, ord = p)
 
-def lp_distance(x, y, p = 1):
+def _to_arrays(p):
+    """
+    Returns the arrays of states and float values of the distribution p,
+    given as a mapping or as a pair of arrays, or (None, []) if p is empty
+    """
+    if type(p) is tuple:
+        states, values = p
+        return numpy.asarray(states), numpy.asarray(values, dtype=numpy.float)
+    if len(p) == 0:
+        return None, numpy.zeros((0, ))
+    states, values = domain.from_mapping(p)
+    return states, numpy.asarray(values, dtype=numpy.float)
+
+def align(p, q, state_enum=None):
+    """
+    align(p, q [, state_enum]) -> states, p_values, q_values
+    
+    Returns the array of the states in the union of the supports of the
+    distributions p and q, and the arrays of the probabilities of these
+    states under p and under q, which are zero outside their supports.
+    Distributions may be given either as mappings, or as pairs of arrays
+    (states, values).
+    
+    The supports are merged by sorting their states together. If p and q
+    are both given as arrays over the same array of states, or if the state
+    enumeration state_enum containing both supports is given, the values
+    are aligned without merging, and states is the shared array of states,
+    or the states of the enumeration, in enumeration order. A ValueError is
+    raised if state_enum does not contain both supports.
+    """
+    p_states, p_values = _to_arrays(p)
+    q_states, q_values = _to_arrays(q)
+    if p_states is None and q_states is None:
+        return numpy.zeros((0, 0), dtype=numpy.int), p_values, q_values
+    if p_states is None:
+        return q_states, numpy.zeros(numpy.shape(q_values)), q_values
+    if q_states is None:
+        return p_states, p_values, numpy.zeros(numpy.shape(p_values))
+    
+    if (p_states is q_states) or \
+       (numpy.shape(p_states) == numpy.shape(q_states) and
+        numpy.array_equal(p_states, q_states)):
+        return p_states, p_values, q_values
+    if state_enum is not None:
+        if not (numpy.logical_and.reduce(state_enum.contains(p_states)) and
+                numpy.logical_and.reduce(state_enum.contains(q_states))):
+            raise ValueError('supports are not contained in state_enum')
+        return (state_enum.unordered_states,
+                state_enum.pack_distribution((p_states, p_values)),
+                state_enum.pack_distribution((q_states, q_values)))
+    
+    states, inverse = lexarrayset.unique(
+        numpy.concatenate((p_states, q_states), axis=1),
+        return_inverse=True
+    )
+    size = numpy.size(states, 1)
+    n = numpy.size(p_values)
+    p_aligned = numpy.bincount(inverse[:n], p_values, minlength=size)
+    q_aligned = numpy.bincount(inverse[n:], q_values, minlength=size)
+    return states, p_aligned, q_aligned
+
+def lp_distance(x, y, p = 1, state_enum = None):
     """
     Returns the Lp distance between the distributions x & y. Default p = 1.
     
-    Equivalent to lp_norm(x - y, p)
+    Equivalent to lp_norm(x - y, p). See align for the optional state_enum
+    argument.
     """
-    return lp_norm(x - y, p)
+    _, x_values, y_values = align(x, y, state_enum)
+    return numpy.linalg.norm(x_values - y_values, ord = p)
 
-def kl_divergence(p, q):
+def total_variation_distance(p, q, state_enum=None):
+    """
+    Returns the total variation distance between the distributions p and q,
+    that is, half of their L1 distance. See align for the optional
+    state_enum argument.
+    """
+    _, p_values, q_values = align(p, q, state_enum)
+    return 0.5*numpy.add.reduce(numpy.abs(p_values - q_values))
+
+def hellinger_distance(p, q, state_enum=None):
+    """
+    Returns the Hellinger distance between the distributions p and q.
+    
+    The Hellinger distance is defined as
+    
+    .. math::
+    
+           \\textrm{Hellinger}(p, q) :=
+           \\sqrt{\\frac{1}{2} \\sum_{x} (\\sqrt{p(x)} - \\sqrt{q(x)})^2}
+    
+    See align for the optional state_enum argument.
+    """
+    _, p_values, q_values = align(p, q, state_enum)
+    diffs = numpy.sqrt(p_values) - numpy.sqrt(q_values)
+    return numpy.sqrt(0.5*numpy.add.reduce(diffs**2))
+
+def kl_divergence(p, q, state_enum=None):
     """
     Returns KL-divergence of distribution q from distribution p.
     
@@ -450,16 +971,15 @@ def kl_divergence(p, q):
            \\textrm{KL-divergence}(p, q) :=
            \\sum_{x} p(x) \\log{} \\frac{p(x)}{q(x)}
     
-    Warning: this function uses numpy's scalar floating point types to
-    perform the evaluation. Therefore, the result may be non-finite.
-    For example, if the state x has non-zero probability for distribution p,
-    but zero probability for distribution q, then the result will be
-    non-finite.
-    """
-    accum = 0.0
-    for x in p:
-        p_x = numpy.float_(p[x])
-        if p_x != 0.0:
-            q_x = numpy.float_(q.get(x, 0.0))
-            accum += p_x * numpy.log(p_x / q_x)
-    return accum
+    Warning: the result may be non-finite. For example, if the state x has
+    non-zero probability for distribution p, but zero probability for
+    distribution q, then the result will be non-finite.
+    
+    See align for the optional state_enum argument.
+    """
+    _, p_values, q_values = align(p, q, state_enum)
+    nonzero = p_values != 0.0
+    p_values = p_values[nonzero]
+    q_values = q_values[nonzero]
+    with numpy.errstate(divide='ignore'):
+        return numpy.add.reduce(p_values * numpy.log(p_values / q_values))
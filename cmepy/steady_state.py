@@ -0,0 +1,254 @@
+"""
+Computes stationary distributions of the CME on truncated domains.
+
+The CME generator is built with reflecting boundaries, as for solvers
+created with ``sink = False``, so that no probability leaves the domain.
+The stationary distribution is then the normalised null vector of the
+generator, which is computed directly instead of by time stepping.
+"""
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+from cmepy import cme_matrix, domain, multilevel, state_enum
+from cmepy import model as mdl
+
+METHODS = ('direct', 'gmres', 'power', 'aggregation')
+
+# default iteration limit of the 'power' and 'aggregation' methods, relative
+# to the number of domain states. Uniformised power iteration mixes slowly,
+# needing thousands of iterations for domains of tens of states.
+ITERATIONS_PER_STATE = 100
+
+def create_generator(model, domain_states=None):
+    """
+    create_generator(model [, domain_states]) -> domain_enum, generator, exits
+
+    Returns the enumeration of the domain states, the sparse CME generator
+    of the model on the domain with reflecting boundaries, and the array of
+    the total propensity of the transitions leaving the domain from each
+    state, in enumeration order.
+
+    By default, the domain is the rectangular lattice of states defined by
+    the 'shape' entry of the model.
+    """
+    mdl.validate_model(model)
+    if domain_states is None:
+        if mdl.SHAPE not in model:
+            lament = 'if no states given, model must contain key \'%s\''
+            raise KeyError(lament % mdl.SHAPE)
+        domain_states = domain.from_rect(shape = model.shape)
+    domain_enum = state_enum.create(domain_states)
+
+    def total(outflow):
+        """
+        returns the sum of the reaction matrices
+        """
+        matrices = cme_matrix.gen_reaction_matrices(model,
+                                                    domain_enum,
+                                                    False,
+                                                    cme_matrix.non_neg_states,
+                                                    outflow=outflow)
+        total_matrix = sum(matrices, scipy.sparse.csr_matrix(
+            (domain_enum.size, )*2
+        ))
+        cme_matrix.optimise_csr_matrix(total_matrix)
+        return total_matrix
+
+    generator = total(False)
+    # the columns of the generator with outflow sum to minus the outflow
+    exits = -numpy.ravel(total(True).sum(axis=0))
+    return domain_enum, generator, exits
+
+def solve(model,
+          domain_states=None,
+          method='direct',
+          tolerance=1.0e-10,
+          max_iterations=None,
+          p_0=None,
+          cell_shape=None):
+    """
+    solve(model [, domain_states [, method [, ...]]])
+    -> p, residual, outflow_rate
+
+    Returns the stationary distribution p of the CME of the model, on the
+    domain with reflecting boundaries, as a mapping from states to
+    probabilities.
+
+    Arguments:
+
+     * ``domain_states`` : (optional) array of states in the domain.
+       By default, the rectangular lattice of states defined by the
+       'shape' entry of the model is used.
+     * ``method`` : one of
+
+         * 'direct' : sparse direct solve (the default)
+         * 'gmres' : GMRES, preconditioned by an incomplete LU factorisation
+         * 'power' : power iteration of the uniformised generator
+         * 'aggregation' : iterative aggregation-disaggregation, which
+           alternates between solving the coarse generator over cells of
+           neighbouring states, and smoothing on the domain states
+
+     * ``tolerance`` : tolerance of the iterative methods
+     * ``max_iterations`` : (optional) iteration limit of the iterative
+       methods. The 'power' and 'aggregation' methods default to
+       ITERATIONS_PER_STATE times the number of domain states, and raise
+       RuntimeError if they have not converged within the limit.
+     * ``p_0`` : (optional) initial guess for the iterative methods, as a
+       mapping from states to probabilities. Defaults to the uniform
+       distribution over the domain.
+     * ``cell_shape`` : (optional) shape of the cells of the 'aggregation'
+       method, see ``cmepy.multilevel.aggregate``.
+
+    The residual is the l1 norm of the generator applied to p. The outflow
+    rate is the rate at which probability would leave the domain at p if the
+    boundaries were not reflecting, which estimates the error due to the
+    truncation of the domain: it is small if the domain holds almost all
+    of the stationary probability.
+    """
+    domain_enum, generator, exits = create_generator(model, domain_states)
+    if p_0 is not None:
+        p_0 = domain_enum.pack_distribution(p_0)
+    aggregation = None
+    if method == 'aggregation':
+        aggregation = multilevel.aggregate(domain_enum.unordered_states,
+                                           cell_shape)
+    p = solve_generator(generator, method, tolerance, max_iterations, p_0,
+                        aggregation)
+    residual, outflow_rate = error_estimates(generator, exits, p)
+    return domain_enum.unpack_distribution(p), residual, outflow_rate
+
+def error_estimates(generator, exits, p):
+    """
+    error_estimates(generator, exits, p) -> residual, outflow_rate
+
+    Returns the l1 norm of the residual of the stationary equation, and the
+    rate of outflow from the domain, for the dense stationary distribution p.
+    """
+    residual = numpy.add.reduce(numpy.abs(generator * p))
+    outflow_rate = numpy.dot(exits, p)
+    return residual, outflow_rate
+
+def solve_generator(generator,
+                    method='direct',
+                    tolerance=1.0e-10,
+                    max_iterations=None,
+                    p_0=None,
+                    aggregation=None):
+    """
+    solve_generator(generator [, method [, ...]]) -> p
+
+    Returns the normalised null vector p of the sparse generator matrix,
+    whose columns sum to zero. The 'aggregation' method requires the
+    aggregation of the states, see ``cmepy.multilevel.Aggregation``. See
+    solve for details of the remaining arguments.
+    """
+    if method not in METHODS:
+        raise ValueError('unknown method \'%s\'' % str(method))
+    size = generator.shape[0]
+    if p_0 is None:
+        p_0 = numpy.ones((size, )) / size
+    if size == 1:
+        return numpy.ones((1, ))
+    if (max_iterations is None) and (method in ('power', 'aggregation')):
+        max_iterations = ITERATIONS_PER_STATE*size
+
+    if method == 'power':
+        p = _power_iteration(generator, p_0, tolerance, max_iterations)
+    elif method == 'aggregation':
+        if aggregation is None:
+            raise ValueError('aggregation method requires an aggregation')
+        p = _aggregation_iteration(generator,
+                                   aggregation,
+                                   p_0,
+                                   tolerance,
+                                   max_iterations)
+    else:
+        # replace the last equation by the normalisation sum(p) = 1, as
+        # the equations of the generator are linearly dependent
+        system = scipy.sparse.vstack((
+            generator[:-1, :],
+            scipy.sparse.csr_matrix(numpy.ones((1, size)))
+        )).tocsc()
+        rhs = numpy.zeros((size, ))
+        rhs[-1] = 1.0
+        if method == 'direct':
+            p = scipy.sparse.linalg.spsolve(system, rhs)
+        else:
+            ilu = scipy.sparse.linalg.spilu(system)
+            preconditioner = scipy.sparse.linalg.LinearOperator(
+                (size, size),
+                matvec = ilu.solve
+            )
+            p, info = scipy.sparse.linalg.gmres(system,
+                                                rhs,
+                                                x0 = p_0,
+                                                tol = tolerance,
+                                                maxiter = max_iterations,
+                                                M = preconditioner)
+            if info != 0:
+                raise RuntimeError('gmres failed to converge (%d)' % info)
+    return normalise(p)
+
+def normalise(p):
+    """
+    Returns p with negative round-off errors removed, scaled to sum to one
+    """
+    p = numpy.maximum(numpy.real(p), 0.0)
+    return p / numpy.add.reduce(p)
+
+def _power_iteration(generator, p_0, tolerance, max_iterations):
+    """
+    Returns the fixed point of the uniformised generator, starting from p_0
+    """
+    # uniformise: p -> p + generator*p / rate is a stochastic matrix if
+    # rate is at least the largest total propensity of any state
+    rate = 1.05 * numpy.max(numpy.abs(generator.diagonal()))
+    if rate == 0.0:
+        return p_0
+    p = normalise(p_0)
+    iterations = 0
+    while True:
+        delta = (generator * p) / rate
+        p = p + delta
+        iterations += 1
+        if numpy.add.reduce(numpy.abs(delta)) < tolerance:
+            break
+        if iterations >= max_iterations:
+            raise RuntimeError('power iteration failed to converge')
+    return p
+
+def _aggregation_iteration(generator,
+                           aggregation,
+                           p_0,
+                           tolerance,
+                           max_iterations,
+                           smoothing_steps=2,
+                           damping=0.7):
+    """
+    Returns the null vector of the generator by iterative aggregation and
+    disaggregation, starting from p_0
+    """
+    diagonal = generator.diagonal()
+    inverse_diagonal = numpy.where(
+        diagonal != 0.0,
+        1.0 / numpy.where(diagonal != 0.0, diagonal, 1.0),
+        0.0
+    )
+    p = normalise(p_0)
+    iterations = 0
+    while True:
+        # solve for the cell totals, using p to weight states within cells
+        coarse = aggregation.coarse_matrix(generator, p)
+        p_coarse = solve_generator(coarse, 'direct')
+        p = aggregation.prolongation(p) * p_coarse
+        # damped Jacobi smoothing, as the generator may be periodic
+        for _ in xrange(smoothing_steps):
+            p = normalise(p - damping*inverse_diagonal*(generator*p))
+        iterations += 1
+        if numpy.add.reduce(numpy.abs(generator * p)) < tolerance:
+            break
+        if iterations >= max_iterations:
+            raise RuntimeError('aggregation iteration failed to converge')
+    return p
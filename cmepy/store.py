@@ -0,0 +1,259 @@
+"""
+Out-of-core storage of sequences of CME solutions.
+
+A solution store is a directory holding the solutions written to it, in
+chunks of consecutive solutions. Each solution is stored as the array of
+its probabilities, packed with respect to an array of domain states that
+is shared by all solutions over the same domain, and is only written again
+when the domain changes, as it may for FSP solvers. Domain state arrays
+are written uncompressed, and may be memory-mapped when read back, while
+chunks are written as optionally compressed .npz archives (see
+``cmepy.checkpoint``), which may also be memory-mapped if uncompressed.
+
+Stores may be used as the backend of a ``cmepy.recorder.CmeRecorder``, so
+solutions are kept on disk rather than in memory, and measurements are
+computed by streaming the solutions back from the store, one chunk at a
+time.
+"""
+
+import glob
+import os
+
+import numpy
+
+import cmepy.checkpoint
+from cmepy import domain
+
+DOMAIN_PATTERN = 'domain_%06d.npy'
+CHUNK_PATTERN = 'chunk_%06d.npz'
+
+def create(directory, chunk_size=64, compressed=True):
+    """
+    create(directory [, chunk_size [, compressed]]) -> SolutionStore
+
+    Returns a new, empty, solution store in the given directory, which is
+    created if it does not exist. Raises ValueError if the directory
+    already holds a store.
+
+    Solutions are buffered in memory until chunk_size solutions have been
+    written, or the domain changes, and are then written to disk as a
+    single chunk. If compressed is False, chunks are not compressed, so
+    they may be memory-mapped when read back.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if _files(directory, DOMAIN_PATTERN) or _files(directory, CHUNK_PATTERN):
+        raise ValueError('directory already holds a solution store')
+    return SolutionStore(directory, chunk_size, compressed)
+
+def load(directory, mmap_mode=None):
+    """
+    load(directory [, mmap_mode]) -> SolutionStore
+
+    Returns the read only solution store in the given directory. If
+    mmap_mode is given, domain state arrays, and uncompressed chunks, are
+    memory-mapped using the given mode (see ``numpy.memmap``), instead of
+    being read into memory.
+    """
+    if not os.path.isdir(directory):
+        raise ValueError('no solution store in directory %s' % directory)
+    return SolutionStore(directory, mmap_mode=mmap_mode, read_only=True)
+
+def _files(directory, pattern):
+    """
+    Returns the sorted list of the files in directory matching the pattern
+    """
+    return sorted(glob.glob(os.path.join(directory,
+                                         pattern.replace('%06d', '*'))))
+
+class SolutionStore(object):
+    """
+    Chunked on-disk store of a sequence of CME solutions.
+    """
+    def __init__(self,
+                 directory,
+                 chunk_size=64,
+                 compressed=True,
+                 mmap_mode=None,
+                 read_only=False):
+        """
+        Opens the store in the given directory, see cmepy.store.create and
+        cmepy.store.load
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compressed = compressed
+        self.mmap_mode = mmap_mode
+        self.read_only = read_only
+
+        # index the existing chunks by their times and domains, reading only
+        # these small arrays of each chunk
+        self._chunks = []
+        for filename in _files(directory, CHUNK_PATTERN):
+            archive = numpy.load(filename)
+            try:
+                self._chunks.append((filename,
+                                     int(archive['domain']),
+                                     numpy.array(archive['t'])))
+            finally:
+                archive.close()
+        self._domain_count = len(_files(directory, DOMAIN_PATTERN))
+        self._domain_cache = {}
+
+        self._states = None
+        self._states_source = None
+        self._buffer_domain = None
+        self._buffer = ([], [], [])
+
+    def __len__(self):
+        return sum(numpy.size(t) for (_, _, t) in self._chunks) + \
+               len(self._buffer[0])
+
+    @property
+    def times(self):
+        """
+        *Read only* property returning the array of the times written
+        """
+        return numpy.concatenate([t for (_, _, t) in self._chunks] +
+                                 [numpy.asarray(self._buffer[0],
+                                                dtype=numpy.float)])
+
+    def domain_states(self, index):
+        """
+        Returns the array of the domain states with the given index, where
+        the domains are indexed in the order they were written
+        """
+        if index not in self._domain_cache:
+            filename = os.path.join(self.directory, DOMAIN_PATTERN % index)
+            self._domain_cache = {
+                index : numpy.load(filename, mmap_mode=self.mmap_mode)
+            }
+        return self._domain_cache[index]
+
+    def _domain_index(self, states):
+        """
+        Returns the index of the domain of the given states, writing them
+        as a new domain if they differ from the current domain
+        """
+        if self._states is not None:
+            if (states is self._states_source) or \
+               ((numpy.shape(states) == numpy.shape(self._states)) and
+                numpy.all(states == self._states)):
+                return self._domain_count - 1
+        self._states_source = states
+        self._states = numpy.array(states)
+        index = self._domain_count
+        numpy.save(os.path.join(self.directory, DOMAIN_PATTERN % index),
+                   self._states)
+        self._domain_count += 1
+        return index
+
+    def write(self, t, p, p_sink=None):
+        """
+        Writes the solution p at time t, and optionally the sink probability.
+
+        The solution p is either a mapping from states to probabilities, or
+        a pair of arrays (states, values). Solutions over the same domain
+        should pass the same array of states, for instance, the unordered
+        states of the solver's domain enumeration, so the domain is only
+        compared by identity.
+        """
+        if self.read_only:
+            raise ValueError('solution store is read only')
+        if type(p) is tuple:
+            states, values = p
+        else:
+            states, values = domain.from_mapping(p)
+        domain_index = self._domain_index(states)
+        if self._buffer[0] and (domain_index != self._buffer_domain):
+            self.flush()
+        self._buffer_domain = domain_index
+        self._buffer[0].append(t)
+        self._buffer[1].append(numpy.asarray(values, dtype=numpy.float))
+        self._buffer[2].append(numpy.nan if p_sink is None else p_sink)
+        if len(self._buffer[0]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered solutions to disk, as a chunk
+        """
+        times, values, p_sinks = self._buffer
+        if not times:
+            return
+        filename = os.path.join(self.directory,
+                                CHUNK_PATTERN % len(self._chunks))
+        cmepy.checkpoint.write(
+            filename,
+            {
+                't' : numpy.array(times, dtype=numpy.float),
+                'p' : numpy.array(values),
+                'p_sink' : numpy.array(p_sinks, dtype=numpy.float),
+                'domain' : self._buffer_domain,
+            },
+            self.compressed
+        )
+        self._chunks.append((filename,
+                             self._buffer_domain,
+                             numpy.array(times, dtype=numpy.float)))
+        self._buffer = ([], [], [])
+
+    def close(self):
+        """
+        Flushes any buffered solutions to disk
+        """
+        if not self.read_only:
+            self.flush()
+
+    def iter_chunks(self, start=0):
+        """
+        iter_chunks([start]) -> iterator over (offset, t, states, p, p_sink)
+
+        Yields the chunks of solutions from the solution with index start
+        onwards, where offset is the index of the first solution of the
+        chunk, t is the array of the times of the solutions, states is the
+        array of their domain states, p is the 2d array whose rows are the
+        packed solutions, and p_sink is the array of sink probabilities,
+        which are NaN if not written. The rows of the first chunk yielded
+        may precede start.
+        """
+        offset = 0
+        for (filename, domain_index, times) in self._chunks:
+            size = numpy.size(times)
+            if offset + size > start:
+                arrays = cmepy.checkpoint.read(filename, self.mmap_mode)
+                yield (offset,
+                       times,
+                       self.domain_states(domain_index),
+                       arrays['p'],
+                       arrays['p_sink'])
+            offset += size
+        if self._buffer[0]:
+            yield (offset,
+                   numpy.array(self._buffer[0], dtype=numpy.float),
+                   self._states,
+                   numpy.array(self._buffer[1]),
+                   numpy.array(self._buffer[2], dtype=numpy.float))
+
+    def iter_arrays(self, start=0):
+        """
+        iter_arrays([start]) -> iterator over (t, states, values)
+
+        Yields the time, domain states and packed probabilities of each
+        solution from the solution with index start onwards.
+        """
+        for (offset, times, states, p, _) in self.iter_chunks(start):
+            for i in xrange(max(start - offset, 0), numpy.size(times)):
+                yield times[i], states, p[i]
+
+    def distribution(self, index):
+        """
+        Returns the time and the solution with the given index, as a mapping
+        from states to probabilities.
+        """
+        from cmepy.statistics import Distribution
+        for (t, states, values) in self.iter_arrays(index):
+            return t, Distribution(zip(domain.to_iter(states), values))
+        raise IndexError('solution index out of range')
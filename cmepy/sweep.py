@@ -0,0 +1,278 @@
+"""
+Solves the CME of a model for many sets of reaction rate coefficients.
+
+The domain enumeration and the sparsity pattern of the CME matrix are
+computed once, together with the matrix entries contributed by each
+reaction. The matrix for a given set of coefficients is then formed by
+rescaling these entries, without re-enumerating the domain or rebuilding
+the sparse matrix structure.
+"""
+
+import numpy
+import scipy.sparse
+
+from cmepy import cme_matrix, domain, ode_solver, state_enum
+from cmepy import model as mdl
+from cmepy.solver import create_packing_functions, \
+     create_block_packing_functions, default_p_0
+
+def create(model, sink, domain_states=None, time_dependencies=None):
+    """
+    Returns a ParameterSweep for the CME of the given model.
+
+    Arguments:
+
+     * ``model`` : the CME model. The propensity of each reaction of the
+       model is multiplied by a coefficient, which may be varied for each
+       solve.
+     * ``sink`` : see ``cmepy.solver.create``.
+     * ``domain_states`` : (optional) array of states in the domain.
+       By default, the rectangular lattice of states defined by the
+       'shape' entry of the model is used.
+     * ``time_dependencies`` : (optional) time dependencies of the
+       propensities, see ``cmepy.solver.create``. These are applied in
+       addition to the coefficients.
+    """
+    return ParameterSweep(model, sink, domain_states, time_dependencies)
+
+def union_pattern(matrices):
+    """
+    union_pattern(matrices) -> indptr, indices, data
+
+    Returns the CSR structure (indptr, indices) of the union of the sparsity
+    patterns of the sequence of equally shaped sparse matrices, together with
+    the 2d array data, where data[r] holds the entries of the r-th matrix
+    with respect to the union pattern.
+    """
+    matrices = [scipy.sparse.coo_matrix(matrix) for matrix in matrices]
+    rows, cols = matrices[0].shape
+    keys = numpy.concatenate([m.row.astype(numpy.int64)*cols + m.col
+                              for m in matrices])
+    labels = numpy.concatenate([r*numpy.ones((m.nnz, ), dtype=numpy.int)
+                                for (r, m) in enumerate(matrices)])
+    values = numpy.concatenate([m.data for m in matrices])
+
+    unique_keys, inverse = numpy.unique(keys, return_inverse=True)
+    data = numpy.zeros((len(matrices), numpy.size(unique_keys)))
+    numpy.add.at(data, (labels, inverse), values)
+
+    indices = (unique_keys % cols).astype(numpy.int32)
+    indptr = numpy.searchsorted(unique_keys // cols,
+                                numpy.arange(rows + 1)).astype(numpy.int32)
+    return indptr, indices, data
+
+# largest number of columns whose products block_product forms together
+BLOCK_PRODUCT_COLUMNS = 32
+
+def block_product(indptr, indices, data, y, columns=BLOCK_PRODUCT_COLUMNS):
+    """
+    block_product(indptr, indices, data, y [, columns]) -> z
+
+    Returns the 2d array z, where the k-th column of z is the product of the
+    CSR matrix (data[k], indices, indptr) with the k-th column of the 2d
+    array y. Each of the matrices shares the same sparsity pattern.
+
+    The products of up to ``columns`` columns are formed together, in a
+    single pass over the shared pattern, which bounds the temporaries to
+    the number of non-zero entries times ``columns``.
+    """
+    rows = numpy.size(indptr) - 1
+    block_size = numpy.size(y, 1)
+    z = numpy.zeros((rows, block_size))
+    if numpy.size(indices) == 0:
+        return z
+    nonempty = indptr[:-1] < indptr[1:]
+    starts = indptr[:-1][nonempty]
+    for start in xrange(0, block_size, columns):
+        stop = min(start + columns, block_size)
+        products = y[indices, start:stop]
+        products *= numpy.transpose(data[start:stop])
+        z[nonempty, start:stop] = numpy.add.reduceat(products, starts, axis=0)
+    return z
+
+class ParameterSweep(object):
+    """
+    CME matrix structure shared between solves for different coefficients.
+    """
+    def __init__(self, model, sink, domain_states=None, time_dependencies=None):
+        """
+        Creates a ParameterSweep, see cmepy.sweep.create
+        """
+        mdl.validate_model(model)
+        if domain_states is None:
+            if mdl.SHAPE not in model:
+                lament = 'if no states given, model must contain key \'%s\''
+                raise KeyError(lament % mdl.SHAPE)
+            domain_states = domain.from_rect(shape = model.shape)
+
+        self.model = model
+        self.sink = bool(sink)
+        self.domain_enum = state_enum.create(domain_states)
+
+        reaction_matrices = list(cme_matrix.gen_reaction_matrices(
+            model,
+            self.domain_enum,
+            self.sink,
+            cme_matrix.non_neg_states
+        ))
+        self.shape = reaction_matrices[0].shape
+        self.indptr, self.indices, self.data = union_pattern(reaction_matrices)
+
+        # group reactions into terms sharing a time dependent coefficient
+        if time_dependencies is None:
+            time_dependencies = {}
+        self.time_dependencies = time_dependencies
+        const_reactions = set(xrange(len(reaction_matrices)))
+        self.terms = []
+        for (reaction_subset, phi) in time_dependencies.iteritems():
+            const_reactions.difference_update(reaction_subset)
+            self.terms.append((sorted(reaction_subset), phi))
+        if const_reactions:
+            self.terms.append((sorted(const_reactions), None))
+
+    @property
+    def size(self):
+        """
+        *Read only* property returning the number of reactions
+        """
+        return numpy.size(self.data, 0)
+
+    def _coefficient_array(self, coefficients):
+        """
+        Returns coefficients as an array, checking the number of reactions
+        """
+        coefficients = numpy.asarray(coefficients, dtype=numpy.float)
+        if numpy.shape(coefficients)[-1] != self.size:
+            lament = 'expected %d coefficients, one for each reaction'
+            raise ValueError(lament % self.size)
+        return coefficients
+
+    def _csr_matrix(self, data):
+        """
+        Returns CSR matrix with given data, sharing the sweep's structure
+        """
+        return scipy.sparse.csr_matrix(
+            (data, self.indices, self.indptr),
+            shape = self.shape
+        )
+
+    def matrix(self, coefficients):
+        """
+        matrix(coefficients) -> csr_matrix
+
+        Returns the (time independent) CME matrix for the given sequence of
+        coefficients, one for each reaction.
+        """
+        coefficients = self._coefficient_array(coefficients)
+        return self._csr_matrix(numpy.dot(coefficients, self.data))
+
+    def _initial_value(self, p_0, sink_0):
+        """
+        Returns initial distribution and sink probability, with defaults
+        """
+        if p_0 is None:
+            p_0 = default_p_0(self.model)
+        if sink_0 is not None:
+            if not self.sink:
+                raise ValueError('sink_0 may not be specified if sink is False')
+            sink_0 = float(sink_0)
+        else:
+            sink_0 = 0.0
+        if type(p_0) is tuple:
+            p_0_states = p_0[0]
+        else:
+            p_0_states = domain.from_iter(p_0)
+        if not numpy.logical_and.reduce(self.domain_enum.contains(p_0_states)):
+            raise ValueError('support of p_0 is not a subset of domain_states')
+        if self.sink:
+            return (p_0, sink_0)
+        return p_0
+
+    def solver(self, coefficients, p_0=None, t_0=None, sink_0=None):
+        """
+        Returns a solver for the CME with the given sequence of coefficients.
+
+        The remaining arguments are as for ``cmepy.solver.create``. As for the
+        solvers created there, the domain enumeration is stored as the
+        ``domain_enum`` attribute of the returned solver.
+        """
+        coefficients = self._coefficient_array(coefficients)
+        terms = [(self._csr_matrix(numpy.dot(coefficients[reactions],
+                                             self.data[reactions])), phi)
+                 for (reactions, phi) in self.terms]
+
+        def dy_dt(t, p):
+            """
+            returns dp / dt for given t and p
+            """
+            return sum(matrix*p*phi(t) if phi is not None else matrix*p
+                       for (matrix, phi) in terms)
+
+        if t_0 is None:
+            t_0 = 0.0
+        cme_solver = ode_solver.Solver(
+            dy_dt,
+            y_0 = self._initial_value(p_0, sink_0),
+            t_0 = t_0
+        )
+        if self.sink:
+            pack, unpack = create_packing_functions(self.domain_enum)
+        else:
+            pack = self.domain_enum.pack_distribution
+            unpack = self.domain_enum.unpack_distribution
+        cme_solver.set_packing(pack, unpack, transform_dy_dt = False)
+        cme_solver.domain_enum = self.domain_enum
+        return cme_solver
+
+    def block_solver(self, coefficient_sets, p_0=None, t_0=None, sink_0=None):
+        """
+        Returns a solver integrating the CME for several sets of coefficients
+        together, as a single block system.
+
+        The argument coefficient_sets is a sequence of K sequences of
+        coefficients. The solution y of the returned solver is a list of
+        the K solutions for each set of coefficients, in order, each of the
+        same form as the solution of the solver returned by ``solver``. The
+        packed solution x of the returned solver is the flattened array of
+        shape (n, K), where the k-th column holds the packed solution for
+        the k-th set of coefficients.
+
+        The initial distribution p_0, time t_0 and sink probability sink_0
+        are shared by all sets of coefficients.
+        """
+        coefficient_sets = self._coefficient_array(coefficient_sets)
+        if numpy.ndim(coefficient_sets) != 2:
+            raise ValueError('coefficient_sets must be a 2d sequence')
+        block_size = numpy.size(coefficient_sets, 0)
+        size = self.shape[0]
+        terms = [(numpy.dot(coefficient_sets[:, reactions],
+                            self.data[reactions]), phi)
+                 for (reactions, phi) in self.terms]
+
+        def dy_dt(t, x):
+            """
+            returns dx / dt for given t and packed block x
+            """
+            y = numpy.reshape(x, (size, block_size))
+            dx_dt = numpy.zeros((size, block_size))
+            for (data, phi) in terms:
+                product = block_product(self.indptr, self.indices, data, y)
+                if phi is not None:
+                    product *= phi(t)
+                dx_dt += product
+            return numpy.ravel(dx_dt)
+
+        if t_0 is None:
+            t_0 = 0.0
+        initial_value = self._initial_value(p_0, sink_0)
+        cme_solver = ode_solver.Solver(
+            dy_dt,
+            y_0 = [initial_value]*block_size,
+            t_0 = t_0
+        )
+        pack, unpack = create_block_packing_functions(self.domain_enum,
+                                                      self.sink,
+                                                      block_size)
+        cme_solver.set_packing(pack, unpack, transform_dy_dt = False)
+        cme_solver.domain_enum = self.domain_enum
+        return cme_solver
@@ -0,0 +1,660 @@
+"""
+Low-rank tensor-train representation and solver of the CME.
+
+On the rectangular domain defined by the 'shape' entry of a model, the
+probability distribution is a d-dimensional array, which is intractable to
+store for models with many species. A tensor train represents such an
+array by a sequence of d three-dimensional cores, where the k-th core has
+shape (r[k-1], n[k], r[k]), and each entry of the array is the product of
+the matrices selected from the cores by the entry's indices. The storage
+required is proportional to the dimension times the square of the ranks
+r[k], rather than to the product of the shape.
+
+The CME operator is represented in the same way, as a tensor train whose
+cores hold matrices rather than vectors. Mass-action propensities, as
+created by ``cmepy.model.mass_action``, factor into one-dimensional factors,
+and have exact rank-one representations. Other propensities are evaluated
+over the full domain and compressed, which is only possible for domains of
+at most DENSE_LIMIT states.
+
+The solver uses the CME operator with reflecting boundaries, as for solvers
+created with ``sink = False``, and integrates the CME by uniformisation,
+rounding the ranks of the tensor trains after each operation.
+"""
+
+import math
+
+import numpy
+
+from cmepy import model as mdl
+from cmepy import domain
+from cmepy.propensity import MassActionPropensity
+from cmepy.statistics import Distribution
+
+DENSE_LIMIT = 2**20
+
+# largest expected number of jumps of the uniformised process in each step
+MAX_JUMPS = 50.0
+
+def _truncation_rank(s, delta, max_rank=None):
+    """
+    Returns the least rank such that the singular values s beyond the rank
+    have norm at most delta, limited to max_rank
+    """
+    tails = numpy.sqrt(numpy.cumsum((s**2)[::-1]))[::-1]
+    rank = max(1, int(numpy.sum(tails > delta)))
+    if max_rank is not None:
+        rank = min(rank, max_rank)
+    return rank
+
+def from_dense(array, tolerance=1.0e-12, max_rank=None):
+    """
+    from_dense(array [, tolerance [, max_rank]]) -> TensorTrain instance
+
+    Returns the tensor train approximating the dense array, with relative
+    error at most tolerance in the Frobenius norm, unless the ranks are
+    limited by max_rank.
+    """
+    array = numpy.asarray(array, dtype=numpy.float)
+    shape = numpy.shape(array)
+    dim = len(shape)
+    delta = tolerance * numpy.linalg.norm(numpy.ravel(array))
+    delta /= math.sqrt(max(dim - 1, 1))
+    cores = []
+    rank = 1
+    remainder = array
+    for k in xrange(dim - 1):
+        remainder = numpy.reshape(remainder, (rank*shape[k], -1))
+        u, s, vt = numpy.linalg.svd(remainder, full_matrices=False)
+        new_rank = _truncation_rank(s, delta, max_rank)
+        cores.append(numpy.reshape(u[:, :new_rank], (rank, shape[k], new_rank)))
+        remainder = s[:new_rank, numpy.newaxis] * vt[:new_rank]
+        rank = new_rank
+    cores.append(numpy.reshape(remainder, (rank, shape[-1], 1)))
+    return TensorTrain(cores)
+
+def rank_one(vectors):
+    """
+    rank_one(vectors) -> TensorTrain instance
+
+    Returns the tensor train of the outer product of the sequence of vectors
+    """
+    return TensorTrain([numpy.reshape(numpy.asarray(v, dtype=numpy.float),
+                                      (1, -1, 1))
+                        for v in vectors])
+
+def from_distribution(p, shape, tolerance=1.0e-12, max_rank=None):
+    """
+    from_distribution(p, shape [, tolerance [, max_rank]])
+    -> TensorTrain instance
+
+    Returns the tensor train of the distribution p over the rectangular
+    domain with the given shape. The distribution is given either as a
+    mapping from states to probabilities, or as a pair of arrays (states,
+    values). Each state is represented as a rank one term, so p should have
+    small support.
+    """
+    if type(p) is tuple:
+        states, values = p
+        states = numpy.asarray(states)
+    else:
+        states, values = domain.from_mapping(p)
+    states = numpy.reshape(states, (len(shape), -1))
+    train = None
+    for (state, value) in zip(numpy.transpose(states), values):
+        vectors = []
+        for (x_i, n_i) in zip(state, shape):
+            if not (0 <= x_i < n_i):
+                raise ValueError('support of p_0 is not a subset of domain')
+            vector = numpy.zeros((n_i, ))
+            vector[x_i] = 1.0
+            vectors.append(vector)
+        term = rank_one(vectors) * value
+        train = term if train is None else train + term
+    if train is None:
+        return rank_one([numpy.zeros((n_i, )) for n_i in shape])
+    return train.round(tolerance, max_rank)
+
+class TensorTrain(object):
+    """
+    Tensor train representation of a multi-dimensional array.
+
+    Tensor trains are treated as immutable: operations return new tensor
+    trains, sharing cores where possible.
+    """
+    def __init__(self, cores):
+        """
+        Creates the tensor train with the given sequence of cores, where the
+        k-th core has shape (r[k-1], n[k], r[k]) and r[-1] = r[d] = 1.
+        """
+        self.cores = list(cores)
+        if len(self.cores) == 0:
+            raise ValueError('tensor train must have at least one core')
+        for (left, right) in zip(self.cores[:-1], self.cores[1:]):
+            if numpy.size(left, 2) != numpy.size(right, 0):
+                raise ValueError('tensor train core ranks must agree')
+        if numpy.size(self.cores[0], 0) != 1 or \
+           numpy.size(self.cores[-1], 2) != 1:
+            raise ValueError('tensor train boundary ranks must be one')
+
+    @property
+    def shape(self):
+        """
+        *Read only* property returning the shape of the represented array
+        """
+        return tuple(numpy.size(core, 1) for core in self.cores)
+
+    @property
+    def ranks(self):
+        """
+        *Read only* property returning the ranks r[0], ..., r[d]
+        """
+        return (1, ) + tuple(numpy.size(core, 2) for core in self.cores)
+
+    @property
+    def rank(self):
+        """
+        *Read only* property returning the largest rank
+        """
+        return max(self.ranks)
+
+    @property
+    def storage(self):
+        """
+        *Read only* property returning the number of stored entries
+        """
+        return sum(numpy.size(core) for core in self.cores)
+
+    def to_dense(self):
+        """
+        Returns the represented array as a dense array
+        """
+        result = numpy.ones((1, ))
+        for core in self.cores:
+            result = numpy.tensordot(result, core, axes=(-1, 0))
+        return numpy.reshape(result, self.shape)
+
+    def __add__(self, other):
+        if self.shape != other.shape:
+            raise ValueError('tensor train shapes must agree')
+        if len(self.cores) == 1:
+            return TensorTrain([self.cores[0] + other.cores[0]])
+        cores = []
+        last = len(self.cores) - 1
+        for (k, (a, b)) in enumerate(zip(self.cores, other.cores)):
+            if k == 0:
+                core = numpy.concatenate((a, b), axis=2)
+            elif k == last:
+                core = numpy.concatenate((a, b), axis=0)
+            else:
+                ra0, n, ra1 = numpy.shape(a)
+                rb0, _, rb1 = numpy.shape(b)
+                core = numpy.zeros((ra0 + rb0, n, ra1 + rb1))
+                core[:ra0, :, :ra1] = a
+                core[ra0:, :, ra1:] = b
+            cores.append(core)
+        return TensorTrain(cores)
+
+    def __sub__(self, other):
+        return self + other*(-1.0)
+
+    def __mul__(self, scalar):
+        return TensorTrain([self.cores[0]*scalar] + self.cores[1:])
+
+    def __rmul__(self, scalar):
+        return self * scalar
+
+    def __neg__(self):
+        return self * (-1.0)
+
+    def dot(self, other):
+        """
+        Returns the inner product of the represented arrays
+        """
+        if self.shape != other.shape:
+            raise ValueError('tensor train shapes must agree')
+        result = numpy.ones((1, 1))
+        for (a, b) in zip(self.cores, other.cores):
+            # contract the ranks of the left part with the cores
+            result = numpy.tensordot(result, a, axes=(0, 0))
+            result = numpy.tensordot(result, b, axes=([0, 1], [0, 1]))
+        return result[0, 0]
+
+    def norm(self):
+        """
+        Returns the Frobenius norm of the represented array
+        """
+        return math.sqrt(max(self.dot(self), 0.0))
+
+    def sum(self):
+        """
+        Returns the sum of all entries of the represented array
+        """
+        return numpy.sum(self.marginal(()))
+
+    def marginal(self, dims):
+        """
+        marginal(dims) -> array
+
+        Returns the dense array of the sums of the represented array over
+        all dimensions not contained in the sequence dims. The dimensions of
+        the result follow the increasing order of dims.
+        """
+        dims = set(dims)
+        result = numpy.ones((1, ))
+        for (k, core) in enumerate(self.cores):
+            if k in dims:
+                result = numpy.tensordot(result, core, axes=(-1, 0))
+            else:
+                result = numpy.tensordot(result, numpy.sum(core, axis=1),
+                                         axes=(-1, 0))
+        return result[..., 0]
+
+    def weighted_sums(self, weights):
+        """
+        Returns the array of the sums over all entries of the represented
+        array, weighted by weights[k] along the k-th dimension only, for each
+        k.
+        """
+        left = [numpy.ones((1, ))]
+        for core in self.cores[:-1]:
+            left.append(numpy.dot(left[-1], numpy.sum(core, axis=1)))
+        right = numpy.ones((1, ))
+        sums = numpy.zeros((len(self.cores), ))
+        for k in xrange(len(self.cores) - 1, -1, -1):
+            core = numpy.tensordot(self.cores[k], weights[k], axes=(1, 0))
+            sums[k] = numpy.dot(left[k], numpy.dot(core, right))
+            right = numpy.dot(numpy.sum(self.cores[k], axis=1), right)
+        return sums
+
+    def round(self, tolerance=1.0e-12, max_rank=None):
+        """
+        Returns the tensor train with the least ranks approximating this
+        tensor train with relative error at most tolerance in the Frobenius
+        norm, unless the ranks are limited by max_rank.
+        """
+        cores = list(self.cores)
+        dim = len(cores)
+        if dim == 1:
+            return TensorTrain(cores)
+        # orthogonalise the cores from right to left
+        for k in xrange(dim - 1, 0, -1):
+            r0, n, r1 = numpy.shape(cores[k])
+            q, r = numpy.linalg.qr(numpy.reshape(cores[k], (r0, n*r1)).T)
+            cores[k] = numpy.reshape(q.T, (-1, n, r1))
+            cores[k - 1] = numpy.tensordot(cores[k - 1], r.T, axes=(2, 0))
+        # then truncate the singular values from left to right
+        delta = tolerance * numpy.linalg.norm(numpy.ravel(cores[0]))
+        delta /= math.sqrt(dim - 1)
+        for k in xrange(dim - 1):
+            r0, n, r1 = numpy.shape(cores[k])
+            u, s, vt = numpy.linalg.svd(numpy.reshape(cores[k], (r0*n, r1)),
+                                        full_matrices=False)
+            rank = _truncation_rank(s, delta, max_rank)
+            cores[k] = numpy.reshape(u[:, :rank], (r0, n, rank))
+            cores[k + 1] = numpy.tensordot(s[:rank, numpy.newaxis]*vt[:rank],
+                                           cores[k + 1],
+                                           axes=(1, 0))
+        return TensorTrain(cores)
+
+    def max_bound(self):
+        """
+        Returns an upper bound of the absolute values of the entries of the
+        represented array. The bound is exact for non-negative rank one
+        tensor trains.
+        """
+        bound = 1.0
+        for core in self.cores:
+            norms = numpy.sqrt(numpy.sum(numpy.sum(core**2, axis=2), axis=0))
+            bound *= numpy.max(norms)
+        return bound
+
+    def to_distribution(self):
+        """
+        Returns the represented array as a distribution, mapping the states
+        of the domain to probabilities. This requires the dense array.
+        """
+        return Distribution().from_dense(self.to_dense())
+
+    def marginal_distribution(self, dims):
+        """
+        Returns the marginal distribution over the dimensions dims, as a
+        Distribution mapping sub-states to probabilities
+        """
+        return Distribution().from_dense(self.marginal(dims))
+
+    def expectation(self):
+        """
+        Returns the expectation of the state, treating the represented array
+        as a distribution over the domain
+        """
+        weights = [numpy.arange(n, dtype=numpy.float) for n in self.shape]
+        return self.weighted_sums(weights)
+
+    def __repr__(self):
+        return 'TensorTrain(shape=%r, ranks=%r)' % (self.shape, self.ranks)
+
+class TensorTrainOperator(object):
+    """
+    Tensor train representation of a linear operator on tensor trains.
+
+    The operator is stored as a tensor train whose k-th core has mode size
+    n[k]**2, holding the (n[k], n[k]) matrices of the k-th dimension.
+    """
+    def __init__(self, train, shape):
+        """
+        Creates the operator acting on tensor trains of the given shape
+        """
+        self.train = train
+        self.shape = tuple(shape)
+
+    @staticmethod
+    def from_cores(cores):
+        """
+        Returns the operator with the given four-dimensional cores, where
+        the k-th core has shape (r[k-1], n[k], n[k], r[k])
+        """
+        shape = [numpy.size(core, 1) for core in cores]
+        train = TensorTrain([numpy.reshape(core, (numpy.size(core, 0), -1,
+                                                  numpy.size(core, 3)))
+                             for core in cores])
+        return TensorTrainOperator(train, shape)
+
+    @property
+    def cores(self):
+        """
+        *Read only* property returning the four-dimensional cores
+        """
+        return [numpy.reshape(core, (numpy.size(core, 0), n, n,
+                                     numpy.size(core, 2)))
+                for (core, n) in zip(self.train.cores, self.shape)]
+
+    @property
+    def rank(self):
+        """
+        *Read only* property returning the largest rank
+        """
+        return self.train.rank
+
+    def __add__(self, other):
+        return TensorTrainOperator(self.train + other.train, self.shape)
+
+    def __mul__(self, scalar):
+        return TensorTrainOperator(self.train * scalar, self.shape)
+
+    def __rmul__(self, scalar):
+        return self * scalar
+
+    def round(self, tolerance=1.0e-12, max_rank=None):
+        """
+        Returns the operator with rounded ranks, see TensorTrain.round
+        """
+        return TensorTrainOperator(self.train.round(tolerance, max_rank),
+                                   self.shape)
+
+    def to_dense(self):
+        """
+        Returns the dense matrix of the operator, acting on the flattened
+        (C-ordered) represented array
+        """
+        dim = len(self.shape)
+        array = numpy.reshape(self.train.to_dense(),
+                              sum(((n, n) for n in self.shape), ()))
+        axes = range(0, 2*dim, 2) + range(1, 2*dim, 2)
+        size = int(numpy.prod(self.shape))
+        return numpy.reshape(numpy.transpose(array, axes), (size, size))
+
+    def __call__(self, x):
+        """
+        Returns the tensor train of the product of the operator with the
+        tensor train x. The ranks of the product are the products of the
+        ranks of the operator and of x.
+        """
+        if x.shape != self.shape:
+            raise ValueError('tensor train shape does not match operator')
+        cores = []
+        for (a, b) in zip(self.cores, x.cores):
+            ra0, n, _, ra1 = numpy.shape(a)
+            rb0, _, rb1 = numpy.shape(b)
+            core = numpy.einsum('aijb,cjd->acibd', a, b)
+            cores.append(numpy.reshape(core, (ra0*rb0, n, ra1*rb1)))
+        return TensorTrain(cores)
+
+def propensity_train(propensity, shape, tolerance=1.0e-12):
+    """
+    propensity_train(propensity, shape [, tolerance]) -> TensorTrain instance
+
+    Returns the tensor train of the values of the propensity over the
+    rectangular domain with the given shape. Mass-action propensities have
+    exact rank one representations. Other propensities are evaluated over the
+    full domain, raising a ValueError if it contains more than DENSE_LIMIT
+    states.
+    """
+    if isinstance(propensity, MassActionPropensity):
+        table = propensity.table
+        orders = table.orders[propensity.index]
+        vectors = []
+        for (order, n) in zip(orders, shape):
+            x = numpy.arange(n, dtype=numpy.float)
+            vector = numpy.ones((n, ))
+            for k in xrange(order):
+                vector *= (x - k) / (k + 1)
+            vectors.append(vector)
+        vectors[0] = vectors[0] * table.rates[propensity.index]
+        return rank_one(vectors)
+    if numpy.prod(shape) > DENSE_LIMIT:
+        lament = ('propensity %r is not mass-action, and the domain is too '
+                  'large to evaluate it densely')
+        raise ValueError(lament % (propensity, ))
+    states = numpy.reshape(numpy.indices(shape), (len(shape), -1))
+    values = propensity(*states) * numpy.ones((numpy.size(states, 1), ))
+    return from_dense(numpy.reshape(values, shape), tolerance)
+
+def reaction_operator(propensity, transition, shape, tolerance=1.0e-12):
+    """
+    reaction_operator(propensity, transition, shape [, tolerance])
+    -> TensorTrainOperator instance, bound
+
+    Returns the CME operator of a single reaction on the rectangular domain
+    with the given shape, with reflecting boundaries, together with an upper
+    bound of the propensity over the domain.
+    """
+    a = propensity_train(propensity, shape, tolerance)
+    gain_cores = []
+    loss_cores = []
+    for (core, nu, n) in zip(a.cores, transition, shape):
+        shift = numpy.eye(n, k=-nu)
+        valid = numpy.sum(shift, axis=0)
+        gain_cores.append(numpy.einsum('yx,axb->ayxb', shift, core))
+        loss = numpy.zeros((numpy.size(core, 0), n, n, numpy.size(core, 2)))
+        index = numpy.arange(n)
+        loss[:, index, index, :] = core * valid[:, numpy.newaxis]
+        loss_cores.append(loss)
+    operator = TensorTrainOperator.from_cores(gain_cores) + \
+               TensorTrainOperator.from_cores(loss_cores) * (-1.0)
+    return operator.round(tolerance), a.max_bound()
+
+def create(model,
+           p_0=None,
+           t_0=None,
+           time_dependencies=None,
+           max_rank=None,
+           tolerance=1.0e-10,
+           max_step=None):
+    """
+    Returns a TensorTrainSolver for the CME of the given model, on the
+    rectangular domain defined by the 'shape' entry of the model, with
+    reflecting boundaries.
+
+    Arguments:
+
+     * ``p_0`` : (optional) initial distribution, as a mapping from states
+       to probabilities, as a pair of arrays (states, values), or as a
+       TensorTrain. Defaults to all probability concentrated at the initial
+       state of the model.
+     * ``t_0`` : (optional) initial time, defaults to 0.0
+     * ``time_dependencies`` : (optional) time dependencies of the
+       propensities, see ``cmepy.solver.create``. The coefficients are held
+       constant over each step, at their values at the midpoint of the step.
+     * ``max_rank`` : (optional) largest rank of the solution
+     * ``tolerance`` : relative tolerance used to round the ranks after
+       each operation
+     * ``max_step`` : (optional) largest time step
+    """
+    mdl.validate_model(model)
+    if mdl.SHAPE not in model:
+        lament = 'tensor train solver requires model to contain key \'%s\''
+        raise KeyError(lament % mdl.SHAPE)
+    return TensorTrainSolver(model, p_0, t_0, time_dependencies, max_rank,
+                             tolerance, max_step)
+
+class TensorTrainSolver(object):
+    """
+    CME solver storing the solution as a tensor train.
+    """
+    def __init__(self,
+                 model,
+                 p_0=None,
+                 t_0=None,
+                 time_dependencies=None,
+                 max_rank=None,
+                 tolerance=1.0e-10,
+                 max_step=None):
+        """
+        Creates the solver, see cmepy.tensor_train.create
+        """
+        self.model = model
+        self.shape = tuple(model.shape)
+        self.max_rank = max_rank
+        self.tolerance = tolerance
+        self.max_step = max_step
+
+        if p_0 is None:
+            initial_state = model.get(mdl.INITIAL_STATE, None)
+            if initial_state is None:
+                lament = 'if no p_0 given, model must contain key \'%s\''
+                raise ValueError(lament % mdl.INITIAL_STATE)
+            p_0 = {tuple(initial_state) : 1.0}
+        if not isinstance(p_0, TensorTrain):
+            p_0 = from_distribution(p_0, self.shape, tolerance, max_rank)
+        elif p_0.shape != self.shape:
+            raise ValueError('p_0 shape does not match model shape')
+        if t_0 is None:
+            t_0 = 0.0
+        self._y = p_0
+        self._t = t_0
+
+        # sum the reaction operators of each term sharing a coefficient
+        if time_dependencies is None:
+            time_dependencies = {}
+        reactions = zip(model.propensities, model.transitions)
+        const_reactions = set(xrange(len(reactions)))
+        groups = []
+        for (reaction_subset, phi) in time_dependencies.iteritems():
+            const_reactions.difference_update(reaction_subset)
+            groups.append((sorted(reaction_subset), phi))
+        if const_reactions:
+            groups.append((sorted(const_reactions), None))
+        self.terms = []
+        for (reaction_subset, phi) in groups:
+            operator = None
+            bound = 0.0
+            for i in reaction_subset:
+                term, term_bound = reaction_operator(reactions[i][0],
+                                                     reactions[i][1],
+                                                     self.shape)
+                operator = term if operator is None else operator + term
+                bound += term_bound
+            self.terms.append((operator.round(1.0e-12), bound, phi))
+
+    @property
+    def t(self):
+        """
+        Read-only property, returning the current solution time t.
+        """
+        return self._t
+
+    @property
+    def y(self):
+        """
+        Read-only property, returning the current solution y, as a
+        TensorTrain.
+        """
+        return self._y
+
+    def _coefficients(self, t):
+        """
+        Returns the coefficients of the terms at time t
+        """
+        return [phi(t) if phi is not None else 1.0
+                for (_, _, phi) in self.terms]
+
+    def _rate(self, coefficients):
+        """
+        Returns the uniformisation rate, bounding the total propensity
+        """
+        return sum(abs(c)*bound
+                   for (c, (_, bound, _)) in zip(coefficients, self.terms))
+
+    def _apply(self, coefficients, x):
+        """
+        Returns the CME operator applied to x, with the given coefficients
+        """
+        result = None
+        for (c, (operator, _, _)) in zip(coefficients, self.terms):
+            if c == 0.0:
+                continue
+            term = operator(x) * c
+            result = term if result is None else result + term
+        return result
+
+    def _uniformised_step(self, x, h, coefficients):
+        """
+        Returns the solution of the CME after time h from x, computed as
+        the Poisson weighted sum of powers of the uniformised operator
+        """
+        rate = self._rate(coefficients)
+        if rate == 0.0:
+            return x
+        jumps = rate * h
+        weight = math.exp(-jumps)
+        total = weight
+        result = x * weight
+        power = x
+        k = 0
+        while 1.0 - total > self.tolerance:
+            k += 1
+            power = (power + self._apply(coefficients, power) * (1.0/rate))
+            power = power.round(self.tolerance, self.max_rank)
+            weight *= jumps / k
+            total += weight
+            result = (result + power * weight).round(self.tolerance,
+                                                     self.max_rank)
+        return result
+
+    def step(self, t):
+        """
+        Advances the current solution to the time t.
+
+        Values of t less that the current solution time are illegal and will
+        raise a ValueError.
+        """
+        if t < self._t:
+            lament = 'Cannot step backwards to a time t (%f) earlier than current solution time (%f)' % (t, self._t)
+            raise ValueError(lament)
+        x = self._y
+        while self._t < t:
+            h = t - self._t
+            if self.max_step is not None:
+                h = min(h, self.max_step)
+            coefficients = self._coefficients(self._t + 0.5*h)
+            rate = self._rate(coefficients)
+            if rate * h > MAX_JUMPS:
+                h = MAX_JUMPS / rate
+                coefficients = self._coefficients(self._t + 0.5*h)
+            x = self._uniformised_step(x, h, coefficients)
+            if t - (self._t + h) <= 1.0e-12 * max(abs(t), 1.0):
+                self._t = t
+            else:
+                self._t += h
+        self._y = x
@@ -0,0 +1,105 @@
+"""
+unit tests for the parallel ensemble runner
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_array_equal, assert_almost_equal
+
+import cmepy.batch
+import cmepy.domain
+import cmepy.sweep
+from cmepy import model
+
+def create_poisson_model(rate):
+    return model.create(
+        propensities = (lambda *x : rate, ),
+        transitions = ((1, ), ),
+        species = ('A', ),
+        species_counts = (lambda *x : x[0], ),
+        shape = (30, ),
+        initial_state = (0, )
+    )
+
+class BatchTests(unittest.TestCase):
+    def test_shared_array(self):
+        array = numpy.arange(12).reshape((3, 4))
+        shared = cmepy.batch.shared_array(array)
+        assert_array_equal(shared, array)
+        assert shared.dtype == array.dtype
+    
+    def test_run_model_factory(self):
+        rates = [1.0, 2.0, 3.0, 4.0]
+        time_steps = [0.0, 0.5, 1.0]
+        domain_states = cmepy.domain.from_rect((30, ))
+        serial = dict(cmepy.batch.run(create_poisson_model,
+                                      rates,
+                                      time_steps,
+                                      sink = True,
+                                      domain_states = domain_states,
+                                      processes = 1))
+        parallel = dict(cmepy.batch.run(create_poisson_model,
+                                        rates,
+                                        time_steps,
+                                        sink = True,
+                                        domain_states = domain_states,
+                                        processes = 2))
+        assert sorted(parallel) == range(len(rates))
+        for (index, rate) in enumerate(rates):
+            result = parallel[index]
+            assert_array_equal(result['t'], time_steps)
+            mu = numpy.ravel(result['expectation'])
+            assert_almost_equal(mu, rate*numpy.asarray(time_steps),
+                                decimal = 4)
+            assert_almost_equal(result['p_sink'], serial[index]['p_sink'])
+        
+        results = dict(cmepy.batch.run(create_poisson_model,
+                                       rates[:2],
+                                       time_steps,
+                                       targets = (('A', ), ),
+                                       statistics = ('expectation',
+                                                     'variance'),
+                                       processes = 2))
+        assert_almost_equal(results[1][('A', 'variance')][-1], 2.0,
+                            decimal = 4)
+    
+    def test_interleaved_serial_runs(self):
+        first = cmepy.batch.run(create_poisson_model,
+                                [1.0, 2.0],
+                                [0.0, 1.0],
+                                processes = 1)
+        second = cmepy.batch.run(create_poisson_model,
+                                 [5.0],
+                                 [0.0, 0.5, 2.0],
+                                 processes = 1)
+        index, result = first.next()
+        # the second run does not replace the settings of the first
+        assert_array_equal(result['t'], [0.0, 1.0])
+        assert_almost_equal(numpy.ravel(result['expectation']), [0.0, 1.0],
+                            decimal = 4)
+        assert_array_equal(second.next()[1]['t'], [0.0, 0.5, 2.0])
+        index, result = first.next()
+        assert_almost_equal(numpy.ravel(result['expectation']), [0.0, 2.0],
+                            decimal = 4)
+    
+    def test_run_sweep(self):
+        sweep = cmepy.sweep.create(create_poisson_model(1.0), sink = True)
+        coefficient_sets = [(1.0, ), (2.5, )]
+        results = dict(cmepy.batch.run_sweep(sweep,
+                                             coefficient_sets,
+                                             [0.0, 1.0],
+                                             processes = 2))
+        assert_almost_equal(numpy.ravel(results[1]['expectation']),
+                            [0.0, 2.5],
+                            decimal = 4)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(BatchTests)
+    return suite
+
+def main():
+    unittest.run(BatchTests)
+
+if __name__ == '__main__':
+    main()
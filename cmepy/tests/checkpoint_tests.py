@@ -0,0 +1,230 @@
+"""
+unit tests for saving and loading solver checkpoints
+"""
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import zipfile
+
+import numpy
+from numpy.testing.utils import assert_array_equal, assert_almost_equal
+
+import cmepy.checkpoint
+import cmepy.domain
+import cmepy.restorable_solver
+import cmepy.fsp.solver
+import cmepy.fsp.simple_expander
+import cmepy.fsp.support_expander
+import cmepy.fsp.sliding_window
+from cmepy import model
+from cmepy.models import burr08
+
+def create_poisson_model():
+    return model.create(
+        propensities = (lambda *x : 2.0, lambda *x : 3.0),
+        transitions = ((1, 0), (0, 1)),
+        shape = (15, 15),
+        initial_state = (0, 0)
+    )
+
+class CheckpointTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_write_memmap(self):
+        filename = os.path.join(self.directory, 'arrays.npz')
+        arrays = {
+            'states' : numpy.arange(12).reshape((3, 4)),
+            'p' : numpy.linspace(0.0, 1.0, 4),
+            't' : 1.5,
+            'name' : 'foo',
+        }
+        for compressed in (True, False):
+            cmepy.checkpoint.write(filename, arrays, compressed)
+            for mmap_mode in (None, 'r'):
+                result = cmepy.checkpoint.read(filename, mmap_mode)
+                assert set(result) == set(arrays)
+                for key in arrays:
+                    assert_array_equal(result[key], arrays[key])
+                mapped = isinstance(result['states'], numpy.memmap)
+                assert mapped == ((not compressed) and (mmap_mode is not None))
+                del result
+
+    def test_memmap_header_versions(self):
+        filename = os.path.join(self.directory, 'versions.npz')
+        states = numpy.arange(6).reshape((2, 3))
+        buf = StringIO.StringIO()
+        numpy.lib.format.write_array(buf, states, version=(2, 0))
+        archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED)
+        archive.writestr('states.npy', buf.getvalue())
+        archive.close()
+        result = cmepy.checkpoint.read(filename, 'r')
+        assert isinstance(result['states'], numpy.memmap)
+        assert_array_equal(result['states'], states)
+        del result
+        # unknown versions are rejected rather than misread
+        archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED)
+        archive.writestr('states.npy',
+                         numpy.lib.format.magic(9, 0) + buf.getvalue()[8:])
+        archive.close()
+        self.assertRaises(ValueError, cmepy.checkpoint.read, filename, 'r')
+
+    def test_restorable_solver_save_load(self):
+        m = create_poisson_model()
+        solver = cmepy.restorable_solver.create(m, sink = True)
+        solver.step(0.5)
+
+        filename = os.path.join(self.directory, 'solver.npz')
+        solver.save(filename)
+        loaded = cmepy.restorable_solver.load(filename, m)
+
+        assert loaded.t == 0.5
+        p, p_sink = solver.y
+        p_loaded, p_sink_loaded = loaded.y
+        assert_almost_equal(p_sink_loaded, p_sink)
+        assert set(p_loaded) == set(p)
+        for state in p:
+            assert_almost_equal(p_loaded[state], p[state])
+
+        solver.step(1.0)
+        loaded.step(1.0)
+        assert_almost_equal(loaded.y[0].expectation(),
+                            solver.y[0].expectation(),
+                            decimal = 4)
+
+    def test_restore_point_arrays(self):
+        m = create_poisson_model()
+        domain_states = cmepy.domain.from_rect((5, 5))
+        solver = cmepy.restorable_solver.create(
+            m,
+            sink = True,
+            domain_states = domain_states
+        )
+        solver.step(0.5)
+        solver.set_restore_point()
+        p_0 = solver.restore_args['p_0']
+        assert type(p_0) is tuple
+        assert p_0[0] is solver.solver.domain_enum.unordered_states
+        assert_almost_equal(solver.error, solver.y[1])
+
+        # restore onto an extended domain
+        solver.restore(domain_states = cmepy.domain.from_rect((8, 8)))
+        assert_almost_equal(solver.restore_point_probability(domain_states),
+                            solver.probability(domain_states))
+        assert_almost_equal(solver.error, solver.restore_point_error)
+
+        discarded = solver.discard(cmepy.domain.from_iter(((0, 0), (9, 9))))
+        assert discarded > 0.0
+        assert_almost_equal(solver.restore_point_error,
+                            solver.error + discarded)
+
+    def test_fsp_solver_save_load(self):
+        m = burr08.create_model()
+        phi = burr08.create_time_dependencies()
+        initial_states = cmepy.domain.from_iter((m.initial_state, ))
+        expander = cmepy.fsp.support_expander.SupportExpander(
+            m.transitions,
+            depth = 1,
+            epsilon = 1.0e-7
+        )
+        fsp_solver = cmepy.fsp.solver.create(
+            m,
+            initial_states,
+            expander,
+            time_dependencies = phi
+        )
+        fsp_solver.step(0.01, 1.0e-3)
+
+        filename = os.path.join(self.directory, 'fsp_solver.npz')
+        fsp_solver.save(filename, compressed = False)
+        loaded = cmepy.fsp.solver.load(
+            filename,
+            m,
+            mmap_mode = 'r',
+            time_dependencies = phi
+        )
+
+        assert type(loaded.domain_expander) is type(expander)
+        assert loaded.domain_expander.depth == expander.depth
+        assert loaded.domain_expander.epsilon == expander.epsilon
+        assert_array_equal(loaded.domain_expander.transitions, m.transitions)
+        assert_array_equal(loaded.domain_states, fsp_solver.domain_states)
+        assert_almost_equal(loaded.solver.restore_point_error,
+                            fsp_solver.solver.restore_point_error)
+
+        fsp_solver.step(0.1, 1.0e-3)
+        loaded.step(0.1, 1.0e-3)
+        assert_array_equal(loaded.domain_states, fsp_solver.domain_states)
+        assert_almost_equal(loaded.y[1], fsp_solver.y[1])
+
+    def test_sliding_window_save_load(self):
+        m = burr08.create_model()
+        initial_states = cmepy.domain.from_iter((m.initial_state, ))
+        expander = cmepy.fsp.support_expander.SupportExpander(
+            m.transitions,
+            depth = 1,
+            epsilon = 1.0e-7
+        )
+        fsp_solver = cmepy.fsp.sliding_window.create(
+            m,
+            initial_states,
+            expander,
+            max_states = 200
+        )
+        fsp_solver.step(0.01, 1.0e-3)
+        fsp_solver.step(0.1, 1.0e-3)
+
+        filename = os.path.join(self.directory, 'sliding_window.npz')
+        fsp_solver.save(filename)
+        loaded = cmepy.fsp.sliding_window.load(filename, m)
+        assert loaded.max_states == 200
+        assert loaded.pruned_error == fsp_solver.pruned_error
+        assert_array_equal(loaded.domain_states, fsp_solver.domain_states)
+
+    def test_unsaved_expander_must_be_given(self):
+        arrays = cmepy.fsp.solver.expander_arrays(
+            cmepy.fsp.support_expander.SupportExpander(
+                ((1, ), ),
+                depth = lambda : 1,
+                epsilon = 0.0
+            )
+        )
+        self.assertRaises(ValueError,
+                          cmepy.fsp.solver.create_expander,
+                          arrays)
+
+    def test_only_known_expanders_are_created(self):
+        expander = cmepy.fsp.simple_expander.SimpleExpander(((1, ), ), 2)
+        arrays = cmepy.fsp.solver.expander_arrays(expander)
+        created = cmepy.fsp.solver.create_expander(arrays)
+        assert type(created) is type(expander)
+        assert created.depth == 2
+        assert_array_equal(created.transitions, [[1]])
+
+        unknown = dict(arrays, expander = 'os.system')
+        wrong_type = dict(arrays)
+        wrong_type['expander.depth'] = numpy.array('rm')
+        wrong_shape = dict(arrays)
+        wrong_shape['expander.depth'] = numpy.arange(2)
+        extra = dict(arrays)
+        extra['expander.__class__'] = numpy.array(0)
+        for bad_arrays in (unknown, wrong_type, wrong_shape, extra):
+            self.assertRaises(ValueError,
+                              cmepy.fsp.solver.create_expander,
+                              bad_arrays)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(CheckpointTests)
+    return suite
+
+def main():
+    unittest.run(CheckpointTests)
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ import numpy
 from numpy.testing.utils import assert_array_equal
 
 import cmepy.domain as domain
+from cmepy import model
+from cmepy.models import michaelis_menten
 
 
 class DomainTests(unittest.TestCase):
@@ -78,6 +80,33 @@ class DomainTests(unittest.TestCase):
             assert_array_equal(states[:, i], goal_state)
             assert p_0[goal_state] == values[i]
     
+    def test_reachable_domain_respects_conservation(self):
+        m = michaelis_menten.create_model_michaelis_menten(s_0 = 10, e_0 = 3)
+        states = domain.from_reachable(m)
+        # the substrate and complex counts sum to at most s_0, while the
+        # complex count is also at most e_0
+        rect_states = domain.from_rect(m.shape)
+        s, c = rect_states
+        feasible = numpy.logical_and(s + c <= 10, c <= 3)
+        goal_states = domain.from_iter(
+            sorted(domain.to_iter(rect_states[:, feasible]),
+                   key = lambda state : state[::-1])
+        )
+        assert_array_equal(states, goal_states)
+        assert numpy.size(states, 1) < numpy.size(rect_states, 1)
+    
+    def test_reachable_domain_max_states(self):
+        m = model.create(
+            propensities = (lambda *x : 1.0, lambda *x : x[0]),
+            transitions = ((1, ), (-1, )),
+            initial_state = (5, )
+        )
+        self.assertRaises(ValueError, domain.from_reachable, m)
+        states = domain.from_reachable(m, max_states = 4)
+        assert_array_equal(states, [[3, 4, 5, 6]])
+        states = domain.from_reachable(m, bounds = (8, ))
+        assert_array_equal(states, [numpy.arange(8)])
+    
 def suite():
     suite = unittest.TestLoader().loadTestsFromTestCase(DomainTests)
     return suite
@@ -0,0 +1,188 @@
+"""
+unit tests for cmepy.fsp sub-package
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_array_equal, assert_almost_equal
+
+import cmepy.domain
+import cmepy.lexarrayset
+import cmepy.statistics
+import cmepy.fsp.solver
+import cmepy.fsp.support_expander
+import cmepy.fsp.priority_expander
+import cmepy.fsp.sliding_window
+from cmepy import model
+from cmepy.models import dsmts, burr08
+
+def create_poisson_model(rate):
+    return model.create(
+        propensities = (lambda *x : rate, ),
+        transitions = ((1, ), ),
+        initial_state = (0, )
+    )
+
+class FspTests(unittest.TestCase):
+    def test_priority_expander_ranks_by_flux(self):
+        m = dsmts.DSMTS_001_01
+        domain_states = cmepy.domain.from_iter((m.initial_state, ))
+        p = {m.initial_state : 1.0}
+
+        # death flux (11.0) exceeds birth flux (10.0)
+        expander = cmepy.fsp.priority_expander.PriorityExpander(m, 0.5)
+        candidates, flux = expander.fluxes(domain_states, p)
+        assert_array_equal(candidates, [[99, 101]])
+        assert_almost_equal(flux, [11.0, 10.0])
+
+        expanded = expander.expand(domain_states = domain_states,
+                                   p = p,
+                                   t = 0.0)
+        assert_array_equal(expanded, [[99, 100]])
+
+        expander = cmepy.fsp.priority_expander.PriorityExpander(m, 1.0)
+        expanded = expander.expand(domain_states = domain_states,
+                                   p = p,
+                                   t = 0.0)
+        assert_array_equal(expanded, [[99, 100, 101]])
+
+        expander = cmepy.fsp.priority_expander.PriorityExpander(
+            m,
+            1.0,
+            max_states = 1
+        )
+        expanded = expander.expand(domain_states = domain_states,
+                                   p = p,
+                                   t = 0.0)
+        assert_array_equal(expanded, [[99, 100]])
+
+    def test_priority_expander_time_dependencies(self):
+        m = burr08.create_model()
+        phi = burr08.create_time_dependencies()
+        domain_states = cmepy.domain.from_iter((m.initial_state, ))
+        p = {m.initial_state : 1.0}
+
+        expander = cmepy.fsp.priority_expander.PriorityExpander(
+            m,
+            1.0,
+            time_dependencies = phi
+        )
+        candidates, flux = expander.fluxes(domain_states, p, t = 0.0)
+        _, flux_later = expander.fluxes(domain_states, p, t = 10.0)
+        # birth fluxes decay with time, death fluxes are constant
+        assert numpy.size(flux) == 4
+        assert numpy.add.reduce(flux_later) < numpy.add.reduce(flux)
+        self.assertRaises(ValueError, expander.fluxes, domain_states, p)
+
+    def test_fsp_with_priority_expander(self):
+        m = burr08.create_model()
+        phi = burr08.create_time_dependencies()
+        initial_states = cmepy.domain.from_iter((m.initial_state, ))
+        expander = cmepy.fsp.priority_expander.PriorityExpander(
+            m,
+            0.9,
+            time_dependencies = phi
+        )
+        fsp_solver = cmepy.fsp.solver.create(
+            m,
+            initial_states,
+            expander,
+            time_dependencies = phi
+        )
+        epsilon = 1.0e-3
+        for t in numpy.linspace(0.0, 1.0, 5):
+            fsp_solver.step(t, epsilon)
+        p, p_sink = fsp_solver.y
+        assert p_sink <= 5*epsilon
+        assert_almost_equal(sum(p.itervalues()) + p_sink, 1.0)
+        
+        # propensities are cached across expansions by default
+        cache = fsp_solver.solver.propensity_cache
+        assert cache is not None
+        assert cache.size == numpy.size(fsp_solver.domain_states, 1)
+        uncached = cmepy.fsp.solver.create(m,
+                                           initial_states,
+                                           expander,
+                                           time_dependencies = phi,
+                                           propensity_cache = None)
+        assert uncached.solver.propensity_cache is None
+
+    def test_sliding_window_bounds_domain(self):
+        rate = 10.0
+        m = create_poisson_model(rate)
+        initial_states = cmepy.domain.from_iter((m.initial_state, ))
+        expander = cmepy.fsp.support_expander.SupportExpander(
+            m.transitions,
+            depth = 2,
+            epsilon = 1.0e-6
+        )
+        max_states = 80
+        fsp_solver = cmepy.fsp.sliding_window.create(
+            m,
+            initial_states,
+            expander,
+            max_states
+        )
+        epsilon = 1.0e-4
+        time_steps = numpy.linspace(0.0, 10.0, 21)
+        for t in time_steps:
+            fsp_solver.step(t, epsilon)
+            assert numpy.size(fsp_solver.domain_states, 1) <= max_states
+            assert fsp_solver.solver.propensity_cache.size <= max_states
+        
+        # distribution drifts well beyond the initial window of states
+        assert numpy.min(fsp_solver.domain_states) > 0
+        assert fsp_solver.pruned_error > 0.0
+        
+        p, p_sink = fsp_solver.y
+        assert_almost_equal(p_sink, fsp_solver.error)
+        assert p_sink <= fsp_solver.pruned_error + epsilon*len(time_steps)
+        assert_almost_equal(sum(p.itervalues()) + p_sink, 1.0)
+        mu = cmepy.statistics.expectation(p) / (1.0 - p_sink)
+        assert abs(mu[0] - rate*10.0) < 0.5
+
+    def test_sliding_window_detects_domain_cycles(self):
+        m = create_poisson_model(10.0)
+        initial_states = numpy.array([[0, 1]])
+        
+        class FixedExpander(object):
+            """
+            expander always adding the same states, so pruning alternates
+            between two domains
+            """
+            def expand(self, **kwargs):
+                return cmepy.lexarrayset.union(kwargs['domain_states'],
+                                               numpy.array([[1, 2]]))
+        
+        fsp_solver = cmepy.fsp.sliding_window.create(
+            m,
+            initial_states,
+            FixedExpander(),
+            max_states = 2
+        )
+        restore_args = dict(fsp_solver.solver.restore_args)
+        try:
+            fsp_solver.step(1.0, 1.0e-4)
+        except cmepy.fsp.solver.ExpansionFailureError, error:
+            assert 'cycled' in error.msg
+        else:
+            self.fail('expected ExpansionFailureError')
+        # the solver is left at its last restore point
+        assert_array_equal(fsp_solver.domain_states, initial_states)
+        assert fsp_solver.pruned_error == 0.0
+        assert fsp_solver.solver.restore_args['sink_0'] == \
+               restore_args['sink_0']
+        assert fsp_solver.solver.restore_args['p_0'] is restore_args['p_0']
+        assert fsp_solver.solver.t == 0.0
+        assert_array_equal(fsp_solver.solver.domain_states, initial_states)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(FspTests)
+    return suite
+
+def main():
+    unittest.run(FspTests)
+
+if __name__ == '__main__':
+    main()
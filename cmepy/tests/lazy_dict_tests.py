@@ -0,0 +1,71 @@
+"""
+unit tests for the lazily updated dictionary
+"""
+
+import unittest
+
+from cmepy.lazy_dict import LazyDict
+
+class LazyDictTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.batches = []
+
+    def update_value(self, key, existing_value, member):
+        self.calls.append(key)
+        if not member:
+            return 0
+        return existing_value + 1
+
+    def update_values(self, items):
+        self.batches.append(sorted(k for (k, _) in items))
+        return [v + 1 for (_, v) in items]
+
+    def test_initial_items(self):
+        lazy = LazyDict(self.update_value, {'a' : 1, 'b' : 2})
+        assert dict(lazy) == {'a' : 1, 'b' : 2}
+        assert lazy['a'] == 2
+        assert sorted(lazy.items()) == [('a', 3), ('b', 3)]
+        assert lazy['c'] == 0
+
+    def test_dirty_tracking(self):
+        lazy = LazyDict(self.update_value, track_dirty = True)
+        lazy['a'] = 1
+        assert lazy.is_dirty('a')
+        assert lazy['a'] == 2
+        assert lazy['a'] == 2
+        assert self.calls == ['a']
+        lazy.mark_dirty()
+        assert lazy['a'] == 3
+        assert lazy.copy()['a'] == 3
+        lazy.mark_dirty('a')
+        copied = lazy.copy()
+        assert copied['a'] == 4
+        assert lazy.pop('a') == 4
+        assert self.calls == ['a'] * 4
+        self.assertRaises(KeyError, lazy.popitem)
+
+    def test_batched_update(self):
+        lazy = LazyDict(self.update_value,
+                        {'a' : 1, 'b' : 2, 'c' : 3},
+                        update_values = self.update_values,
+                        track_dirty = True)
+        lazy['b']
+        assert sorted(lazy.values()) == [2, 3, 4]
+        assert self.batches == [['a', 'c']]
+        assert sorted(lazy.items()) == [('a', 2), ('b', 3), ('c', 4)]
+        lazy.mark_dirty('a', 'b')
+        lazy.update_all()
+        assert self.batches == [['a', 'c'], ['a', 'b']]
+        assert self.calls == ['b']
+        assert lazy.popitem()[1] in (3, 4)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(LazyDictTests)
+    return suite
+
+def main():
+    unittest.run(LazyDictTests)
+
+if __name__ == '__main__':
+    main()
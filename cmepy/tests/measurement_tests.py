@@ -19,6 +19,64 @@ class MeasurementTests(unittest.TestCase):
         assert_almost_equal(numpy.array(m.variance),
                             [0, 0.25, 0])
 
+    def test_statistic_columns(self):
+        m = Measurement('foo', lambda x : (x[0], x[1]))
+        m.write(0.0, Distribution())
+        for i in xrange(40):
+            m.write(float(i + 1), {(i, 0) : 0.5, (i + 1, 2) : 0.5})
+        assert len(m) == 41
+        assert m.times.shape == (41, )
+        assert_almost_equal(m.times[-1], 40.0)
+        
+        mu = m.expected_value
+        assert mu.shape == (41, 2)
+        assert numpy.all(numpy.isnan(mu[0]))
+        assert_almost_equal(mu[1:, 1], 1.0)
+        assert_almost_equal(mu[1:, 0], numpy.arange(40) + 0.5)
+        assert_almost_equal(m.covariance[1:], 0.5)
+        assert_almost_equal(m.covariance[1:],
+                            [d.covariance() for d in m.distributions[1:]])
+        
+        # columns are read only views, computed once
+        assert not mu.flags.writeable
+        assert m.get_statistic('expectation') is not mu
+        assert numpy.may_share_memory(m.get_statistic('expectation'),
+                                      m.columns['expectation'].array)
+        self.assertRaises(KeyError, m.get_statistic, 'variance')
+        self.assertRaises(KeyError, m.get_statistic, 'banana')
+        assert not hasattr(m, 'banana')
+
+    def test_higher_moment_columns(self):
+        m = Measurement('foo', lambda x : x, order = 4,
+                        quantiles = (0.25, 0.5))
+        m.write(0.0, {(0, ) : 1.0})
+        m.write(1.0, {(0, ) : 0.25, (1, ) : 0.5, (4, ) : 0.25})
+        assert m.skewness.shape == (2, 1)
+        assert m.kurtosis.shape == (2, 1)
+        assert m.quantiles.shape == (2, 1, 2)
+        assert numpy.isnan(m.skewness[0, 0])
+        moments = m.distributions[1].moments(4)
+        assert_almost_equal(m.skewness[1], moments.skewness)
+        assert_almost_equal(m.kurtosis[1], moments.kurtosis)
+        assert_almost_equal(m.quantiles, [[[0, 0]], [[0, 1]]])
+        assert_almost_equal(m.variance[1], m.distributions[1].variance())
+        self.assertRaises(KeyError, Measurement().get_statistic, 'banana')
+        plain = Measurement()
+        plain.write(0.0, {(0, ) : 1.0})
+        self.assertRaises(KeyError, plain.get_statistic, 'skewness')
+
+    def test_lazy_distributions(self):
+        m = Measurement('foo', lambda x : (x[0] + x[1], ))
+        states = numpy.array([[0, 1, 2], [1, 0, 0]])
+        m.write_arrays(0.0, states, numpy.array([0.25, 0.25, 0.5]))
+        m.write(1.0, {})
+        # marginals are kept as arrays until the distributions are read
+        assert type(m._marginals[0]) is tuple
+        assert m.distributions == [Distribution({(1, ) : 0.5, (2, ) : 0.5}),
+                                   Distribution()]
+        assert type(m._marginals[0]) is Distribution
+        assert m.distributions[0] is m.distributions[0]
+
 def suite():
     suite = unittest.TestLoader().loadTestsFromTestCase(MeasurementTests)
     return suite
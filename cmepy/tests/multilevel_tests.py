@@ -0,0 +1,147 @@
+"""
+unit tests for the multilevel aggregation solvers
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_array_equal, assert_almost_equal
+
+import cmepy.domain
+import cmepy.multilevel
+import cmepy.solver
+import cmepy.steady_state
+from cmepy import model
+
+def create_model():
+    return model.create(
+        propensities = (lambda *x : 2.0 + 0.0*x[0],
+                        lambda *x : 1.0*x[0],
+                        lambda *x : 0.5*x[0],
+                        lambda *x : 1.0*x[1]),
+        transitions = ((1, 0), (-1, 0), (0, 1), (0, -1)),
+        shape = (20, 20),
+        initial_state = (0, 0)
+    )
+
+class MultilevelTests(unittest.TestCase):
+    def test_aggregate(self):
+        states = cmepy.domain.from_rect((5, 3))
+        aggregation = cmepy.multilevel.aggregate(states, (2, 3))
+        assert aggregation.size == 3
+        assert aggregation.fine_size == 15
+        assert_array_equal(aggregation.coarse_states, [[0, 1, 2], [0, 0, 0]])
+        assert_array_equal(aggregation.counts, [6, 6, 3])
+        assert_array_equal(aggregation.labels, states[0] // 2)
+        
+        weights = numpy.linspace(0.0, 1.0, 15)
+        for w in (None, weights, numpy.zeros((15, ))):
+            product = aggregation.restriction * aggregation.prolongation(w)
+            assert_almost_equal(product.toarray(), numpy.eye(3))
+        
+        with_sink = aggregation.with_sink()
+        assert with_sink.size == 4
+        assert with_sink.fine_size == 16
+        self.assertRaises(ValueError, cmepy.multilevel.aggregate, states,
+                          (2, 2, 2))
+    
+    def test_coarse_generator(self):
+        m = create_model()
+        domain_enum, generator, _ = cmepy.steady_state.create_generator(m)
+        aggregation = cmepy.multilevel.aggregate(domain_enum.unordered_states)
+        p = numpy.random.uniform(size = (domain_enum.size, ))
+        coarse = aggregation.coarse_matrix(generator, p)
+        assert coarse.shape == (aggregation.size, )*2
+        assert_almost_equal(numpy.ravel(coarse.sum(axis = 0)), 0.0)
+        
+        # the coarse system is exact for the stationary distribution
+        p = cmepy.steady_state.solve_generator(generator)
+        coarse = aggregation.coarse_matrix(generator, p)
+        assert_almost_equal(coarse * aggregation.restrict(p), 0.0)
+    
+    def test_aggregation_steady_state(self):
+        m = create_model()
+        p_direct, _, _ = cmepy.steady_state.solve(m)
+        p, residual, _ = cmepy.steady_state.solve(m,
+                                                  method = 'aggregation',
+                                                  cell_shape = 5)
+        assert residual < 1.0e-10
+        assert_almost_equal(p.to_dense(m.shape), p_direct.to_dense(m.shape))
+        self.assertRaises(ValueError,
+                          cmepy.steady_state.solve_generator,
+                          cmepy.steady_state.create_generator(m)[1],
+                          'aggregation')
+    
+    def test_implicit_euler_solver(self):
+        m = create_model()
+        reference = cmepy.solver.create(m, sink = True)
+        reference.step(1.0)
+        p_reference, sink_reference = reference.y
+        
+        iterations = []
+        for multilevel in (True, False):
+            solver = cmepy.solver.create(
+                m,
+                sink = True,
+                solver = cmepy.multilevel.ImplicitEulerSolver,
+                cell_shape = (4, 4),
+                max_step = 0.01,
+                multilevel = multilevel
+            )
+            solver.step(0.5)
+            solver.step(1.0)
+            assert solver.t == 1.0
+            p, p_sink = solver.y
+            assert_almost_equal(p.expectation(), p_reference.expectation(),
+                                decimal = 2)
+            assert_almost_equal(sum(p.itervalues()) + p_sink, 1.0)
+            iterations.append(solver.iterations)
+        # the coarse correction reduces the work of each step
+        assert iterations[0] < iterations[1]
+    
+    def test_implicit_euler_time_dependencies(self):
+        m = create_model()
+        phi = {frozenset([0]) : lambda t : 0.0 if t <= 0.5 else 1.0}
+        solver = cmepy.solver.create(
+            m,
+            sink = False,
+            time_dependencies = phi,
+            solver = cmepy.multilevel.ImplicitEulerSolver,
+            max_step = 0.05
+        )
+        solver.step(0.5)
+        assert_almost_equal(solver.y.expectation(), (0.0, 0.0))
+        solver.step(1.0)
+        assert solver.y.expectation()[0] > 0.0
+        self.assertRaises(ValueError, solver.step, 0.5)
+    
+    def test_implicit_euler_reuses_preconditioner(self):
+        m = create_model()
+        self.assertRaises(ValueError,
+                          cmepy.solver.create,
+                          m,
+                          sink = True,
+                          solver = cmepy.multilevel.ImplicitEulerSolver)
+        solver = cmepy.solver.create(
+            m,
+            sink = True,
+            solver = cmepy.multilevel.ImplicitEulerSolver,
+            max_step = 0.05
+        )
+        time_steps = numpy.linspace(0.0, 1.0, 11)
+        solver.step(time_steps[1])
+        preconditioner = solver._preconditioner
+        # the intervals of the time steps differ by rounding only
+        for t in time_steps[2:]:
+            solver.step(t)
+            assert solver._preconditioner is preconditioner
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(MultilevelTests)
+    return suite
+
+def main():
+    unittest.run(MultilevelTests)
+
+if __name__ == '__main__':
+    main()
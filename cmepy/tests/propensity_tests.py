@@ -0,0 +1,218 @@
+"""
+unit tests for compiled propensity expressions
+"""
+
+import pickle
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+import cmepy.cme_matrix
+import cmepy.domain
+import cmepy.propensity
+import cmepy.restorable_solver
+import cmepy.solver
+from cmepy import model
+
+class PropensityTests(unittest.TestCase):
+    def test_expression_forms(self):
+        x = cmepy.domain.from_rect((4, 5))
+        p = cmepy.propensity.create('0.5*x0*x[1] + k*exp(-x1)',
+                                    constants = {'k' : 2.0},
+                                    use_numexpr = False)
+        goal = 0.5*x[0]*x[1] + 2.0*numpy.exp(-x[1])
+        assert_almost_equal(p(*x), goal)
+        
+        # constant expressions match the shape of the states
+        p = cmepy.propensity.create('3.0', use_numexpr = False)
+        assert_almost_equal(p(*x), 3.0*numpy.ones(numpy.size(x, 1)))
+        
+        # integer coordinates use true division
+        p = cmepy.propensity.create('x0/2', use_numexpr = False)
+        assert_almost_equal(p(*x), x[0]/2.0)
+        
+        self.assertRaises(SyntaxError, cmepy.propensity.create, 'x0 *')
+    
+    def test_true_division(self):
+        x = numpy.array([[4, 6]])
+        p = cmepy.propensity.create('1/2*x0', use_numexpr = False)
+        assert_almost_equal(p(*x), [2.0, 3.0])
+        p = cmepy.propensity.create('k/2*x0',
+                                    constants = {'k' : 1},
+                                    use_numexpr = False)
+        assert_almost_equal(p(*x), [2.0, 3.0])
+
+    def test_mass_action_expression(self):
+        x = cmepy.domain.from_rect((6, 6))
+        expression = cmepy.propensity.mass_action(0.1, (2, 1))
+        p = cmepy.propensity.create(expression, use_numexpr = False)
+        goal = 0.1*x[0]*(x[0]-1)/2.0*x[1]
+        assert_almost_equal(p(*x), goal)
+    
+    def test_model_with_expressions(self):
+        rate = 2.0
+        size = 10
+        m = model.create(
+            propensities = ('%r*(%d - x0)' % (rate, size), ),
+            transitions = ((1, ), ),
+            shape = (size + 1, ),
+            initial_state = (0, )
+        )
+        assert isinstance(m.propensities[0], cmepy.propensity.Propensity)
+        
+        solver = cmepy.solver.create(m, sink = False)
+        solver.step(0.5)
+        p = solver.y.to_dense(m.shape)
+        
+        m_lambda = model.create(
+            propensities = (lambda *x : rate*(size - x[0]), ),
+            transitions = ((1, ), ),
+            shape = (size + 1, ),
+            initial_state = (0, )
+        )
+        solver = cmepy.solver.create(m_lambda, sink = False)
+        solver.step(0.5)
+        assert_almost_equal(p, solver.y.to_dense(m.shape))
+
+    def test_parse_reaction(self):
+        species = ('A', 'B', 'C')
+        orders, transition = model.parse_reaction('A+B->C', species)
+        assert orders == (1, 1, 0)
+        assert transition == (-1, -1, 1)
+        orders, transition = model.parse_reaction('2A -> *', species)
+        assert orders == (2, 0, 0)
+        assert transition == (-2, 0, 0)
+        orders, transition = model.parse_reaction('->B', species)
+        assert orders == (0, 0, 0)
+        assert transition == (0, 1, 0)
+        self.assertRaises(ValueError, model.parse_reaction, 'A+D->C', species)
+        self.assertRaises(ValueError, model.parse_reaction, 'A=>C', species)
+    
+    def test_mass_action_model(self):
+        m = model.mass_action(
+            reactions = ('E+S->C', 'C->E+S', 'C->E+D', '2S->*'),
+            rates = (0.01, 35.0, 30.0, 0.5),
+            species = ('S', 'E', 'C', 'D'),
+            initial_state = (10, 5, 0, 0),
+            shape = (11, 6, 6, 11)
+        )
+        assert m.transitions == [(-1, -1, 1, 0),
+                                 (1, 1, -1, 0),
+                                 (0, 1, -1, 1),
+                                 (-2, 0, 0, 0)]
+        x = cmepy.domain.from_rect((4, 3, 2, 1))
+        s, e, c, d = x
+        goal = numpy.array([
+            0.01*e*s,
+            35.0*c,
+            30.0*c,
+            0.5*s*(s-1)/2.0,
+        ])
+        batched = cmepy.cme_matrix.compute_propensities(m.propensities, x)
+        assert_almost_equal(batched, goal)
+        for (r, prop) in enumerate(m.propensities):
+            assert_almost_equal(prop(*x), goal[r])
+        assert_almost_equal(m.species_counts[2](*x), c)
+
+    def test_pickle(self):
+        x = cmepy.domain.from_rect((4, 3))
+        p = cmepy.propensity.create('k*x[0]*(x1 + 1)',
+                                    constants = {'k' : 0.5},
+                                    use_numexpr = False)
+        unpickled = pickle.loads(pickle.dumps(p, pickle.HIGHEST_PROTOCOL))
+        assert unpickled.expression == p.expression
+        assert unpickled.constants == p.constants
+        assert_almost_equal(unpickled(*x), p(*x))
+        m = model.create(
+            propensities = ('2.0*(10 - x0)', ),
+            transitions = ((1, ), ),
+            shape = (11, ),
+            initial_state = (0, )
+        )
+        m_unpickled = pickle.loads(pickle.dumps(m))
+        assert_almost_equal(m_unpickled.propensities[0](*x), 2.0*(10 - x[0]))
+
+    def test_propensity_cache(self):
+        evaluated = []
+        def counting_propensity(*x):
+            evaluated.append(numpy.size(x[0]))
+            return 1.0 + x[0]*x[1]
+        m = model.create(
+            propensities = (counting_propensity, lambda *x : 2.0*x[0]),
+            transitions = ((1, 0), (-1, 1)),
+            initial_state = (0, 0)
+        )
+        cache = cmepy.cme_matrix.create_propensity_cache(m)
+        small = cmepy.domain.from_rect((3, 3))
+        large = cmepy.domain.from_rect((5, 4))
+        assert_almost_equal(cache.evaluate(small),
+                            cmepy.cme_matrix.compute_propensities(
+                                m.propensities,
+                                small
+                            ))
+        del evaluated[:]
+        values = cache.evaluate(large)
+        assert evaluated == [5*4 - 3*3]
+        assert cache.size == 5*4
+        assert_almost_equal(values,
+                            cmepy.cme_matrix.compute_propensities(
+                                m.propensities,
+                                large
+                            ))
+        cache.retain(small)
+        assert cache.size == 3*3
+        
+        # solvers sharing the cache build the same matrices
+        for domain_states in (small, large):
+            solver = cmepy.solver.create(
+                m,
+                sink = True,
+                domain_states = domain_states,
+                propensity_cache = cache
+            )
+            solver.step(0.5)
+            cached_y = solver.y
+            solver = cmepy.solver.create(
+                m,
+                sink = True,
+                domain_states = domain_states
+            )
+            solver.step(0.5)
+            assert_almost_equal(cached_y[1], solver.y[1])
+
+    def test_restorable_solver_propensity_cache(self):
+        m = model.create(
+            propensities = (lambda *x : 1.0 + x[0], lambda *x : 2.0*x[0]),
+            transitions = ((1, 0), (-1, 1)),
+            initial_state = (0, 0)
+        )
+        small = cmepy.domain.from_rect((3, 3))
+        large = cmepy.domain.from_rect((5, 4))
+        # the cache is opt-in
+        solver = cmepy.restorable_solver.create(m,
+                                                sink = True,
+                                                domain_states = small)
+        assert solver.propensity_cache is None
+        cache = cmepy.cme_matrix.create_propensity_cache(m)
+        cached = cmepy.restorable_solver.create(m,
+                                                sink = True,
+                                                domain_states = small,
+                                                propensity_cache = cache)
+        assert cached.propensity_cache is cache
+        for s in (solver, cached):
+            s.step(0.5)
+            s.restore(domain_states = large)
+            s.step(0.5)
+        assert cache.size == 5*4
+        assert_almost_equal(cached.y[1], solver.y[1])
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(PropensityTests)
+    return suite
+
+def main():
+    unittest.run(PropensityTests)
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ import numpy
 from numpy.testing.utils import assert_almost_equal
 
 import cmepy.recorder
+from cmepy.statistics import Distribution
 
 class RecorderTests(unittest.TestCase):
     def test_recorder_a(self):
@@ -55,6 +56,138 @@ class RecorderTests(unittest.TestCase):
         cov = rec[('even', 'odd')].covariance
         assert_almost_equal(cov, numpy.array([0.41]))
         
+    
+    def test_streaming_recorder(self):
+        """
+        test measurements are computed on write in streaming mode
+        """
+        p_1 = {(1, 0) : 0.25, (2, 1) : 0.75}
+        p_2 = {(3, 1) : 0.5, (4, 0) : 0.5}
+        
+        rec = cmepy.recorder.create((('a', 'b'), ), streaming = True)
+        product = rec[('a', 'b')]
+        rec.write(1.0, p_1)
+        rec.write(2.0, p_2)
+        assert rec.distributions == []
+        assert rec.times == [1.0, 2.0]
+        assert_almost_equal(rec['a'].expected_value, [[1.75], [3.5]])
+        assert_almost_equal(rec['b'].expected_value, [[0.75], [0.5]])
+        assert_almost_equal(product.times, [1.0, 2.0])
+        assert_almost_equal(rec[('a', 'b')].covariance, [0.1875, -0.25])
+        # joint measurements of other variables can no longer be computed
+        self.assertRaises(KeyError, lambda : rec[('b', 'a')])
+        
+        kept = cmepy.recorder.create((('a', 'b'), ),
+                                     streaming = True,
+                                     keep_distributions = True)
+        kept.write(1.0, p_1)
+        kept.write(2.0, p_2)
+        assert len(kept.distributions) == 2
+        assert_almost_equal(kept[('b', 'a')].expected_value,
+                            [[0.75, 1.75], [0.5, 3.5]])
+        
+        self.assertRaises(ValueError, cmepy.recorder.create,
+                          keep_distributions = False)
+        self.assertRaises(TypeError, cmepy.recorder.create, foo = True)
+    
+    def test_batched_measurement_updates(self):
+        """
+        test stale measurements are brought up to date together
+        """
+        p_1 = {(1, 0) : 0.25, (2, 1) : 0.75}
+        p_2 = {(3, 1) : 0.5, (4, 0) : 0.5}
+        
+        rec = cmepy.recorder.create((('a', 'b'), ))
+        rec.write(1.0, p_1)
+        # measurements of all targets are created on first access
+        assert len(rec['b']) == 1
+        measurements = dict(rec.measurements.items())
+        assert sorted(measurements) == ['a', 'b']
+        assert all(len(m) == 1 for m in measurements.itervalues())
+        assert not rec.measurements.is_dirty('a')
+        rec.write(2.0, p_2)
+        assert rec.measurements.is_dirty('a')
+        assert_almost_equal(rec['a'].expected_value, [[1.75], [3.5]])
+        # reading one measurement also brings the others up to date
+        assert not rec.measurements.is_dirty('b')
+        assert len(dict.__getitem__(rec.measurements, 'b')) == 2
+        rec.write(3.0, p_1)
+        for (var, m) in rec.measurements.iteritems():
+            assert_almost_equal(m.times, [1.0, 2.0, 3.0])
+    
+    def test_recorded_moments(self):
+        """
+        test higher moments and quantiles are recorded when requested
+        """
+        p_1 = {(1, 0) : 0.25, (2, 1) : 0.75}
+        p_2 = {(3, 1) : 0.5, (4, 0) : 0.25, (6, 2) : 0.25}
+        
+        rec = cmepy.recorder.create((('a', 'b'), ),
+                                    streaming = True,
+                                    order = 3,
+                                    quantiles = (0.5, ))
+        rec.write(1.0, p_1)
+        rec.write(2.0, p_2)
+        for (i, var) in enumerate(('a', 'b')):
+            skewness = [Distribution(p).marginal((i, )).moments(3).skewness
+                        for p in (p_1, p_2)]
+            assert_almost_equal(rec[var].skewness, skewness)
+        assert_almost_equal(rec['a'].quantiles[:, 0, 0], [2, 3])
+        assert_almost_equal(rec['b'].quantiles[:, 0, 0], [1, 1])
+        self.assertRaises(AttributeError, lambda : rec['a'].kurtosis)
+    
+    def test_recorded_covariance_matrices(self):
+        """
+        test covariance and correlation matrices are recorded over time
+        """
+        p_1 = {(1, 0, 2) : 0.25, (2, 1, 0) : 0.75}
+        p_2 = {(3, 1, 1) : 0.5, (4, 0, 2) : 0.25, (6, 2, 0) : 0.25}
+        
+        rec = cmepy.recorder.create((('a', 'b', 'c'), ), streaming = True)
+        joint = rec[('a', 'b', 'c')]
+        rec.write(1.0, p_1)
+        rec.write(2.0, p_2)
+        assert joint.covariance_matrix.shape == (2, 3, 3)
+        for (i, p) in enumerate((p_1, p_2)):
+            p = Distribution(p)
+            assert_almost_equal(joint.covariance_matrix[i],
+                                p.covariance_matrix())
+            assert_almost_equal(joint.correlation_matrix[i],
+                                p.correlation_matrix())
+        assert_almost_equal(joint.covariance_matrix[:, 0, 1],
+                            joint.covariance_matrix[:, 1, 0])
+        self.assertRaises(AttributeError,
+                          lambda : rec['a'].covariance_matrix)
+    
+    def test_projection_measurements(self):
+        """
+        test projections agree with the equivalent transforms
+        """
+        numpy.random.seed(0)
+        states = numpy.random.randint(0, 10, size = (3, 100))
+        p = dict((tuple(s), v) for (s, v) in
+                 zip(numpy.transpose(states),
+                     numpy.random.uniform(size = 100)))
+        projected = cmepy.recorder.create((('a', 'b', 'c'), ))
+        transformed = cmepy.recorder.create(
+            (('a', 'b', 'c'), (lambda *x : x[0],
+                               lambda *x : x[1],
+                               lambda *x : x[2]))
+        )
+        for rec in (projected, transformed):
+            rec.write(0.0, p)
+            rec.write(1.0, {})
+        assert projected['c'].transform.dims == (2, )
+        assert projected[('c', 'a')].transform.dims == (2, 0)
+        assert not hasattr(transformed['c'].transform, 'dims')
+        for var in ('a', 'c', ('c', 'a')):
+            d_projected = projected[var].distributions
+            d_transformed = transformed[var].distributions
+            assert d_projected[1] == d_transformed[1] == {}
+            assert set(d_projected[0]) == set(d_transformed[0])
+            for state in d_projected[0]:
+                assert_almost_equal(d_projected[0][state],
+                                    d_transformed[0][state])
         
 def suite():
     suite = unittest.TestLoader().loadTestsFromTestCase(RecorderTests)
@@ -5,6 +5,7 @@ from itertools import izip
 import numpy
 from numpy.testing import assert_almost_equal
 
+import cmepy.domain
 import cmepy.recorder
 import cmepy.solver
 from cmepy import model
@@ -157,6 +158,108 @@ class SolverTests(unittest.TestCase):
             exact_monomolecular_abc(t_max, exact_size)
         )
 
+    def test_conservation_laws(self):
+        # A + E <-> C, with A + C and E + C conserved
+        m = model.create(
+            propensities = (
+                lambda *x : 0.1*x[0]*x[1],
+                lambda *x : 1.0*x[2],
+            ),
+            transitions = ((-1, -1, 1), (1, 1, -1)),
+            shape = (11, 6, 6),
+            initial_state = (10, 5, 0)
+        )
+        laws = model.conservation_laws(m)
+        assert numpy.shape(laws) == (2, 3)
+        assert_almost_equal(numpy.dot(laws, numpy.transpose(m.transitions)),
+                            0.0)
+        
+        reduction = model.reduction(m)
+        assert reduction.model.transitions == [(-1, ), (1, )]
+        assert_almost_equal(numpy.dot(laws, m.initial_state), reduction.totals)
+        states = cmepy.domain.from_rect(m.shape)
+        states = states[:, reduction.conserved(states)]
+        assert numpy.size(states, 1) == 6
+        reduced_states = reduction.reduce_states(states)
+        assert numpy.all(reduction.expand_states(reduced_states) == states)
+        
+        time_steps = numpy.linspace(0.0, 1.0, 5)
+        full_solver = cmepy.solver.create(m, sink = True)
+        for t in time_steps:
+            full_solver.step(t)
+        p, p_sink = full_solver.y
+        reduced_solver = cmepy.solver.create(m, sink = True, reduced = True)
+        assert reduced_solver.domain_enum.size == 6
+        for t in time_steps:
+            reduced_solver.step(t)
+        p_reduced, p_sink_reduced = reduced_solver.y
+        assert_almost_equal(p_sink_reduced, p_sink, decimal = 5)
+        for state in states.transpose():
+            state = tuple(state)
+            assert_almost_equal(p_reduced.get(state, 0.0),
+                                p.get(state, 0.0),
+                                decimal = 5)
+        
+        m = model.create(
+            propensities = (lambda *x : 1.0, lambda *x : 1.0),
+            transitions = ((1, 0), (0, 1)),
+            shape = (3, 2),
+            initial_state = (0, 1)
+        )
+        assert numpy.shape(model.conservation_laws(m)) == (0, 2)
+
+    def test_block_of_initial_distributions(self):
+        m = model.create(
+            propensities = (lambda *x : 1.0*(12 - x[0]),
+                            lambda *x : 0.5*x[0]),
+            transitions = ((1, ), (-1, )),
+            shape = (10, ),
+            initial_state = (0, )
+        )
+        p_0_block = [{(0, ) : 1.0}, {(3, ) : 0.5, (5, ) : 0.5}, {(9, ) : 1.0}]
+        block_solver = cmepy.solver.create_block(m, True, p_0_block)
+        for t in (0.1, 0.5):
+            block_solver.step(t)
+        
+        assert len(block_solver.y) == len(p_0_block)
+        x = numpy.reshape(block_solver.x, (-1, len(p_0_block)))
+        for (k, p_0) in enumerate(p_0_block):
+            solver = cmepy.solver.create(m, sink = True, p_0 = p_0)
+            solver.step(0.5)
+            assert_almost_equal(x[:, k], solver.x, decimal = 5)
+            p, p_sink = block_solver.y[k]
+            assert_almost_equal(p_sink, solver.y[1], decimal = 5)
+        
+        # each state of a region as a column of a 2d array
+        states = cmepy.domain.from_rect((3, ))
+        block_solver = cmepy.solver.create_block(
+            m,
+            False,
+            (states, numpy.eye(3)),
+        )
+        block_solver.step(0.5)
+        x = numpy.reshape(block_solver.x, (-1, 3))
+        assert_almost_equal(numpy.add.reduce(x, axis=0), numpy.ones(3))
+        solver = cmepy.solver.create(m, sink = False, p_0 = {(2, ) : 1.0})
+        solver.step(0.5)
+        assert_almost_equal(x[:, 2], solver.x, decimal = 5)
+    
+    def test_empty_block_is_rejected(self):
+        m = model.create(
+            propensities = (lambda *x : 1.0, ),
+            transitions = ((1, ), ),
+            shape = (5, ),
+            initial_state = (0, )
+        )
+        empty_states = numpy.zeros((1, 0), dtype=numpy.int)
+        for p_0_block in ([], [{}, {}], (empty_states, numpy.zeros((0, 2)))):
+            try:
+                cmepy.solver.create_block(m, True, p_0_block)
+            except ValueError, error:
+                assert 'p_0_block' in str(error)
+            else:
+                self.fail('expected ValueError')
+
 def suite():
     test_suite = unittest.TestLoader().loadTestsFromTestCase(SolverTests)
     return test_suite
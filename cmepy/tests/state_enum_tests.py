@@ -134,6 +134,16 @@ class StateEnumTests(unittest.TestCase):
             assert state in p_sparse
             assert p_sparse[state] == q_sparse[state]
     
+    def test_repeated_extend(self):
+        enum = state_enum.create([[2, 0], [0, 3]])
+        enum.extend([[1, 5], [1, 0]])
+        enum.extend([[0, 4], [0, 0]])
+        states = [[2, 0, 5, 1, 0, 4],
+                  [0, 3, 0, 1, 0, 0]]
+        # existing indices are unchanged, new states are appended
+        assert_array_equal(enum.indices(states), [0, 1, 2, 3, 4, 5])
+        assert_array_equal(enum.states([0, 1, 2, 3, 4, 5]), states)
+    
 
 def suite():
     suite = unittest.TestLoader().loadTestsFromTestCase(StateEnumTests)
@@ -1,9 +1,9 @@
 import unittest
 import numpy
-from numpy.testing.utils import assert_almost_equal
+from numpy.testing.utils import assert_almost_equal, assert_array_equal
 
 
-from cmepy import statistics
+from cmepy import domain, lexarrayset, state_enum, statistics
 
 class StatisticsTests(unittest.TestCase):
     def test_one_dee_distributions(self):
@@ -218,6 +218,213 @@ class StatisticsTests(unittest.TestCase):
         assert_almost_equal(a.kl_divergence(a), 0.0)
         
         
+    def test_aligned_metrics(self):
+        a = statistics.Distribution({(0, 0) : 0.4, (0, 1) : 0.6})
+        b = statistics.Distribution({(0, 1) : 0.5, (2, 0) : 0.5})
+        states, a_values, b_values = statistics.align(a, b)
+        assert_array_equal(states, [[0, 2, 0], [0, 0, 1]])
+        assert_almost_equal(a_values, [0.4, 0.0, 0.6])
+        assert_almost_equal(b_values, [0.0, 0.5, 0.5])
+        
+        # compare against the definitions over the union of the supports
+        for p in (1, 2, 3.5):
+            assert_almost_equal(a.lp_distance(b, p),
+                                statistics.lp_norm(a - b, p))
+        assert_almost_equal(a.total_variation_distance(b), 0.5)
+        assert_almost_equal(b.hellinger_distance(a),
+                            numpy.sqrt(0.5*(0.4 + (numpy.sqrt(0.6) -
+                                                   numpy.sqrt(0.5))**2 +
+                                            0.5)))
+        assert numpy.isinf(a.kl_divergence(b))
+        c = statistics.Distribution({(0, 0) : 0.5, (0, 1) : 0.5})
+        assert_almost_equal(statistics.kl_divergence(a, c),
+                            0.4*numpy.log(0.8) + 0.6*numpy.log(1.2))
+        assert_almost_equal(statistics.kl_divergence(c, {}), numpy.inf)
+        assert_almost_equal(statistics.kl_divergence({}, c), 0.0)
+        
+        # arrays over the same states, or a state enumeration, are aligned
+        # without merging
+        enum = state_enum.create(domain.from_rect((3, 2)))
+        a_dense = enum.pack_distribution(a)
+        b_dense = enum.pack_distribution(b)
+        shared = (enum.unordered_states, a_dense)
+        states, a_values, b_values = statistics.align(
+            shared,
+            (enum.unordered_states, b_dense)
+        )
+        assert states is enum.unordered_states
+        assert_array_equal(b_values, b_dense)
+        states, a_values, b_values = statistics.align(a, b, enum)
+        assert states is enum.unordered_states
+        assert_array_equal(a_values, a_dense)
+        assert_array_equal(b_values, b_dense)
+        assert_almost_equal(statistics.lp_distance(a, b, 2, enum),
+                            a.lp_distance(b, 2))
+        outside = dict(b)
+        outside[(3, 0)] = 0.5
+        self.assertRaises(ValueError, statistics.align, a, outside, enum)
+        self.assertRaises(ValueError, statistics.lp_distance, outside, a, 1,
+                          enum)
+        assert_almost_equal(statistics.hellinger_distance(shared, b),
+                            a.hellinger_distance(b))
+    
+    def test_compress_matches_full_sort(self):
+        numpy.random.seed(2)
+        states = numpy.random.randint(0, 50, size = (2, 500))
+        states = lexarrayset.unique(states)
+        n = numpy.size(states, 1)
+        values = numpy.random.exponential(size = n)**3
+        values /= numpy.sum(values)
+        block_size = statistics.COMPRESS_BLOCK_SIZE
+        statistics.COMPRESS_BLOCK_SIZE = 4
+        try:
+            for epsilon in (0.0, 1.0e-4, 0.01, 0.2, 1.0):
+                order = numpy.argsort(values)
+                cumulative = numpy.add.accumulate(values[order])
+                expected = set(domain.to_iter(
+                    states[:, order[cumulative >= epsilon]]
+                ))
+                c_states, c_values = statistics.compress((states, values),
+                                                         epsilon)
+                assert set(domain.to_iter(c_states)) == expected
+                assert numpy.sum(values) - numpy.sum(c_values) < epsilon or \
+                       epsilon == 0.0
+                p = dict(zip(domain.to_iter(states), values))
+                assert set(statistics.compress(p, epsilon)) == expected
+        finally:
+            statistics.COMPRESS_BLOCK_SIZE = block_size
+        self.assertRaises(ValueError, statistics.compress,
+                          (states, values), 1.5)
+    
+    def test_moments(self):
+        numpy.random.seed(3)
+        states = lexarrayset.unique(numpy.random.randint(0, 20, (2, 100)))
+        values = numpy.random.uniform(size = numpy.size(states, 1))
+        values /= numpy.sum(values)
+        p = statistics.Distribution(zip(domain.to_iter(states), values))
+        m = p.moments(4)
+        assert m.dimension == 2
+        assert_almost_equal(m.total, 1.0)
+        assert_almost_equal(m.mean, p.expectation())
+        for k in xrange(5):
+            assert_almost_equal(m.raw_moment(k),
+                                numpy.dot(states.astype(float)**k, values))
+            diffs = states - m.mean[:, numpy.newaxis]
+            assert_almost_equal(m.central_moment(k),
+                                numpy.dot(diffs**k, values))
+        assert_almost_equal(m.covariance[0, 1], p.covariance())
+        assert_almost_equal(m.covariance, m.covariance.T)
+        for i in xrange(2):
+            marginal = p.marginal((i, ))
+            assert_almost_equal(m.variance[i], marginal.variance())
+            assert_almost_equal(m.covariance[i, i], marginal.variance())
+        assert_almost_equal(m.skewness, m.central[3] / m.variance**1.5)
+        assert_almost_equal(m.kurtosis, m.central[4] / m.variance**2 - 3.0)
+        self.assertRaises(ValueError, m.central_moment, 5)
+        self.assertRaises(ValueError, lambda : p.moments(2).skewness)
+        
+        # quantiles are the least values whose marginal cdf reaches q
+        q = numpy.array([0.0, 0.1, 0.5, 0.9, 1.0])
+        quantiles = m.quantiles(q)
+        assert quantiles.shape == (2, 5)
+        for i in xrange(2):
+            for (q_j, x) in zip(q, quantiles[i]):
+                cdf = numpy.sum(values[states[i] <= x])
+                assert cdf >= q_j - 1.0e-12
+                assert numpy.sum(values[states[i] < x]) < q_j or q_j == 0.0
+        assert_array_equal(m.quantiles(0.5), quantiles[:, 2])
+        
+        point = statistics.moments((numpy.array([[3]]), [1.0]), 4)
+        assert_almost_equal(point.variance, [0.0])
+        assert numpy.isnan(point.kurtosis[0])
+        assert_array_equal(point.quantiles([0.2, 0.8]), [[3, 3]])
+    
+    def test_covariance_and_correlation_matrices(self):
+        numpy.random.seed(4)
+        states = lexarrayset.unique(numpy.random.randint(0, 10, (3, 80)))
+        values = numpy.random.uniform(size = numpy.size(states, 1))
+        values /= numpy.sum(values)
+        p = statistics.Distribution(zip(domain.to_iter(states), values))
+        cov = p.covariance_matrix()
+        assert cov.shape == (3, 3)
+        for i in xrange(3):
+            for j in xrange(3):
+                assert_almost_equal(cov[i, j],
+                                    p.marginal((i, j)).covariance()
+                                    if i != j else
+                                    p.marginal((i, )).variance())
+        assert_almost_equal(statistics.covariance_matrix((states, values)),
+                            cov)
+        corr = p.correlation_matrix()
+        assert_almost_equal(numpy.diag(corr), 1.0)
+        assert_almost_equal(corr[0, 2],
+                            cov[0, 2] / numpy.sqrt(cov[0, 0]*cov[2, 2]))
+        assert numpy.all(numpy.abs(corr) <= 1.0 + 1.0e-12)
+        
+        # coordinates with zero variance have undefined correlations
+        constant = statistics.correlation_matrix({(1, 0) : 0.5, (1, 2) : 0.5})
+        assert numpy.all(numpy.isnan(constant[0]))
+        assert_almost_equal(constant[1, 1], 1.0)
+    
+    def test_map_arrays_matches_simple_map(self):
+        numpy.random.seed(1)
+        states = numpy.random.randint(0, 6, size = (3, 200))
+        p = {}
+        for state in domain.to_iter(states):
+            p[state] = numpy.random.uniform()
+        transforms = (
+            lambda x : (x[0], ),
+            lambda x : (x[2], x[0]),
+            lambda x : (x[0]*1000, x[1]*1000000),
+            lambda x : (x[1]*0.5, ),
+        )
+        for f in transforms:
+            for g in (None, numpy.maximum):
+                goal = statistics.map_distribution_simple(f, p, g)
+                result = statistics.map_distribution(f, p, g)
+                assert set(result) == set(goal)
+                for state in goal:
+                    assert_almost_equal(result[state], goal[state])
+        
+        # unique image states are returned in lexical order
+        s, v = domain.from_mapping(p)
+        image_states, _ = statistics.map_arrays(lambda x : x[:2], s, v)
+        assert_array_equal(image_states, lexarrayset.unique(s[:2]))
+    
+    def test_projection_and_linear_transforms(self):
+        p_3 = {(0, 1, 2) : 0.1,
+               (1, 1, 0) : 0.2,
+               (2, 0, 0) : 0.3,
+               (0, 1, 3) : 0.4,}
+        f = statistics.projection((2, 0))
+        assert f((5, 6, 7)) == (7, 5)
+        p = statistics.map_distribution(f, p_3)
+        goal = statistics.map_distribution_simple(f, p_3)
+        assert set(p) == set(goal)
+        for state in goal:
+            assert_almost_equal(p[state], goal[state])
+        marginal = statistics.Distribution(p_3).marginal((1, ))
+        assert_almost_equal(marginal[(0, )], 0.3)
+        assert_almost_equal(marginal[(1, )], 0.7)
+        
+        total = statistics.linear([[1, 1, 1]], offset = [-1])
+        assert total((1, 2, 3)) == (5, )
+        p = statistics.map_distribution(total, p_3)
+        assert set(p) == set([(1, ), (2, ), (3, )])
+        assert_almost_equal(p[(1, )], 0.5)
+        assert_almost_equal(p[(2, )], 0.1)
+        assert_almost_equal(p[(3, )], 0.4)
+        
+        p_dense, origin = statistics.dense_marginal(f, p_3)
+        assert origin == (0, 0)
+        assert p_dense.shape == (4, 3)
+        assert_almost_equal(p_dense[2, 0], 0.1)
+        assert_almost_equal(p_dense[0, 2], 0.3)
+        assert_almost_equal(numpy.sum(p_dense), 1.0)
+        d = statistics.Distribution().from_dense(p_dense, origin)
+        for state in goal:
+            assert_almost_equal(d[state], goal[state])
+    
 def suite():
     suite = unittest.TestLoader().loadTestsFromTestCase(StatisticsTests)
     return suite
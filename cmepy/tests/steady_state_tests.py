@@ -0,0 +1,86 @@
+"""
+unit tests for the stationary distribution solver
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+from scipy.stats import poisson
+
+import cmepy.domain
+import cmepy.steady_state
+from cmepy import model
+
+def create_birth_death_model(birth, death, size):
+    return model.create(
+        propensities = (lambda *x : birth + 0.0*x[0],
+                        lambda *x : death*x[0]),
+        transitions = ((1, ), (-1, )),
+        shape = (size, ),
+        initial_state = (0, )
+    )
+
+class SteadyStateTests(unittest.TestCase):
+    def test_birth_death_is_poisson(self):
+        birth, death = 5.0, 1.0
+        m = create_birth_death_model(birth, death, 40)
+        goal = poisson(birth/death).pmf(numpy.arange(40))
+        for method in cmepy.steady_state.METHODS:
+            p, residual, outflow_rate = cmepy.steady_state.solve(
+                m,
+                method = method,
+                tolerance = 1.0e-12
+            )
+            assert_almost_equal(p.to_dense((40, )), goal/numpy.sum(goal),
+                                decimal = 6)
+            assert residual < 1.0e-6
+            assert outflow_rate < 1.0e-8
+    
+    def test_iterative_methods_are_limited_by_default(self):
+        m = create_birth_death_model(5.0, 1.0, 10)
+        # a negative tolerance is never reached, so only the default
+        # iteration limit stops the iteration
+        for method in ('power', 'aggregation'):
+            self.assertRaises(RuntimeError,
+                              cmepy.steady_state.solve,
+                              m,
+                              method = method,
+                              tolerance = -1.0)
+    
+    def test_outflow_rate_reports_truncation(self):
+        m = create_birth_death_model(5.0, 1.0, 6)
+        p, residual, outflow_rate = cmepy.steady_state.solve(m)
+        # the truncated domain misses a large part of the distribution
+        assert outflow_rate > 0.1
+        assert_almost_equal(sum(p.itervalues()), 1.0)
+    
+    def test_two_dimensional_domain(self):
+        m = model.create(
+            propensities = (lambda *x : 2.0 + 0.0*x[0],
+                            lambda *x : 1.0*x[0],
+                            lambda *x : 0.5*x[0],
+                            lambda *x : 1.0*x[1]),
+            transitions = ((1, 0), (-1, 0), (0, 1), (0, -1)),
+            shape = (15, 15),
+            initial_state = (0, 0)
+        )
+        states = cmepy.domain.from_rect(m.shape)
+        p_direct, _, _ = cmepy.steady_state.solve(m, domain_states = states)
+        p_gmres, residual, _ = cmepy.steady_state.solve(m, method = 'gmres')
+        assert_almost_equal(p_gmres.to_dense(m.shape),
+                            p_direct.to_dense(m.shape))
+        mu = p_direct.expectation()
+        assert_almost_equal(mu, (2.0, 1.0), decimal = 4)
+        self.assertRaises(ValueError, cmepy.steady_state.solve, m,
+                          method = 'banana')
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(SteadyStateTests)
+    return suite
+
+def main():
+    unittest.run(SteadyStateTests)
+
+if __name__ == '__main__':
+    main()
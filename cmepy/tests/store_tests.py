@@ -0,0 +1,138 @@
+"""
+unit tests for the chunked on-disk solution store
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_array_equal, assert_almost_equal
+
+import cmepy.recorder
+import cmepy.solver
+import cmepy.store
+from cmepy import model
+
+def create_poisson_model():
+    return model.create(
+        propensities = (lambda *x : 2.0, lambda *x : 3.0),
+        transitions = ((1, 0), (0, 1)),
+        shape = (10, 10),
+        initial_state = (0, 0)
+    )
+
+class StoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_read(self):
+        states = numpy.array([[0, 1, 2], [0, 0, 1]])
+        other_states = numpy.array([[0, 1], [1, 1]])
+        solutions = [
+            (0.0, states, numpy.array([1.0, 0.0, 0.0])),
+            (0.5, states, numpy.array([0.5, 0.3, 0.2])),
+            (1.0, states, numpy.array([0.2, 0.3, 0.5])),
+            (1.5, other_states, numpy.array([0.4, 0.6])),
+            (2.0, other_states, numpy.array([0.1, 0.9])),
+        ]
+        directory = os.path.join(self.directory, 'store')
+        store = cmepy.store.create(directory, chunk_size = 2)
+        for (t, s, v) in solutions:
+            store.write(t, (s, v), p_sink = t)
+        assert len(store) == 5
+        store.close()
+        # each domain is written once, chunks are split at domain changes
+        assert len(os.listdir(directory)) == 2 + 3
+        self.assertRaises(ValueError, cmepy.store.create, directory)
+
+        for mmap_mode in (None, 'r'):
+            loaded = cmepy.store.load(directory, mmap_mode)
+            assert len(loaded) == 5
+            assert_array_equal(loaded.times, [0.0, 0.5, 1.0, 1.5, 2.0])
+            arrays = list(loaded.iter_arrays(1))
+            assert len(arrays) == 4
+            for ((t, s, v), (t_0, s_0, v_0)) in zip(arrays, solutions[1:]):
+                assert t == t_0
+                assert_array_equal(s, s_0)
+                assert_almost_equal(v, v_0)
+            mapped = isinstance(loaded.domain_states(1), numpy.memmap)
+            assert mapped == (mmap_mode is not None)
+            p_sinks = numpy.concatenate([p_sink for (_, _, _, _, p_sink)
+                                         in loaded.iter_chunks()])
+            assert_almost_equal(p_sinks, loaded.times)
+            self.assertRaises(ValueError, loaded.write, 3.0, (states, v))
+
+        t, p = loaded.distribution(3)
+        assert t == 1.5
+        assert p == {(0, 1) : 0.4, (1, 1) : 0.6}
+        self.assertRaises(IndexError, loaded.distribution, 5)
+
+    def test_uncompressed_chunks_memmap(self):
+        store = cmepy.store.create(self.directory, compressed = False)
+        states = numpy.array([[0, 1, 2]])
+        store.write(0.0, (states, numpy.array([0.2, 0.3, 0.5])))
+        store.write(1.0, (states, numpy.array([0.1, 0.1, 0.8])))
+        # buffered solutions are visible before they are flushed
+        assert_array_equal(store.times, [0.0, 1.0])
+        store.close()
+        loaded = cmepy.store.load(self.directory, 'r')
+        chunks = list(loaded.iter_chunks())
+        assert len(chunks) == 1
+        assert isinstance(chunks[0][3], numpy.memmap)
+        assert_almost_equal(chunks[0][3], [[0.2, 0.3, 0.5], [0.1, 0.1, 0.8]])
+
+    def test_recorder_store(self):
+        """
+        test measurements are streamed back from the store
+        """
+        m = create_poisson_model()
+        solver = cmepy.solver.create(m, sink = False)
+        time_steps = numpy.linspace(0.0, 1.0, 6)
+
+        store = cmepy.store.create(self.directory, chunk_size = 4)
+        stored = cmepy.recorder.create((('A', 'B'), ), store = store)
+        kept = cmepy.recorder.create((('A', 'B'), ))
+        for t in time_steps:
+            solver.step(t)
+            stored.write(t, solver.y)
+            kept.write(t, solver.y)
+
+        assert stored.distributions == []
+        assert not stored.keep_distributions
+        # the initial distribution is only supported on the initial state,
+        # after which the domain does not change, so is only written again
+        # once, while the last solution is still buffered
+        assert len(os.listdir(self.directory)) == 2 + 2
+        for var in ('A', 'B', ('B', 'A')):
+            assert_almost_equal(stored[var].times, time_steps)
+            assert_almost_equal(stored[var].expected_value,
+                                kept[var].expected_value)
+        for var in ('A', 'B'):
+            assert_almost_equal(stored[var].variance, kept[var].variance)
+
+        # measurements are also computed on write when streaming
+        streamed = cmepy.recorder.create(
+            (('A', 'B'), ),
+            streaming = True,
+            store = cmepy.store.create(os.path.join(self.directory, 's'))
+        )
+        for (t, p) in zip(kept.times, kept.distributions):
+            streamed.write(t, p)
+        assert len(dict.__getitem__(streamed.measurements, 'A')) == 6
+        assert_almost_equal(streamed[('A', 'B')].covariance,
+                            kept[('A', 'B')].covariance)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(StoreTests)
+    return suite
+
+def main():
+    unittest.run(StoreTests)
+
+if __name__ == '__main__':
+    main()
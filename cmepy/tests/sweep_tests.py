@@ -0,0 +1,93 @@
+"""
+unit tests for parameter sweeps sharing one CME matrix structure
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+import cmepy.solver
+import cmepy.sweep
+from cmepy import model
+
+def create_birth_death_model(birth=1.0, death=1.0):
+    return model.create(
+        propensities = (lambda *x : birth*(10 - x[0]),
+                        lambda *x : death*x[0]*x[1],
+                        lambda *x : 0.5*x[1]),
+        transitions = ((1, 0), (-1, 1), (0, -1)),
+        shape = (11, 8),
+        initial_state = (0, 0)
+    )
+
+class SweepTests(unittest.TestCase):
+    def test_matrix_matches_rebuilt_model(self):
+        sweep = cmepy.sweep.create(create_birth_death_model(), sink = True)
+        coefficients = (2.0, 0.3, 1.0)
+        matrix = sweep.matrix(coefficients)
+        
+        m = create_birth_death_model(birth = 2.0, death = 0.3)
+        solver = cmepy.solver.create(m, sink = True)
+        goal = solver.dy_dt(0.0, numpy.eye(matrix.shape[0]))
+        assert_almost_equal(matrix.toarray(), goal)
+        
+        self.assertRaises(ValueError, sweep.matrix, (1.0, 2.0))
+    
+    def test_solver_and_block_solver(self):
+        sweep = cmepy.sweep.create(create_birth_death_model(), sink = True)
+        coefficient_sets = [(1.0, 1.0, 1.0), (2.0, 0.3, 1.0), (0.5, 0.1, 2.0)]
+        t_final = 0.5
+        
+        solutions = []
+        for coefficients in coefficient_sets:
+            solver = sweep.solver(coefficients)
+            solver.step(t_final)
+            solutions.append(solver.x)
+        
+        birth, death, _ = coefficient_sets[1]
+        m = create_birth_death_model(birth = birth, death = death)
+        solver = cmepy.solver.create(m, sink = True)
+        solver.step(t_final)
+        assert_almost_equal(solutions[1], solver.x, decimal = 5)
+        
+        block_solver = sweep.block_solver(coefficient_sets)
+        block_solver.step(t_final)
+        x = numpy.reshape(block_solver.x, (-1, len(coefficient_sets)))
+        for (k, solution) in enumerate(solutions):
+            assert_almost_equal(x[:, k], solution, decimal = 5)
+        p, p_sink = block_solver.y[2]
+        assert_almost_equal(sum(p.itervalues()) + p_sink, 1.0)
+    
+    def test_block_product_empty_rows(self):
+        indptr = numpy.array([0, 2, 2, 3])
+        indices = numpy.array([0, 2, 1])
+        data = numpy.array([[1.0, 2.0, 3.0], [-1.0, 0.5, 1.0]])
+        y = numpy.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        z = cmepy.sweep.block_product(indptr, indices, data, y)
+        assert_almost_equal(z, [[11.0, 1.0], [0.0, 0.0], [9.0, 4.0]])
+
+    def test_block_product_matches_column_products(self):
+        sweep = cmepy.sweep.create(create_birth_death_model(), sink = True)
+        coefficient_sets = numpy.random.uniform(0.5, 2.0, (5, sweep.size))
+        data = numpy.dot(coefficient_sets, sweep.data)
+        y = numpy.random.uniform(0.0, 1.0, (sweep.shape[1], 5))
+        expected = numpy.transpose([sweep.matrix(c)*y[:, k]
+                                    for (k, c) in enumerate(coefficient_sets)])
+        for columns in (1, 2, 5, 32):
+            z = cmepy.sweep.block_product(sweep.indptr,
+                                          sweep.indices,
+                                          data,
+                                          y,
+                                          columns)
+            assert_almost_equal(z, expected)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(SweepTests)
+    return suite
+
+def main():
+    unittest.run(SweepTests)
+
+if __name__ == '__main__':
+    main()
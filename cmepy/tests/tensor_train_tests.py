@@ -0,0 +1,128 @@
+"""
+unit tests for the tensor train representation and solver
+"""
+
+import unittest
+
+import numpy
+from numpy.testing.utils import assert_almost_equal
+
+import cmepy.solver
+import cmepy.steady_state
+import cmepy.tensor_train as tt
+from cmepy import model
+
+def create_mass_action_model():
+    return model.mass_action(
+        ('A -> B', 'B -> A', '-> A', 'A + B -> C', 'C ->'),
+        (1.0, 0.5, 2.0, 0.1, 0.3),
+        ('A', 'B', 'C'),
+        initial_state = (0, 0, 0),
+        shape = (12, 12, 8)
+    )
+
+class TensorTrainTests(unittest.TestCase):
+    def test_round_trip_and_arithmetic(self):
+        a = numpy.random.uniform(size = (4, 5, 6))
+        b = numpy.random.uniform(size = (4, 5, 6))
+        x = tt.from_dense(a)
+        y = tt.from_dense(b)
+        assert_almost_equal(x.to_dense(), a)
+        assert x.ranks == (1, 4, 6, 1)
+        
+        z = (x + y*2.0).round()
+        assert_almost_equal(z.to_dense(), a + 2.0*b)
+        assert_almost_equal(z.sum(), numpy.sum(a + 2.0*b))
+        assert_almost_equal(x.dot(y), numpy.sum(a*b))
+        assert_almost_equal(x.marginal((0, 2)), numpy.sum(a, axis = 1))
+        
+        # rounding the sum of a rank one train with itself stays rank one
+        one = tt.rank_one((numpy.arange(4), numpy.ones(5), numpy.ones(6)))
+        assert (one + one).rank == 2
+        assert (one + one).round().rank == 1
+        assert one.max_bound() == 3.0
+    
+    def test_operator_matches_cme_matrix(self):
+        m = create_mass_action_model()
+        domain_enum, generator, _ = cmepy.steady_state.create_generator(m)
+        operator = None
+        for (propensity, transition) in zip(m.propensities, m.transitions):
+            term, bound = tt.reaction_operator(propensity, transition, m.shape)
+            operator = term if operator is None else operator + term
+        dense = operator.to_dense()
+        
+        # map the enumeration of the domain to C-ordered flat indices
+        flat = numpy.ravel_multi_index(tuple(domain_enum.unordered_states),
+                                       m.shape)
+        expected = numpy.zeros(dense.shape)
+        expected[numpy.ix_(flat, flat)] = generator.toarray()
+        assert_almost_equal(dense, expected)
+    
+    def test_solver_matches_dense_solver(self):
+        m = create_mass_action_model()
+        reference = cmepy.solver.create(m, sink = False)
+        solver = cmepy.solver.create(m, sink = False, tensor_train = True)
+        for t in (0.5, 2.0):
+            reference.step(t)
+            solver.step(t)
+            assert solver.t == t
+            assert_almost_equal(solver.y.to_dense(),
+                                reference.y.to_dense(m.shape))
+        assert_almost_equal(solver.y.expectation(), reference.y.expectation())
+        marginal = solver.y.marginal_distribution((1, ))
+        assert_almost_equal(marginal.expectation(),
+                            reference.y.expectation()[1])
+        self.assertRaises(ValueError, solver.step, 1.0)
+        self.assertRaises(ValueError, cmepy.solver.create, m, sink = True,
+                          tensor_train = True)
+    
+    def test_time_dependencies_and_dense_propensities(self):
+        m = model.create(
+            propensities = (lambda *x : 2.0 + 0.0*x[0],
+                            lambda *x : 1.0*x[0],
+                            lambda *x : 0.5*x[0],
+                            lambda *x : 1.0*x[1]),
+            transitions = ((1, 0), (-1, 0), (0, 1), (0, -1)),
+            shape = (15, 15),
+            initial_state = (0, 0)
+        )
+        phi = {frozenset([0]) : lambda t : 1.0 + t}
+        reference = cmepy.solver.create(m, sink = False,
+                                        time_dependencies = phi)
+        solver = cmepy.solver.create(m, sink = False,
+                                     time_dependencies = phi,
+                                     tensor_train = True,
+                                     max_step = 0.01)
+        reference.step(1.0)
+        solver.step(1.0)
+        assert_almost_equal(solver.y.expectation(),
+                            reference.y.expectation(),
+                            decimal = 3)
+    
+    def test_high_dimensional_storage(self):
+        species = ('A', 'B', 'C', 'D', 'E', 'F')
+        reactions = ['-> A'] + ['%s -> %s' % pair
+                                for pair in zip(species[:-1], species[1:])]
+        m = model.mass_action(reactions,
+                              [2.0] + [1.0]*5,
+                              species,
+                              initial_state = (0, )*6,
+                              shape = (20, )*6)
+        solver = cmepy.solver.create(m, sink = False, tensor_train = True,
+                                     max_rank = 8, tolerance = 1.0e-8)
+        solver.step(0.5)
+        assert solver.y.storage < 20*6*8*8
+        assert_almost_equal(solver.y.sum(), 1.0, decimal = 6)
+        # the first species is Poisson with mean 2 (1 - exp(-t))
+        mu = solver.y.expectation()
+        assert_almost_equal(mu[0], 2.0*(1.0 - numpy.exp(-0.5)), decimal = 5)
+
+def suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase(TensorTrainTests)
+    return suite
+
+def main():
+    unittest.run(TensorTrainTests)
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,16 @@ SUB_PACKAGES = {
         'statistics_tests',
         'measurement_tests',
         'model_tests',
+        'fsp_tests',
+        'checkpoint_tests',
+        'propensity_tests',
+        'sweep_tests',
+        'batch_tests',
+        'steady_state_tests',
+        'multilevel_tests',
+        'tensor_train_tests',
+        'store_tests',
+        'lazy_dict_tests',
     ],
 }
 